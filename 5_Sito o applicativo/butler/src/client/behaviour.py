@@ -1,7 +1,9 @@
 import psutil
-import socket
 
 from common import log
+from client.connectionIndex import ConnectionIndex
+from client.connection import Connection
+from client.protocolResolver import ProtocolResolver
 
 class Behaviour:
 	"""
@@ -16,6 +18,7 @@ class Behaviour:
 	UNKNOWN_PROTO = 'unknown'
 
 	EXCLUDED_STATUS = [psutil.CONN_TIME_WAIT, psutil.CONN_NONE]
+	EMPTY_ADDR = ('', '')
 
 	customProto = {
 			8080:'CPT Proxy', 27017: 'Butler MongoDB',
@@ -35,8 +38,13 @@ class Behaviour:
 			Default: {}.
 		"""
 		self.phase = phase
-		self.model = []
+		# il modello è una tupla di connessioni immutabili: ogni aggiornamento
+		# crea una nuova tupla, quindi chi la legge non deve copiarla
+		self.model = ()
+		# nomi dei processi già letti, identificati dal pid
+		self.procNames = {}
 		self.customProto.update(customProtocols)
+		self.protocols = ProtocolResolver(self.customProto)
 
 	def get_protocol(self, port, type=''):
 		"""
@@ -48,57 +56,117 @@ class Behaviour:
 
 		:return: il nome del protocollo se trovato, altrimenti un valore di default.
 		"""
-		try:
-			return socket.getservbyport(port, type)
-		except Exception as e:
-			return self.customProto[port] if port in self.customProto else self.UNKNOWN_PROTO
+		return self.protocols.resolve(port, type)
 	
 	def check_connections(self):
 		"""
 		Legge le connessioni attive e ne salva solo alcuni attributi.
 		"""
-		data = []
-		for id in psutil.pids():
-			# un'eccezione è sollevata in caso di permessi non sufficienti
-			# o di processo non trovato 
-			try:
-				p = psutil.Process(id)
-				# il processo è ignorato se non ha connessioni o se non è attivo
-				if p.connections() == [] or not p.is_running():
-					continue
-				for conn in range(0, len(p.connections())):
-					if p.connections()[conn][5] not in self.EXCLUDED_STATUS:
-						# la sicurezza (safe) è impostata ora, ma sarà il server
-						# a decidere se mantenere effettivamente questo stato
-						c = {'proc': p.name(), 'status': p.connections()[conn][5],
-						'source': ['',''], 'dest': ['',''], 'proto': 'unknown', 'safe': self.phase}
-						port = p.connections()[conn].laddr.port
-						c['source'] = [p.connections()[conn].laddr.ip, port]
-						c['proto'] =  self.get_protocol(port)
-
-						# non tutte le connessioni hanno un indirizzo di destinazione
-						try:
-							if hasattr(p.connections()[conn].raddr, 'ip'):
-								# port è una variabile perchè viene usato anche in seguito
-								port = p.connections()[conn].raddr.port
-								c['dest'] = [p.connections()[conn].raddr.ip, port]
-						except:
-							pass
-						if c['proto'] == self.UNKNOWN_PROTO:
-							c['proto'] = self.get_protocol(port)
-						data.append(c)
-			except Exception:
-				pass
+		try:
+			data = self.scan_connections()
+		except psutil.AccessDenied:
+			# su alcuni sistemi (es. macOS) la lettura di tutte le connessioni
+			# richiede privilegi elevati: si ripiega sull'analisi dei singoli processi
+			data = self.scan_processes()
 
 		# logga solo se le informazioni sono utili
 		if len(data) != len(self.model):
 			log.info('Ci sono {} connessioni attive'.format(len(data)))
 
 		# gli array sono scambiati per rispettare l'ordine delle priorità
-		originalModel = self.model.copy()
+		originalModel = self.model
 		self.model = data
 		self.update_model(originalModel)
 		
+	def scan_connections(self):
+		"""
+		Legge tutte le connessioni del sistema con una sola chiamata
+		e le associa al nome del processo che le ha aperte.
+
+		:return: la lista delle connessioni trovate.
+		"""
+		data = []
+		activePids = set()
+		for conn in psutil.net_connections():
+			# le connessioni senza pid appartengono a processi non accessibili
+			if conn.pid is None or conn.status in self.EXCLUDED_STATUS:
+				continue
+			activePids.add(conn.pid)
+			name = self.get_proc_name(conn.pid)
+			if name is not None:
+				data.append(self.parse_conn(conn, name))
+
+		# i processi terminati vengono rimossi per non riutilizzarne il nome
+		# nel caso in cui il loro pid venisse riassegnato
+		for pid in list(self.procNames):
+			if pid not in activePids:
+				del self.procNames[pid]
+		return data
+
+	def scan_processes(self):
+		"""
+		Legge le connessioni attive di ogni processo singolarmente.
+		È più lenta di scan_connections, ma non richiede privilegi elevati.
+
+		:return: la lista delle connessioni trovate.
+		"""
+		data = []
+		for p in psutil.process_iter(['name']):
+			# il nome manca se i permessi non sono sufficienti
+			if p.info['name'] is None:
+				continue
+			# un'eccezione è sollevata in caso di permessi non sufficienti
+			# o di processo non trovato
+			try:
+				for conn in p.connections():
+					if conn.status not in self.EXCLUDED_STATUS:
+						data.append(self.parse_conn(conn, p.info['name']))
+			except psutil.Error:
+				pass
+		return data
+
+	def get_proc_name(self, pid):
+		"""
+		Ricava il nome di un processo, leggendolo dal sistema solo
+		se il pid non è già conosciuto.
+
+		:param pid (int): l'identificativo del processo.
+
+		:return: il nome del processo, oppure None se non è accessibile.
+		"""
+		if pid not in self.procNames:
+			# anche i processi non accessibili vengono memorizzati,
+			# così da non ritentare la lettura ad ogni controllo
+			try:
+				self.procNames[pid] = psutil.Process(pid).name()
+			except psutil.Error:
+				self.procNames[pid] = None
+		return self.procNames[pid]
+
+	def parse_conn(self, conn, name):
+		"""
+		Converte una connessione di psutil nel formato usato dal modello.
+
+		:param conn (namedtuple): la connessione letta da psutil.
+		:param name (str): il nome del processo che ha aperto la connessione.
+
+		:return: la connessione.
+		"""
+		# la sicurezza (safe) è impostata ora, ma sarà il server
+		# a decidere se mantenere effettivamente questo stato
+		port = conn.laddr.port
+		proto = self.get_protocol(port)
+		dest = self.EMPTY_ADDR
+
+		# non tutte le connessioni hanno un indirizzo di destinazione
+		if hasattr(conn.raddr, 'ip'):
+			# port è una variabile perchè viene usato anche in seguito
+			port = conn.raddr.port
+			dest = (conn.raddr.ip, port)
+		if proto == self.UNKNOWN_PROTO:
+			proto = self.get_protocol(port)
+		return Connection(name, conn.status, conn.laddr, dest, proto, self.phase)
+
 	def update_model(self, newData):
 		"""
 		Unisce il modello attuale con le nuove connessioni, senza scartarne
@@ -108,32 +176,22 @@ class Behaviour:
 			Questo parametro ha priorità sull'attributo model, quindi
 			all'occorrenza vanno passati in ordine inverso.
 		"""
-		self.model = self.remove_duplicates(self.model.copy())
+		model = self.remove_duplicates(self.model)
 
-		newModel = self.model.copy()
+		# la nuova lista contiene gli stessi oggetti: cambiano solo
+		# le connessioni di cui viene modificata la sicurezza
+		newModel = list(model)
 		newData = self.remove_duplicates(newData)
-		
+		index = ConnectionIndex(model)
+
 		for newConn in newData:
-			found = False
-			i = 0
-			for c in self.model:
-				if self.conn_match(newConn, c):
-					if len(newModel) > i:
-						newModel[i]['safe'] = newConn['safe']
-					else:
-						# la funzione viene richiamata se ci sono stati cambiamenti
-						# in parallelo (dimensioni degli array diverse)
-						self.update_model(newData)
-					found = True
-					break
-				i+=1
-			if not found:
+			i = index.find(newConn)
+			if i is not None:
+				newModel[i] = newModel[i].with_safe(newConn.safe)
+			else:
 				newModel.append(newConn)
-		# se non ci sono dati, vengono impostati quelli precedenti
-		if newData == []:
-			newModel = self.model
-			
-		self.model = newModel.copy()
+
+		self.model = tuple(newModel)
 
 		# logga solo se le informazioni sono utili
 		if len(self.model) != len(newData):
@@ -145,19 +203,16 @@ class Behaviour:
 		"""
 		Rimuove le connessioni simili dal modello passato.
 
-		:param model (list): la lista delle connessioni.
+		:param model (list): la lista delle connessioni, anche come dizionari.
 
-		:return: il modello con le connessioni considerate diverse tra loro.
+		:return: la lista delle connessioni considerate diverse tra loro.
 		"""
 		cleanModel = []
+		index = ConnectionIndex()
 		for c in model:
-			found = False
-			for c2 in cleanModel:
-				if self.conn_match(c, c2):
-					found = True
-					break
-			if not found:
-				cleanModel.append(c.copy())
+			if index.find(c) is None:
+				index.add(c, len(cleanModel))
+				cleanModel.append(Connection.from_dict(c))
 		return cleanModel
 
 
@@ -165,7 +220,7 @@ class Behaviour:
 		"""
 		Aggiorna e ritorna il modello delle connessioni.
 
-		:return: il modello aggiornato.
+		:return: il modello aggiornato, da non modificare.
 		"""
 		self.check_connections()
 		return self.model
@@ -176,8 +231,8 @@ class Behaviour:
 		Non esiste un identificativo, quindi vanno controllati
 		l'indirizzo e la porta sorgente e quelli di destinazione, se presenti.
 
-		:param conn1 (dict): i dati della prima connessione.
-		:param conn2 (list): i dati della seconda connessione.
+		:param conn1 (Connection): i dati della prima connessione.
+		:param conn2 (Connection): i dati della seconda connessione.
 
 		:return: True se le connessioni corrispondono, altrimenti False.
 		"""
@@ -187,19 +242,19 @@ class Behaviour:
 			(
 				# se entrambe le destinazioni sono vuote, la sorgente deve
 				# corrispondere completamente 
-				conn1['dest'] == ['',''] and 
-				conn2['dest'] == ['','']
-				and conn1['source'] == conn2['source']
+				tuple(conn1['dest']) == self.EMPTY_ADDR and 
+				tuple(conn2['dest']) == self.EMPTY_ADDR
+				and tuple(conn1['source']) == tuple(conn2['source'])
 			) or (
 				# se la destinazione non è vuota,
 				# 3 su 4 degli altri campi (ip1, porta1, ip2, porta2) devono corrispondere
-				conn1['dest'] != ['','']
+				tuple(conn1['dest']) != self.EMPTY_ADDR
 				and (
-					conn1['dest'] == conn2['dest']
+					tuple(conn1['dest']) == tuple(conn2['dest'])
 					and conn1['source'][0] == conn2['source'][0]
 				) or (
 					conn1['dest'][0] == conn2['dest'][0]
-					and conn1['source'] == conn2['source'])
+					and tuple(conn1['source']) == tuple(conn2['source']))
 			))
 		)
 
@@ -16,10 +16,13 @@ from common.configParser import ConfigParser
 from client.scriptManager import ScriptManager
 from client.messenger import Messenger
 from client.commandListener import CommandListener
+from client.pushReceiver import PushReceiver
 from client.clientGUI import ClientGUI
 
 from client.inventory import Inventory
 from client.behaviour import Behaviour
+from client.detailsTracker import DetailsTracker
+from client.detailsSampler import DetailsSampler
 
 class Butler():
 	"""
@@ -36,12 +39,14 @@ class Butler():
 	def __init__(self):
 		"""
 		Istanzia un Butler senza accettare attributi.
-		Inizializza l'utente, lo stato della connessione e i dati della notifica
+		Inizializza l'utente e lo stato della connessione
 		"""
 		self.user = getpass.getuser()
 		self.connected = False
-		self.notifData = ''
 		self.behaviour = Behaviour()
+		self.detailsTracker = DetailsTracker()
+		self.pushReceiver = None
+		self.channelThread = None
 	
 	def start(self):
 		"""
@@ -87,22 +92,31 @@ class Butler():
 			log.info('È usato l\'ip {}'.format(ip))
 		self.addr = '{}:{}'.format(ip, self.configs['client']['port'])
 
-		self.inventory = Inventory(ip)
+		self.inventory = Inventory(ip, self.configs['volatileInterval'])
 		self.mac = self.inventory.get_mac()
 
 		log.info('Avvio del Butler {}'.format(self.addr))
 
+		# i dettagli sono raccolti in background e letti dall'ultima raccolta
+		self.sampler = DetailsSampler(self.get_details, self.configs['sampleInterval'])
+		threading.Thread(target=self.sampler.start, daemon=True).start()
+
 		if self.configs['automaticSendInterval'] >= 1:
 			threading.Thread(target=self.check_details, args=[self.configs['automaticSendInterval']], daemon=True).start()
 
 		# avvio dell'ascoltatore di comandi
-		listener = CommandListener(ip, self.configs['client']['port'], self.configs['expireTime'],
+		self.listener = CommandListener(ip, self.configs['client']['port'], self.configs['expireTime'],
 			self.configs['ssl'], {'show_notif': self.show_notif,
 			'revoke': self.revoke_notif, 'disconnect': self.disconnect,
 			'validate_credentials': self.validate_credentials,
-			'get_details': self.get_details, 'toggle_module': self.toggle_module,
-			'toggle_phase': self.toggle_phase, 'update_model': self.update_model})
-		threading.Thread(target=listener.start_api, daemon=True).start()
+			'get_details': self.get_snapshot, 'toggle_module': self.toggle_module,
+			'toggle_phase': self.toggle_phase, 'update_model': self.update_model}, self.configs['serving'])
+		threading.Thread(target=self.listener.start_api, daemon=True).start()
+
+		# i comandi del server possono arrivare anche dal canale aperto dal Butler
+		if self.configs['channel']['enabled']:
+			self.pushReceiver = PushReceiver(self.configs['server']['ip'], self.configs['channel']['port'],
+				self.listener.dispatch, self.configs['channel']['keepAlive'])
 		#sleep(0.1)
 
 		# preparazione del generatore di notifiche
@@ -120,13 +134,12 @@ class Butler():
 			self.configs['protocol'], self.configs['server']['ip'], self.configs['server']['port'])
 		threading.Thread(target=self.connect, daemon=True).start()
 
-		for event in self.tray.listen_tray():
-			if self.notifData != '' and self.modules[self.NOTIFICATION_MODULE]:
-				log.warning('Nuova notifica: "{}"'.format(self.notifData['name']))
+		for event, data, received in self.tray.listen_tray():
+			if event == self.tray.NOTIFY and self.modules[self.NOTIFICATION_MODULE]:
+				log.warning('Nuova notifica: "{}"'.format(data['name']))
 				self.notifBuilder.interrupt = False
-				self.notifBuilder.show_window(self.notifData)
-				self.notifData = ''
-			if event == self.tray.QUIT:
+				self.notifBuilder.show_window(data, received=received)
+			elif event == self.tray.QUIT:
 				log.info('Tentativo di spegnimento manuale')
 				if self.msg.can_disconnect(self.addr):
 					log.warning('Richiesta accettata. Disconnessione di {}'.format(self.addr))
@@ -157,10 +170,23 @@ class Butler():
 		Ripete l'operazione ad intervalli definiti dalla costante RETRY_TIMER.
 		"""
 		log.info('Connessione al server {}'.format(self.serverAddr))
-		self.msg = Messenger(baseUrl=self.serverAddr, authCallback=self.authenticate)
+		self.msg = Messenger(baseUrl=self.serverAddr, authCallback=self.authenticate, **self.configs['requests'])
 		while not self.connected:
 			self.connected = self.authenticate()
 			sleep(self.RETRY_TIMER)
+		if self.pushReceiver is not None and (self.channelThread is None or not self.channelThread.is_alive()):
+			self.channelThread = threading.Thread(target=self.listen_channel, daemon=True)
+			self.channelThread.start()
+
+	def listen_channel(self):
+		"""
+		Mantiene aperto il canale verso il server finchè il Butler è connesso,
+		riaprendolo ad intervalli definiti dalla costante RETRY_TIMER.
+		Se il canale non è disponibile, i comandi continuano ad arrivare in HTTPS.
+		"""
+		while self.connected:
+			self.pushReceiver.listen(self.msg.headers['token'], self.msg.headers['sub'], self.addr)
+			sleep(self.RETRY_TIMER)
 
 	def authenticate(self):
 		"""
@@ -174,16 +200,17 @@ class Butler():
 
 	def show_notif(self, data):
 		"""
-		Imposta i dati della notifica da mostrare come flag.
+		Invia i dati della notifica da mostrare al loop principale.
 		La notifica non può essere mostrata in questa funzione poichè generalmente
 		richiamata da thread secondarie, ma la gui richiede di essere avviata
-		dalla main thread. Sarà quindi il loop principale ad accorgersi dei dati
-		in sospeso da mostrare.
+		dalla main thread, che viene risvegliata subito dall'evento.
+		Una notifica già aperta viene chiusa e sostituita dalla nuova.
 		
 		:param data (dict): i dati della notifica da mostrare.
 		"""
 		if self.modules[self.NOTIFICATION_MODULE]:
-			self.notifData = data
+			self.notifBuilder.stop()
+			self.tray.post(self.tray.NOTIFY, data)
 		
 	def revoke_notif(self, name=''):
 		"""
@@ -210,6 +237,9 @@ class Butler():
 		"""
 		self.msg.disconnect()
 		self.connected = False
+		self.detailsTracker.reset()
+		if self.pushReceiver is not None:
+			self.pushReceiver.close()
 
 	def shutdown(self):
 		"""
@@ -259,7 +289,7 @@ class Butler():
 
 		:return: i dettagli dei moduli.
 		"""
-		details = {'mac': self.mac, 'modules': self.modules}
+		details = {'mac': self.mac, 'modules': dict(self.modules)}
 		if self.modules[self.INVENTORY_MODULE]:
 			details['inventory'] = self.inventory.get_inventory()
 		if self.modules[self.BEHAVIOUR_MODULE]:
@@ -267,13 +297,30 @@ class Butler():
 			details['phase'] = self.behaviour.phase
 		return details
 
+	def get_snapshot(self, maxAge=None):
+		"""
+		Ricava gli ultimi dettagli raccolti in background, con la data della raccolta.
+
+		:param maxAge (float, opzionale): l'età massima (in secondi) dei dettagli.
+				Se quelli raccolti sono più vecchi, vengono raccolti nuovamente.
+			Default: None (qualunque età).
+
+		:return: i dettagli dei moduli e la data della raccolta ("sampled").
+		"""
+		details, sampled = self.sampler.get(maxAge)
+		snapshot = dict(details)
+		snapshot['sampled'] = sampled
+		return snapshot
+
 	def toggle_module(self, module):
 		"""
 		Cambia lo stato di un modulo in base ai parametri.
 
 		:param module (str): l'identificativo del modulo.
 		"""
-		self.modules.update(module)
+		with self.sampler.lock:
+			self.modules.update(module)
+		self.sampler.invalidate()
 		
 	def toggle_phase(self, phase):
 		"""
@@ -283,7 +330,8 @@ class Butler():
 		"""
 		if self.modules[self.BEHAVIOUR_MODULE]:
 			self.behaviour.phase = phase
-			self.behaviour.check_connections()
+			# le connessioni sono rilette dalla prossima raccolta
+			self.sampler.invalidate()
 
 	def update_model(self, model):
 		"""
@@ -292,12 +340,15 @@ class Butler():
 		:param model (list): la lista delle nuove connessioni.
 		"""
 		if self.modules[self.BEHAVIOUR_MODULE]:
-			self.behaviour.update_model(model)
+			# il modello è modificato solo tra una raccolta e l'altra
+			with self.sampler.lock:
+				self.behaviour.update_model(model)
+			self.sampler.invalidate()
 
 	def check_details(self, interval):
 		"""
 		Contolla periodicamente le informazioni dell'host e, se sono
-		cambiate dalle precedenti, le invia al server.
+		cambiate dalle precedenti, invia le differenze al server.
 		Ripete l'operazione ad intervalli definiti dal parametro.
 		È necessario mandare solo l'inventario e il modello delle connessioni.
 
@@ -305,36 +356,26 @@ class Butler():
 		"""
 		while True:
 			if self.connected:
-				oldDetails = {
-					'inventory': self.inventory.data,
-					'model': self.behaviour.model}
-				currentDetails = self.get_details()
-				newDetails = {}
-
-				# inventario e model potrebbero essere disattivati
-				# quindi verifica anche che la chiave esista
-				if 'inventory' in currentDetails and oldDetails['inventory'] != currentDetails['inventory']:
-					newDetails['inventory'] = currentDetails['inventory']
-				if 'model' in currentDetails and oldDetails['model'] != currentDetails['model']:
-					for currentConn in currentDetails['model']:
-						found = False
-						for oldConn in oldDetails['model']:
-							if self.behaviour.conn_match(oldConn, currentConn):
-								found = True
-								break
-						if not found:
-							if 'model' not in newDetails:
-								newDetails['model'] = []
-							newDetails['model'].append(currentConn)
+				# inventario e model potrebbero essere disattivati:
+				# il tracker considera solo le chiavi presenti
+				details, sampled = self.sampler.get(interval)
+				newDetails = self.detailsTracker.get_delta(details)
 
 				# invia solo se sono state trovate differenze
-				if newDetails != {}:
+				if newDetails is not None:
 					newDetails['mac'] = self.mac
 					successful = self.msg.send_details(newDetails)
-					log.info('Invio di alcuni dettagli al server: {}'.format([key for key in newDetails]))
-					if not successful and not self.msg.server_online(self.addr):
-						log.warning('I dettagli inviati non hanno raggiunto il server')
-						self.disconnect()
+					log.info('Invio di alcuni dettagli al server (sequenza {}): {}'.format(
+						newDetails['seq'], [key for key in newDetails]))
+					if successful:
+						self.detailsTracker.commit()
+					else:
+						# il server ha perso la sequenza o non ha ricevuto i dati:
+						# il prossimo invio sarà completo
+						self.detailsTracker.reset()
+						if not self.msg.server_online(self.addr):
+							log.warning('I dettagli inviati non hanno raggiunto il server')
+							self.disconnect()
 			sleep(interval)
 
 	"""
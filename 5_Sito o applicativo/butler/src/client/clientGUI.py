@@ -3,6 +3,8 @@ import webbrowser
 import base64
 from os.path import abspath, join
 import sys
+import queue
+from time import time
 
 from common import log
 from common.notificationBuilder import NotificationBuilder
@@ -21,6 +23,10 @@ class ClientGUI:
 	INFO = "Pagina github"
 	HIDE = "Nascondi icona"
 	QUIT = "Esci"
+	# gli eventi inviati dagli altri thread
+	NOTIFY = "-NOTIFY-"
+	# ogni quanti millisecondi il menu viene letto al massimo
+	TRAY_TIMEOUT = 100
 	
 	def __init__(self, logoPath, status_callback, website):
 		"""
@@ -35,6 +41,9 @@ class ClientGUI:
 		self.get_status = status_callback
 		self.website = website
 		self.interrupt = False
+		# eventi per la thread principale, con i dati e la data di ricezione
+		self.events = queue.Queue()
+		self.gui = None
 
 	def start_tray(self):
 		"""
@@ -50,15 +59,37 @@ class ClientGUI:
 		#data_base64=base64.b64encode(file.read())
 		self.gui = NotificationBuilder(logoPath=self.logoPath)
 
+	def post(self, event, data=None):
+		"""
+		Invia un evento alla thread principale, risvegliandone subito il loop.
+		Può essere richiamata da qualunque thread.
+		Se è aperta la finestra di stato, viene chiusa per non ritardare l'evento.
+
+		:param event (str): l'evento da inviare.
+		:param data (any, opzionale): i dati dell'evento.
+			Default: None.
+		"""
+		self.events.put((event, data, time()))
+		if self.gui is not None:
+			self.gui.stop()
+
 	def listen_tray(self):
 		"""
-		Ascolta gli eventi del menu, gestisce alcuni eventi e li ritorna tutti.
+		Ascolta gli eventi del menu e quelli inviati dagli altri thread,
+		gestisce alcuni eventi del menu e li ritorna tutti.
+		Il loop attende gli eventi inviati senza consumare risorse e li ritorna
+		appena ricevuti, mentre il menu è letto ogni TRAY_TIMEOUT millisecondi.
 		
-		:yield: tutti gli eventi.
+		:yield: tutti gli eventi, con i dati e la data di ricezione.
 		"""
 		log.info('Avvio del menu')
 		while not self.interrupt:
-			event = self.tray.read(2000)
+			try:
+				yield self.events.get(timeout=self.TRAY_TIMEOUT / 1000)
+				continue
+			except queue.Empty:
+				pass
+			event = self.tray.read(0)
 			if event == sg.EVENT_SYSTEM_TRAY_ICON_ACTIVATED:
 				self.show_status()
 			elif event == self.OPEN:
@@ -68,7 +99,7 @@ class ClientGUI:
 			elif event == self.HIDE:
 				self.tray.hide()
 				#break
-			yield event
+			yield event, None, time()
 		
 		# si usano break per non arrivare qui da self.HIDE, che non lo necessita
 		self.stop()
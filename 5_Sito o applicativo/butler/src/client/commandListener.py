@@ -10,7 +10,7 @@ class CommandListener(BaseAPI):
 	Estende da BaseAPI che definisce parte della logica di base. 
 	"""
 
-	def __init__(self, ip, port, expireTime, sslConf, callbacks):
+	def __init__(self, ip, port, expireTime, sslConf, callbacks, serving=BaseAPI.SERVING):
 		"""
 		Istanzia un oggetto CommandListener definendone ip e porta sul quale lavorare,
 		la durata dei token generati e le funzioni di callback disponibili.
@@ -20,8 +20,25 @@ class CommandListener(BaseAPI):
 		:param expireTime (float): i minuti di durata dei token.
 		:param sslConf (list): il percorso del certificato e della chiave SSL.
 		:param callbacks (dict): la lista di callback, identificate da chiavi.
+		:param serving (dict, opzionale): il server HTTP da usare e la sua configurazione.
+			Default: BaseAPI.SERVING ({'backend': 'werkzeug'}).
 		"""
-		super().__init__(ip, port, expireTime, sslConf, callbacks)
+		super().__init__(ip, port, expireTime, sslConf, callbacks, serving)
+
+	def dispatch(self, method, endpoint, headers, data):
+		"""
+		Esegue un comando ricevuto dal canale del server come se fosse
+		una richiesta HTTPS, con la stessa autenticazione.
+
+		:param method (str): il metodo HTTP della richiesta.
+		:param endpoint (str): l'endpoint richiesto.
+		:param headers (dict): gli header della richiesta, con il token del server.
+		:param data (dict): i dati della richiesta.
+
+		:return: lo stato e il contenuto della risposta.
+		"""
+		response = self.flask.test_client().open(endpoint, method=method, headers=headers, json=data)
+		return response.status_code, response.get_json()
 
 	def start_api(self):
 		"""
@@ -43,8 +60,7 @@ class CommandListener(BaseAPI):
 			returnData = {'message': 'Credenziali non valide'}
 			status = self.UNAUTHORIZED
 			if self.callbacks['validate_credentials'](serverAddr, serverId):
-				self.sub = serverAddr
-				returnData = self.init_token()
+				returnData = self.init_token(serverAddr)
 				log.info('Connessione accettata dal server "{}" su "{}"'.format(serverId, serverAddr))
 				status = self.ACCEPTED
 			return self.standard_response(returnData, status)
@@ -130,11 +146,18 @@ class CommandListener(BaseAPI):
 		def get_details():
 			"""
 			Endpoint per richiede i dettagli del Butler.
+			I dettagli sono quelli dell'ultima raccolta, a meno che non siano
+			più vecchi del parametro "maxAge" (in secondi).
+			Se il server lo richiede, il modello è inviato per colonne.
 
-			:return: i dettagli ricavati.
+			:return: i dettagli ricavati, con la data della raccolta.
 			"""
-			returnData = self.callbacks['get_details']()
-			return self.standard_response(returnData)
+			maxAge = self.get_json(request, 'maxAge', None)
+			returnData = self.callbacks['get_details'](maxAge)
+			if self.wants_columnar(request):
+				returnData = self.wireFormat.pack(returnData)
+			# i dettagli contengono il modello di comportamento, potenzialmente grande
+			return self.standard_response(returnData, stream=True)
 
 		@self.flask.route('/module', methods=['PUT'])
 		@self.auth.token_required
@@ -193,7 +216,7 @@ class CommandListener(BaseAPI):
 
 		try:
 			log.info('Attesa di comandi su {}:{}'.format(self.ip, self.port))
-			self.flask.run(host=self.ip, port=self.port, ssl_context=self.sslConf, use_evalex=False)
+			self.serve(use_evalex=False)
 		except OSError as e:
 			log.critical('Non è stato possibile ascoltare il server su "{}": {}'.format(self.ip, e.__str__()))
 			_exit(1)
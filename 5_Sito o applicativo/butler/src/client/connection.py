@@ -0,0 +1,96 @@
+import sys
+
+class Connection():
+	"""
+	Questa classe rappresenta una connessione del modello in forma compatta
+	e immutabile: una connessione modificata è sempre un nuovo oggetto,
+	quindi il modello può essere condiviso tra più letture senza copiarlo.
+	Le stringhe sono internate, così che i valori ripetuti (processi,
+	stati, protocolli, indirizzi) siano salvati una sola volta.
+	I campi si leggono anche come quelli di un dizionario (conn['proc']),
+	e dict(conn) ritorna il formato usato nei dati JSON.
+	"""
+
+	__slots__ = ('proc', 'status', 'source', 'dest', 'proto', 'safe')
+	FIELDS = __slots__
+
+	def __init__(self, proc, status, source, dest, proto, safe):
+		"""
+		Istanzia un oggetto Connection.
+
+		:param proc (str): il nome del processo.
+		:param status (str): lo stato della connessione.
+		:param source (list): l'indirizzo IPv4 e la porta sorgente.
+		:param dest (list): l'indirizzo IPv4 e la porta di destinazione (vuoti se assenti).
+		:param proto (str): il nome del protocollo.
+		:param safe (bool): True se la connessione è considerata sicura.
+		"""
+		# i campi sono impostati solo qui: __setattr__ li rende immutabili
+		setField = object.__setattr__
+		setField(self, 'proc', self.intern(proc))
+		setField(self, 'status', self.intern(status))
+		setField(self, 'source', (self.intern(source[0]), source[1]))
+		setField(self, 'dest', (self.intern(dest[0]), dest[1]))
+		setField(self, 'proto', self.intern(proto))
+		setField(self, 'safe', safe)
+
+	@classmethod
+	def from_dict(cls, conn):
+		"""
+		Converte una connessione ricevuta come dizionario.
+		Le connessioni già convertite sono ritornate senza copiarle.
+
+		:param conn (dict, Connection): la connessione da convertire.
+
+		:return: la connessione immutabile.
+		"""
+		if type(conn) == cls:
+			return conn
+		return cls(conn['proc'], conn['status'], conn['source'], conn['dest'], conn['proto'], conn['safe'])
+
+	def intern(self, value):
+		"""
+		Interna un valore se è una stringa.
+
+		:param value (any): il valore da internare.
+
+		:return: il valore internato, oppure quello originale.
+		"""
+		return sys.intern(value) if type(value) == str else value
+
+	def with_safe(self, safe):
+		"""
+		Ricava la stessa connessione con una diversa sicurezza.
+		Gli altri campi sono condivisi con la connessione originale.
+
+		:param safe (bool): la nuova sicurezza.
+
+		:return: la connessione stessa se la sicurezza non cambia, altrimenti una nuova.
+		"""
+		if safe == self.safe:
+			return self
+		conn = object.__new__(Connection)
+		for field in self.FIELDS:
+			object.__setattr__(conn, field, getattr(self, field))
+		object.__setattr__(conn, 'safe', safe)
+		return conn
+
+	def __setattr__(self, name, value):
+		raise AttributeError('Le connessioni non possono essere modificate')
+
+	def __getitem__(self, key):
+		if key not in self.FIELDS:
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __contains__(self, key):
+		return key in self.FIELDS
+
+	def __iter__(self):
+		return iter(self.FIELDS)
+
+	def keys(self):
+		return self.FIELDS
+
+	def __repr__(self):
+		return 'Connection({})'.format(dict(self))
@@ -0,0 +1,71 @@
+from client.connection import Connection
+
+class ConnectionIndex():
+	"""
+	Questa classe indicizza le connessioni del modello per trovare
+	quelle corrispondenti senza confrontarle una ad una.
+	Riproduce la logica di Behaviour.conn_match con due indici:
+	- processo, destinazione completa e ip sorgente (se la destinazione non è vuota)
+	- processo, ip di destinazione e sorgente completa
+	Due connessioni corrispondono se condividono almeno una delle due chiavi.
+	"""
+
+	EMPTY_ADDR = ('', '')
+
+	def __init__(self, model=[]):
+		"""
+		Istanzia un oggetto ConnectionIndex indicizzando le connessioni passate.
+
+		:param model (list, opzionale): la lista delle connessioni da indicizzare.
+			Default: [].
+		"""
+		self.destIndex = {}
+		self.sourceIndex = {}
+		for position, conn in enumerate(model):
+			self.add(conn, position)
+
+	def get_keys(self, conn):
+		"""
+		Calcola le chiavi di una connessione.
+		Gli indirizzi sono convertiti in tuple per poter essere usati come chiavi.
+
+		:param conn (dict, Connection): i dati della connessione.
+
+		:return: la chiave della destinazione (None se la destinazione è vuota)
+			e quella della sorgente.
+		"""
+		# le connessioni immutabili hanno già gli indirizzi come tuple
+		# e sono lette come attributi, senza passare da __getitem__
+		if type(conn) == Connection:
+			proc, source, dest = conn.proc, conn.source, conn.dest
+		else:
+			proc, source, dest = conn['proc'], tuple(conn['source']), tuple(conn['dest'])
+		destKey = (proc, dest, source[0]) if dest != self.EMPTY_ADDR else None
+		return destKey, (proc, dest[0], source)
+
+	def add(self, conn, position):
+		"""
+		Aggiunge una connessione agli indici.
+		Se una chiave è già presente, viene mantenuta la posizione precedente.
+
+		:param conn (dict): i dati della connessione.
+		:param position (int): la posizione della connessione nel modello.
+		"""
+		destKey, sourceKey = self.get_keys(conn)
+		if destKey is not None:
+			self.destIndex.setdefault(destKey, position)
+		self.sourceIndex.setdefault(sourceKey, position)
+
+	def find(self, conn):
+		"""
+		Cerca la prima connessione indicizzata corrispondente a quella passata.
+
+		:param conn (dict): i dati della connessione da cercare.
+
+		:return: la posizione della connessione trovata, altrimenti None.
+		"""
+		destKey, sourceKey = self.get_keys(conn)
+		positions = [self.destIndex[destKey]] if destKey in self.destIndex else []
+		if sourceKey in self.sourceIndex:
+			positions.append(self.sourceIndex[sourceKey])
+		return min(positions) if positions != [] else None
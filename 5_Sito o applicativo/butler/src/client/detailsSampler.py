@@ -0,0 +1,84 @@
+import threading
+from time import time
+
+from common import log
+
+class DetailsSampler():
+	"""
+	Questa classe raccoglie periodicamente i dettagli dell'host in background
+	e ne mantiene l'ultima versione, con la data di raccolta.
+	Le richieste dei dettagli ricevono subito l'ultima versione raccolta:
+	solo chi richiede dati più recenti di una certa età attende una nuova raccolta.
+	Le raccolte non avvengono mai contemporaneamente: chi le richiede mentre
+	una è in corso ne attende il risultato.
+	"""
+
+	INTERVAL = 5
+
+	def __init__(self, sampleCallback, interval=INTERVAL):
+		"""
+		Istanzia un oggetto DetailsSampler senza dettagli raccolti.
+
+		:param sampleCallback (func): la funzione che raccoglie i dettagli.
+		:param interval (int, opzionale): i secondi tra una raccolta e l'altra.
+			Default: INTERVAL (5).
+		"""
+		self.sampleCallback = sampleCallback
+		self.interval = interval
+		# ultimi dettagli raccolti e data della raccolta
+		self.snapshot = None
+		self.sampled = 0
+		# acquisito durante ogni raccolta: può essere usato anche per
+		# modificare i dati raccolti senza interferire con una raccolta
+		self.lock = threading.RLock()
+		self.wakeup = threading.Event()
+
+	def start(self):
+		"""
+		Raccoglie i dettagli ad intervalli regolari, senza mai terminare.
+		"""
+		while True:
+			try:
+				self.sample()
+			except Exception as e:
+				log.warning('Errore nella raccolta dei dettagli: {}'.format(e.__str__()))
+			self.wakeup.wait(self.interval)
+			self.wakeup.clear()
+
+	def sample(self):
+		"""
+		Raccoglie i dettagli e li salva come ultima versione.
+
+		:return: i dettagli raccolti e la data della raccolta.
+		"""
+		with self.lock:
+			start = time()
+			snapshot = self.sampleCallback()
+			self.snapshot, self.sampled = snapshot, time()
+			log.info('Dettagli raccolti in {:.2f} secondi'.format(self.sampled - start))
+			return self.snapshot, self.sampled
+
+	def get(self, maxAge=None):
+		"""
+		Ricava l'ultima versione dei dettagli.
+
+		:param maxAge (float, opzionale): l'età massima (in secondi) dei dettagli.
+				Se quelli raccolti sono più vecchi, viene eseguita una nuova raccolta.
+			Default: None (qualunque età).
+
+		:return: i dettagli e la data della raccolta.
+		"""
+		snapshot, sampled = self.snapshot, self.sampled
+		if snapshot is not None and (maxAge is None or time() - sampled <= maxAge):
+			return snapshot, sampled
+		with self.lock:
+			# una raccolta appena terminata può già soddisfare la richiesta
+			if self.snapshot is not None and (maxAge is None or time() - self.sampled <= maxAge):
+				return self.snapshot, self.sampled
+			return self.sample()
+
+	def invalidate(self):
+		"""
+		Anticipa la prossima raccolta, ad esempio dopo la modifica di un modulo.
+		"""
+		self.wakeup.set()
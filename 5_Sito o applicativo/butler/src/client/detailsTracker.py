@@ -0,0 +1,159 @@
+from client.connectionIndex import ConnectionIndex
+
+class DetailsTracker():
+	"""
+	Questa classe tiene traccia degli ultimi dettagli accettati dal server
+	e calcola solo le differenze da inviare.
+	Ogni invio ha un numero di sequenza crescente: il server applica le
+	differenze solo se la sequenza è continua, altrimenti ne richiede
+	un invio completo.
+
+	Il formato delle differenze è:
+	{'seq': 5,                                   # numero di sequenza
+	'full': False,                               # True se i dati sono completi
+	'inventory': {'cpu.freq': 2100.0, ...},      # percorsi modificati
+	'removedPaths': ['inventory.cpu.temp', ...], # percorsi rimossi
+	'model': [{...}, ...],                       # connessioni nuove o modificate
+	'removed': [{...}, ...]}                     # connessioni rimosse
+	"""
+
+	SEPARATOR = '.'
+	# campi che cambiano spesso e non giustificano un invio
+	VOLATILE_CONN_FIELDS = ['status']
+
+	def __init__(self):
+		"""
+		Istanzia un oggetto DetailsTracker senza dati inviati.
+		"""
+		self.seq = 0
+		self.pending = {}
+		self.reset()
+
+	def reset(self):
+		"""
+		Dimentica i dati inviati, così che il prossimo invio sia completo.
+		"""
+		self.inventory = None
+		self.model = None
+
+	def flatten(self, data, prefix=''):
+		"""
+		Converte un dizionario annidato in un dizionario di percorsi.
+		Le liste sono considerate come valori singoli.
+
+		:param data (dict): il dizionario da convertire.
+		:param prefix (str, opzionale): il percorso del dizionario.
+			Default: ''.
+
+		:return: il dizionario con i percorsi come chiavi.
+		"""
+		paths = {}
+		for key, value in data.items():
+			path = prefix + key
+			if type(value) == dict and value != {}:
+				paths.update(self.flatten(value, path + self.SEPARATOR))
+			else:
+				paths[path] = value
+		return paths
+
+	def conn_changed(self, oldConn, newConn):
+		"""
+		Verifica se una connessione già inviata è stata modificata.
+
+		:param oldConn (dict): la connessione inviata.
+		:param newConn (dict): la connessione attuale.
+
+		:return: True se almeno un campo non volatile è diverso.
+		"""
+		for key in newConn:
+			if key not in self.VOLATILE_CONN_FIELDS and (key not in oldConn or oldConn[key] != newConn[key]):
+				return True
+		return False
+
+	def get_inventory_delta(self, inventory):
+		"""
+		Calcola i percorsi dell'inventario cambiati dall'ultimo invio.
+
+		:param inventory (dict): l'inventario attuale.
+
+		:return: l'inventario completo se non c'è un invio precedente,
+			altrimenti i soli percorsi modificati, e la lista dei percorsi rimossi.
+		"""
+		paths = self.flatten(inventory)
+		self.pending['inventory'] = paths
+		if self.inventory is None:
+			return inventory, []
+
+		delta = {path: value for path, value in paths.items()
+			if path not in self.inventory or self.inventory[path] != value}
+		removed = [path for path in self.inventory if path not in paths]
+		return delta, removed
+
+	def get_model_delta(self, model):
+		"""
+		Calcola le connessioni aggiunte, modificate e rimosse dall'ultimo invio.
+
+		:param model (list): il modello attuale.
+
+		:return: le connessioni nuove o modificate e quelle rimosse.
+		"""
+		# le connessioni sono immutabili: il modello inviato è mantenuto senza copiarlo
+		self.pending['model'] = model
+		if self.model is None:
+			return model, []
+
+		oldIndex = ConnectionIndex(self.model)
+		changed = []
+		for conn in model:
+			i = oldIndex.find(conn)
+			if i is None or self.conn_changed(self.model[i], conn):
+				changed.append(conn)
+
+		newIndex = ConnectionIndex(model)
+		removed = [conn for conn in self.model if newIndex.find(conn) is None]
+		return changed, removed
+
+	def get_delta(self, details):
+		"""
+		Prepara i dati da inviare al server in base ai moduli presenti nei dettagli.
+
+		:param details (dict): i dettagli attuali dell'host.
+
+		:return: il dizionario delle differenze, oppure None se non ci sono cambiamenti.
+		"""
+		self.pending = {}
+		delta = {'full': self.inventory is None and self.model is None}
+
+		if 'inventory' in details:
+			inventory, removedPaths = self.get_inventory_delta(details['inventory'])
+			if inventory != {}:
+				delta['inventory'] = inventory
+			# i percorsi rimossi sono indicati come percorsi del documento nel database
+			if len(removedPaths) > 0:
+				delta['removedPaths'] = ['inventory' + self.SEPARATOR + path for path in removedPaths]
+		if 'model' in details:
+			changed, removed = self.get_model_delta(details['model'])
+			# le connessioni sono convertite nel formato JSON solo per l'invio
+			if len(changed) > 0:
+				delta['model'] = [dict(c) for c in changed]
+			if len(removed) > 0:
+				delta['removed'] = [dict(c) for c in removed]
+
+		# un invio completo è necessario anche se non ci sono differenze,
+		# ma solo se almeno un modulo è attivo
+		if len(delta) == 1 and not (delta['full'] and self.pending != {}):
+			return None
+		self.seq += 1
+		delta['seq'] = self.seq
+		return delta
+
+	def commit(self):
+		"""
+		Conferma che l'ultimo invio è stato accettato dal server,
+		che diventa la base per le prossime differenze.
+		"""
+		if 'inventory' in self.pending:
+			self.inventory = self.pending['inventory']
+		if 'model' in self.pending:
+			self.model = self.pending['model']
+		self.pending = {}
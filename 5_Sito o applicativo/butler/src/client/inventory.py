@@ -1,6 +1,7 @@
 import psutil
 import datetime
 import platform
+from time import time
 
 from common import log
 
@@ -10,17 +11,30 @@ class Inventory():
 	"""
 
 	MAC_LENGTH = 17
+	VOLATILE_INTERVAL = 60
+	# variazioni relative sotto le quali un valore è considerato invariato
+	FREQ_TOLERANCE = 0.1
+	DISK_TOLERANCE = 0.01
 
-	def __init__(self, ip='127.0.0.1'):
+	def __init__(self, ip='127.0.0.1', volatileInterval=VOLATILE_INTERVAL):
 		"""
-		Istanzia un oggetto Inventory definendone l'indirizzo IP.
+		Istanzia un oggetto Inventory definendone l'indirizzo IP
+		e la cadenza di lettura dei dati variabili.
 
 		:param ip (str): l'indirizzo da usare.
 			Default: '127.0.0.1'
+		:param volatileInterval (int, opzionale): i secondi tra una lettura
+				dei dati variabili (frequenza, utenti, spazio usato) e l'altra.
+			Default: VOLATILE_INTERVAL (60).
 		"""
 		self.ip = ip
 		self.mac = None
 		self.data = {}
+		self.volatileInterval = volatileInterval
+		self.static = {}
+		self.volatile = {}
+		self.hardware = None
+		self.lastSample = 0
 
 	def get_mac(self):
 		"""
@@ -52,59 +66,152 @@ class Inventory():
 	def get_inventory(self, attr=[]):
 		"""
 		Trova diverse informazioni sul PC.
+		I dati fissi sono letti solo la prima volta e quando cambiano dischi
+		o interfacce, quelli variabili al massimo ogni volatileInterval secondi.
+		Negli altri casi sono ritornati i dati già presenti.
 
 		:param attr (list, optional): gli attributi aggiuntivi da allegare
 				Deve essere una lista testuale di nomi di funzioni.
 				Quelli non validi saranno ignorati.
 			Default: [].
+
+		:return: l'inventario del PC.
 		"""
-		
+		if self.static != {} and time() - self.lastSample < self.volatileInterval:
+			return self.data
+
+		hardware = self.get_hardware()
+		if self.static == {} or hardware != self.hardware:
+			self.hardware = hardware
+			self.static = self.get_static()
+			# le partizioni potrebbero essere cambiate
+			self.volatile = {}
+		self.update_volatile(self.get_volatile(attr))
+		self.lastSample = time()
+
+		static = self.static
+		volatile = self.volatile
 		data = {
-			'os': [platform.system(), platform.release(), platform.version(), platform.architecture()[0]],
-			'hostname': platform.node(),
+			'os': static['os'],
+			'hostname': static['hostname'],
 			'mac': self.mac if self.mac is not None else self.get_mac(),
 			'last_ip': self.ip,
-			'last_users': [user.name for user in psutil.users()],
+			'last_users': volatile['last_users'],
+			'last_boot': static['last_boot'],
+			'cpu': dict(static['cpu'], freq=volatile['freq']),
+			'interfaces': static['interfaces'],
+			'ram': static['ram'],
+			'swap': static['swap'],
+			'disk': [dict(partition, used=volatile['disk'][i]) if i in volatile['disk'] else partition
+				for i, partition in enumerate(static['disk'])]
+		}
+		data.update(volatile['attr'])
+
+		# logga solo se le informazioni sono utili
+		if self.data != data:
+			self.data = data
+			log.info('Informazioni inventario {} ({}) aggiornate'.format(data['hostname'], data['mac']))
+
+		return self.data
+
+	def get_hardware(self):
+		"""
+		Ricava una firma dei dischi e delle interfacce collegati, usata
+		per accorgersi dei cambiamenti hardware senza rileggere tutti i dati.
+
+		:return: le partizioni e i nomi delle interfacce.
+		"""
+		return psutil.disk_partitions(), [name for name in psutil.net_if_stats()]
+
+	def get_static(self):
+		"""
+		Legge le informazioni che cambiano solo con un riavvio o
+		con una modifica dell'hardware.
+
+		:return: il dizionario dei dati fissi.
+		"""
+		data = {
+			'os': [platform.system(), platform.release(), platform.version(), platform.architecture()[0]],
+			'hostname': platform.node(),
 			'last_boot': datetime.datetime.fromtimestamp(
 				psutil.boot_time()).strftime("%Y-%m-%d %H:%M:%S"),
 			'cpu': {
 				'model':platform.processor(),
-				'freq': psutil.cpu_freq().current if hasattr(psutil.cpu_freq(), 'current') else psutil.cpu_freq(),
 				'cores': psutil.cpu_count(logical=False),
 				'threads':psutil.cpu_count()
 			},
-			'interfaces': [name for name in psutil.net_if_stats()],
+			'interfaces': self.hardware[1],
 			'ram': psutil.virtual_memory().total/1024/1024,
 			'swap': psutil.swap_memory().total/1024/1024,
 			'disk': []
 		}
 
+		# prende le informazioni sui dischi ne migliora la presentazione
+		for disk in self.hardware[0]:
+			partition = {'device':disk.device, 'file system': disk.fstype, 'options': disk.opts}
+			try:
+				# i dati sono convertiti in megabytes
+				partition['size'] = psutil.disk_usage(disk.mountpoint).total/1024/1024
+			except Exception as e:
+				log.warning(e.__str__())
+				pass
+			data['disk'].append(partition)
+		return data
+
+	def get_volatile(self, attr=[]):
+		"""
+		Legge le informazioni che cambiano durante l'uso del PC.
+
+		:param attr (list, optional): gli attributi aggiuntivi da allegare.
+			Default: [].
+
+		:return: il dizionario dei dati variabili.
+		"""
+		freq = psutil.cpu_freq()
+		data = {
+			'freq': freq.current if hasattr(freq, 'current') else freq,
+			'last_users': [user.name for user in psutil.users()],
+			'disk': {},
+			'attr': {}
+		}
+
+		# i dischi non leggibili sono già stati segnalati dai dati fissi
+		for i, partition in enumerate(self.static['disk']):
+			if 'size' in partition:
+				try:
+					data['disk'][i] = psutil.disk_usage(self.hardware[0][i].mountpoint).used/1024/1024
+				except Exception:
+					pass
+
 		# prova a prendere le informazioni degli attributi aggiuntivi
 		for key in attr:
 			try:
-				data[key] = getattr(psutil, key)()
+				data['attr'][key] = getattr(psutil, key)()
 			except:
 				# se non è una funzione, prova ad eseguirlo come attributo
 				try:
-					data[key] = getattr(psutil, key)
+					data['attr'][key] = getattr(psutil, key)
 				except:
 					pass
+		return data
 
-		# prende le informazioni sui dischi ne migliora la presentazione
-		for disk in psutil.disk_partitions():
-			partition = {'device':disk.device, 'file system': disk.fstype, 'options': disk.opts}
-			try:
-				# i dati sono convertiti in megabytes
-				partition['size'] = psutil.disk_usage(disk[0]).total/1024/1024
-				partition['used'] = psutil.disk_usage(disk[0]).used/1024/1024
-			except Exception as e:
-				log.warning(e.__str__())
-				pass
-			data['disk'].append(partition)
+	def update_volatile(self, data):
+		"""
+		Aggiorna i dati variabili ignorando le variazioni troppo piccole,
+		che causerebbero un invio al server ad ogni controllo.
 
-		# logga solo se le informazioni sono utili
-		if self.data != data:
-			self.data = data
-			log.info('Informazioni inventario {} ({}) aggiornate'.format(data['hostname'], data['mac']))
+		:param data (dict): i dati variabili appena letti.
+		"""
+		if self.volatile == {}:
+			self.volatile = data
+			return
 
-		return data
\ No newline at end of file
+		old = self.volatile
+		if isinstance(data['freq'], (int, float)) and isinstance(old['freq'], (int, float)) \
+				and abs(data['freq'] - old['freq']) <= old['freq'] * self.FREQ_TOLERANCE:
+			data['freq'] = old['freq']
+		for i, used in data['disk'].items():
+			size = self.static['disk'][i]['size']
+			if i in old['disk'] and abs(used - old['disk'][i]) <= size * self.DISK_TOLERANCE:
+				data['disk'][i] = old['disk'][i]
+		self.volatile = data
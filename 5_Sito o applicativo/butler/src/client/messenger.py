@@ -1,5 +1,6 @@
 from common import log
 from common.requestSubmitter import RequestSubmitter
+from common.wireFormat import WireFormat
 
 class Messenger(RequestSubmitter):
 	"""
@@ -7,14 +8,18 @@ class Messenger(RequestSubmitter):
 	Estende da RequestSubmitter per usare alcune funzioni.
 	"""
 
-	def __init__(self, baseUrl, authCallback):
+	def __init__(self, baseUrl, authCallback, poolSize=RequestSubmitter.POOL_SIZE, retries=RequestSubmitter.RETRIES):
 		"""
 		Istanzia un oggetto Messenger per inviare richieste al server.
 		
 		:param url (str): la base dell'url (l'indirizzo del server) al quale connettersi.
 		:param authCallback (func): la funzione di callback per ritentare l'autenticazione.
+		:param poolSize (int, opzionale): il numero di connessioni mantenute aperte.
+			Default: RequestSubmitter.POOL_SIZE (4).
+		:param retries (int, opzionale): i tentativi aggiuntivi in caso di errore di connessione.
+			Default: RequestSubmitter.RETRIES (1).
 		"""
-		super().__init__(baseUrl, authCallback)
+		super().__init__(baseUrl, authCallback, poolSize=poolSize, retries=retries)
 
 	def authenticate(self, mac, addr, user, endpoint="/authenticate"):
 		"""
@@ -39,6 +44,7 @@ class Messenger(RequestSubmitter):
 		if response.ok and self.baseUrl != '':
 			self.headers['token'] = result['token']
 			self.headers['sub'] = user
+			self.set_encodings(result)
 			log.info('Connessione stabilita con "{}"'.format(self.baseUrl))
 		else:
 			result = result['message']
@@ -110,6 +116,8 @@ class Messenger(RequestSubmitter):
 		self.headers['token'] = ''
 		self.headers['sub'] = ''
 		self.baseUrl = ''
+		# le connessioni mantenute aperte non servono più
+		self.close()
 
 
 	"""
@@ -127,6 +135,9 @@ class Messenger(RequestSubmitter):
 			Default: "/details".
 		"""
 		url = self.baseUrl + endpoint
+		# i modelli sono inviati per colonne se il server lo accetta
+		if WireFormat.COLUMNAR in self.encodings:
+			details = self.wireFormat.pack(details)
 		payload = {'details': details}
 		response = self.request(self.PUT, url, payload)
 		return response.ok
@@ -0,0 +1,115 @@
+import socket
+from functools import lru_cache
+from os import getenv
+from os.path import join
+
+from common import log
+
+class ProtocolResolver():
+	"""
+	Questa classe traduce le porte nei nomi dei protocolli.
+	La tabella dei servizi del sistema è letta una volta sola e unita
+	ai protocolli personalizzati, così che ogni ricerca sia un accesso
+	ad un dizionario. Le porte non presenti nella tabella sono chieste
+	al sistema una sola volta e memorizzate in una cache limitata.
+	"""
+
+	UNKNOWN_PROTO = 'unknown'
+	ANY_TYPE = ''
+	TYPES = ['tcp', 'udp']
+	CACHE_SIZE = 1024
+
+	SERVICES_PATHS = [
+		'/etc/services',
+		join(getenv('SystemRoot', 'C:\\Windows'), 'System32', 'drivers', 'etc', 'services')]
+
+	def __init__(self, customProtocols={}):
+		"""
+		Istanzia un oggetto ProtocolResolver e carica la tabella dei protocolli.
+
+		:param customProtocols (dict, opzionale): i nomi dei protocolli
+				personalizzati, identificati dalla porta.
+			Default: {}.
+		"""
+		self.customProtocols = customProtocols
+		self.refresh()
+
+	def refresh(self, customProtocols=None):
+		"""
+		Ricarica la tabella dei servizi e svuota la cache delle porte sconosciute.
+		Va richiamata se la tabella del sistema o i protocolli personalizzati cambiano.
+
+		:param customProtocols (dict, opzionale): i nuovi protocolli personalizzati.
+				Se non è specificato, sono mantenuti quelli attuali.
+			Default: None.
+		"""
+		if customProtocols is not None:
+			self.customProtocols = customProtocols
+
+		# i protocolli personalizzati valgono per ogni tipo,
+		# ma quelli del sistema hanno la precedenza
+		self.protocols = {}
+		for port, name in self.customProtocols.items():
+			for type in self.TYPES + [self.ANY_TYPE]:
+				self.protocols[(int(port), type)] = name
+		self.protocols.update(self.load_services())
+
+		self.lookup = lru_cache(maxsize=self.CACHE_SIZE)(self.query_system)
+
+	def load_services(self):
+		"""
+		Legge la tabella dei servizi dal primo percorso esistente.
+		Il formato è quello standard: "nome porta/tipo [alias...] [# commento]".
+
+		:return: il dizionario dei nomi, identificati da porta e tipo.
+		"""
+		services = {}
+		for path in self.SERVICES_PATHS:
+			try:
+				with open(path, errors='ignore') as file:
+					for line in file:
+						fields = line.split('#')[0].split()
+						if len(fields) < 2 or '/' not in fields[1]:
+							continue
+						port, type = fields[1].split('/', 1)
+						if not port.isdigit():
+							continue
+						# come in getservbyport, vale la prima voce trovata
+						services.setdefault((int(port), type), fields[0])
+						services.setdefault((int(port), self.ANY_TYPE), fields[0])
+				log.info('Caricati {} protocolli da "{}"'.format(len(services), path))
+				break
+			except OSError:
+				continue
+		return services
+
+	def query_system(self, port, type):
+		"""
+		Chiede al sistema il nome di un protocollo non presente nella tabella.
+
+		:param port (int): la porta da cercare.
+		:param type (str): il tipo specifico (tcp/udp), oppure '' per qualunque tipo.
+
+		:return: il nome del protocollo se trovato, altrimenti None.
+		"""
+		try:
+			if type == self.ANY_TYPE:
+				return socket.getservbyport(port)
+			return socket.getservbyport(port, type)
+		except (OSError, OverflowError):
+			return None
+
+	def resolve(self, port, type=ANY_TYPE):
+		"""
+		Ricava il nome del protocollo in base alla porta passata.
+
+		:param port (int): la porta trovata.
+		:param type (str, opzionale): il tipo specifico (tcp/udp).
+			Default: ANY_TYPE ('').
+
+		:return: il nome del protocollo se trovato, altrimenti un valore di default.
+		"""
+		name = self.protocols.get((port, type))
+		if name is None:
+			name = self.lookup(port, type)
+		return name if name is not None else self.UNKNOWN_PROTO
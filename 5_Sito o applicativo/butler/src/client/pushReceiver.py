@@ -0,0 +1,130 @@
+import json
+import socket
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common import log
+
+class PushReceiver():
+	"""
+	Questa classe apre il canale persistente verso il server e ne esegue i comandi.
+	Il canale è una connessione TLS sulla quale il server invia i comandi
+	come righe JSON: ogni comando è eseguito dalla stessa API che riceve
+	le richieste HTTPS, quindi con lo stesso token e le stesse risposte.
+	Le risposte sono inviate sullo stesso canale.
+	Il server invia periodicamente una riga vuota: se per troppo tempo non arriva
+	nulla, la connessione è considerata interrotta e il canale viene chiuso,
+	così che possa essere riaperto.
+	"""
+
+	CONNECT_TIMEOUT = 5
+	KEEP_ALIVE = 15
+	# i messaggi del server che possono mancare prima di chiudere il canale
+	MISSED_KEEP_ALIVES = 3
+	WORKERS = 4
+
+	def __init__(self, ip, port, dispatchCallback, keepAlive=KEEP_ALIVE, workers=WORKERS):
+		"""
+		Istanzia un oggetto PushReceiver.
+
+		:param ip (str): l'ip del server.
+		:param port (int): la porta del canale del server.
+		:param dispatchCallback (func): la funzione che esegue un comando, dati metodo,
+			endpoint, header e dati, e ne ritorna lo stato e il contenuto della risposta.
+		:param keepAlive (int, opzionale): i secondi tra due verifiche della connessione
+				da parte del server (lo stesso valore della configurazione del server).
+			Default: KEEP_ALIVE (15).
+		:param workers (int, opzionale): il numero massimo di comandi eseguiti contemporaneamente.
+			Default: WORKERS (4).
+		"""
+		self.ip = ip
+		self.port = port
+		self.dispatchCallback = dispatchCallback
+		self.readTimeout = keepAlive * self.MISSED_KEEP_ALIVES
+		self.executor = ThreadPoolExecutor(max_workers=workers)
+		self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+		# come per le richieste HTTPS, il certificato del server non è verificato
+		self.context.check_hostname = False
+		self.context.verify_mode = ssl.CERT_NONE
+		self.sock = None
+		self.lock = threading.Lock()
+
+	def listen(self, token, sub, addr):
+		"""
+		Apre il canale ed esegue i comandi ricevuti finchè non viene chiuso.
+
+		:param token (str): il token ricevuto dal server all'autenticazione.
+		:param sub (str): il soggetto del token.
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+
+		:return: True se il canale è stato aperto, altrimenti False.
+		"""
+		try:
+			sock = socket.create_connection((self.ip, self.port), self.CONNECT_TIMEOUT)
+			self.sock = self.context.wrap_socket(sock)
+			stream = self.sock.makefile('rb')
+			self.write({'token': token, 'sub': sub, 'addr': addr})
+			if stream.readline().strip() != b'{"ok": true}':
+				log.warning('Apertura del canale verso {}:{} rifiutata'.format(self.ip, self.port))
+				return False
+			# tra un comando e l'altro arrivano almeno le verifiche del server
+			self.sock.settimeout(self.readTimeout)
+			log.info('Canale aperto verso {}:{}'.format(self.ip, self.port))
+			for line in stream:
+				if line.strip() == b'':
+					continue
+				self.executor.submit(self.execute, json.loads(line))
+			log.info('Canale verso {}:{} chiuso dal server'.format(self.ip, self.port))
+			return True
+		except socket.timeout:
+			log.warning('Nessun messaggio da {}:{} per {} secondi: il canale viene riaperto'.format(
+				self.ip, self.port, self.readTimeout))
+			return False
+		except (OSError, ValueError) as e:
+			log.warning('Canale verso {}:{} interrotto: {}'.format(self.ip, self.port, e.__str__()))
+			return False
+		finally:
+			self.close()
+
+	def execute(self, command):
+		"""
+		Esegue un comando e ne invia la risposta.
+
+		:param command (dict): il comando ricevuto.
+		"""
+		try:
+			status, body = self.dispatchCallback(
+				command['method'], command['endpoint'], command['headers'], command['data'])
+		except Exception as e:
+			log.warning('Errore nell\'esecuzione del comando {}: {}'.format(command['endpoint'], e.__str__()))
+			status, body = 500, {'message': 'Errore nell\'esecuzione del comando', 'error': e.__str__()}
+		try:
+			self.write({'id': command['id'], 'status': status, 'body': body})
+		except OSError as e:
+			log.warning('Risposta al comando {} non inviata: {}'.format(command['endpoint'], e.__str__()))
+
+	def write(self, message):
+		"""
+		Invia un messaggio sul canale.
+
+		:param message (dict): il messaggio da inviare.
+		"""
+		with self.lock:
+			if self.sock is None:
+				raise OSError('Canale chiuso')
+			self.sock.sendall(json.dumps(message).encode('UTF-8') + b'\n')
+
+	def close(self):
+		"""
+		Chiude il canale, se aperto.
+		"""
+		with self.lock:
+			if self.sock is not None:
+				try:
+					# sblocca anche la lettura in corso nel thread del canale
+					self.sock.shutdown(socket.SHUT_RDWR)
+				except OSError:
+					pass
+				self.sock.close()
+				self.sock = None
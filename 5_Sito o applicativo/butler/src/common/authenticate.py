@@ -1,9 +1,9 @@
 import json
-from authlib.jose import jwt
 import authlib.jose
-from flask import Flask, request
+from flask import Flask, request, g
 from functools import wraps
 
+from common.keyManager import KeyManager
 from common import log
 
 
@@ -18,12 +18,14 @@ class Authenticate():
 	SEE_OTHER = 303
 	INTERNAL_ERROR = 500
 
-	def __init__(self):
+	def __init__(self, expireTime):
 		"""
-		Istanzia un oggetto Authenticate inizializzando la chiave.
+		Istanzia un oggetto Authenticate inizializzando il gestore delle chiavi.
+
+		:param expireTime (int): la durata di validità dei token, in minuti.
 		"""
 		self.flask = Flask(__name__)
-		self.key = ''
+		self.keyManager = KeyManager(expireTime)
 
 	def token_required(self, caller, *args, **kwargs):
 		"""
@@ -57,7 +59,7 @@ class Authenticate():
 					}
 					log.warning('{}: {}'.format(returnData['error'], returnData['message']))
 					return self.standard_response(returnData, self.UNAUTHORIZED)
-				if self.key == '':
+				if not self.keyManager.ready():
 					returnData = {
 						'error': 'Chiave non inizializzata. Autenticazione mancante',
 						'message': 'Chiave di decodifica mancante',
@@ -82,9 +84,10 @@ class Authenticate():
 						'value': request.headers['sub']
 					}
 				}
-				claims = jwt.decode(token, self.key, claims_options=options)
-				claims.validate()
+				self.keyManager.verify(token, options)
 
+				# permette al resto della richiesta di sapere che è autenticata
+				g.authenticated = True
 				return caller()
 			except authlib.jose.errors.JoseError as e:
 				returnData = {
@@ -104,6 +107,30 @@ class Authenticate():
 			'''
 		return wrap
 
+	def is_valid(self, token, sub, claims={}):
+		"""
+		Verifica un token ricevuto al di fuori di una richiesta HTTP.
+
+		:param token (str): il token da verificare.
+		:param sub (str): il soggetto che il token deve contenere.
+		:param claims (dict, opzionale): altri dati che il token deve contenere,
+				con i valori attesi.
+			Default: {}.
+
+		:return: True se il token è valido, altrimenti False.
+		"""
+		if not self.keyManager.ready():
+			return False
+		options = {'sub': {'essential': True, 'value': sub}}
+		for name, value in claims.items():
+			options[name] = {'essential': True, 'value': value}
+		try:
+			self.keyManager.verify(token, options)
+			return True
+		except authlib.jose.errors.JoseError as e:
+			log.warning('{}: Token non valido'.format(e.__str__()))
+			return False
+
 	def standard_response(self, data={}, code=UNAUTHORIZED):
 		"""
 		Ritorna una risposta HTTP in base ai dati passati occupandosi di
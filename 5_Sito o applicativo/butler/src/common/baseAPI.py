@@ -1,13 +1,20 @@
 
 import json
-from authlib.jose import jwt
-from flask import Flask
-from Crypto.PublicKey import ECC
+from flask import Flask, request, g, has_request_context
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, UnsupportedMediaType
 import datetime
+import gzip
+import zlib
 from os.path import abspath, join
 import sys
+try:
+	import orjson
+except ImportError:
+	orjson = None
 
 from common.authenticate import Authenticate
+from common.wireFormat import WireFormat
+from common import log
 
 class BaseAPI():
 	"""
@@ -18,8 +25,24 @@ class BaseAPI():
 	UNAUTHORIZED = 401
 	FORBIDDEN = 403
 	BAD_METHOD = 405
+	CONFLICT = 409
+	# server HTTP usato per servire l'API: "werkzeug" (sviluppo) o "cheroot"
+	SERVING = {'backend': 'werkzeug'}
+	THREADS = 16
+	MAX_THREADS = 64
+	QUEUE_SIZE = 128
+	KEEP_ALIVE = 15
+	# le risposte più grandi (in byte) sono compresse, se il client lo accetta
+	GZIP_MIN_SIZE = 1024
+	GZIP_LEVEL = 3
+	# le risposte in streaming sono inviate a blocchi di questa dimensione (in byte),
+	# codificando separatamente i valori fino a questa profondità
+	STREAM_CHUNK = 65536
+	STREAM_DEPTH = 2
+	# gli elementi delle liste codificati insieme
+	STREAM_BATCH = 256
 
-	def __init__(self, ip, port, expireTime, sslConf, callbacks=[]):
+	def __init__(self, ip, port, expireTime, sslConf, callbacks=[], serving=SERVING):
 		"""
 		Istanzia un oggetto BaseAPI definendo ip e porta del server,
 		tempo di durata dei token e funzioni di callbacks.
@@ -28,12 +51,49 @@ class BaseAPI():
 		:param port (int): la porta dell'API.
 		:param expireTime (int): la durata di validità del token, in minuti.
 		:param callbacks (dict): il dizionario di funzioni di callback.
+		:param serving (dict, opzionale): il server HTTP da usare e la sua configurazione
+				(backend, threads, maxThreads, queueSize, keepAlive).
+			Default: SERVING ({'backend': 'werkzeug'}).
 		"""
 		self.ip = ip
 		self.port = port
 		self.expireTime = expireTime
 		self.sslConf = (abspath(join(sys.path[0],sslConf['certPath'])), abspath(join(sys.path[0],sslConf['keyPath'])))
 		self.callbacks = callbacks
+		self.serving = serving
+		self.wireFormat = WireFormat()
+		# i campi da esportare per ogni classe con __slots__
+		self.slotFields = {}
+
+	def get_body(self, request):
+		"""
+		Ricava il contenuto JSON della richiesta, decodificato una sola volta
+		per richiesta e poi letto dal contesto di Flask.
+		I corpi compressi con gzip sono decompressi, ma solo nelle richieste
+		già autenticate e fino a WireFormat.MAX_BODY_SIZE byte.
+		
+		:param request (flask.request): il contesto della richiesta ricevuta.
+		
+		:return: il contenuto decodificato, oppure None se la richiesta non contiene dati JSON.
+		"""
+		if 'body' not in g:
+			g.body = None
+			if request.is_json:
+				data = request.get_data()
+				if request.headers.get('Content-Encoding', '') == WireFormat.GZIP:
+					if 'authenticated' not in g:
+						raise UnsupportedMediaType('Corpi compressi accettati solo con un token valido')
+					try:
+						data = self.wireFormat.decompress(data)
+					except OverflowError as e:
+						raise RequestEntityTooLarge(e.__str__())
+					except ValueError as e:
+						raise BadRequest(e.__str__())
+				try:
+					g.body = orjson.loads(data) if orjson is not None else json.loads(data)
+				except ValueError as e:
+					raise BadRequest('Dati JSON non validi: {}'.format(e.__str__()))
+		return g.body
 
 	def get_json(self, request, key, default):
 		"""
@@ -47,82 +107,239 @@ class BaseAPI():
 		
 		:return: il contenuto del dizionario se presente, altrimenti il valore di default.
 		"""
-		if request.get_json() is not None:
-			return request.get_json()[key] if key in request.get_json() else default
+		body = self.get_body(request)
+		if type(body) == dict:
+			return body[key] if key in body else default
 		return default
 
+	def wants_columnar(self, request):
+		"""
+		Verifica se il client della richiesta accetta i modelli per colonne.
+		
+		:param request (flask.request): il contesto della richiesta ricevuta.
+		
+		:return: True se i modelli della risposta possono essere inviati per colonne.
+		"""
+		return request.headers.get(WireFormat.HEADER, '') == WireFormat.COLUMNAR
+
+	def obj_dict(self, obj):
+		"""
+		Funzione usata dal codificatore JSON come default per ricavare un valore valido
+		da oggetti complessi che non hanno una rappresentazione testuale.
+		
+		:param obj (obj): l'oggetto da convertire in stringa.
+		
+		:return: i valori della rappresentazione come dizionario dell'oggetto.
+			Date e orari sono convertiti nel formato ISO, come fa orjson.
+		"""
+		if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+			return obj.isoformat()
+		# gli oggetti con __slots__ si convertono come dizionari,
+		# leggendo direttamente i loro campi
+		if hasattr(obj, '__slots__'):
+			return {key: getattr(obj, key) for key in self.slot_fields(type(obj)) if hasattr(obj, key)}
+		if hasattr(obj, 'keys'):
+			return dict(obj)
+		return obj.__dict__ if hasattr(obj, '__dict__') else ''
+
+	def slot_fields(self, cls):
+		"""
+		Ricava i campi pubblici dichiarati in __slots__ da una classe e dalle classi da cui deriva.
+		I campi privati (con nome modificato in _Classe__campo) non sono esportati.
+		
+		:param cls (type): la classe dell'oggetto da convertire.
+		
+		:return: la lista dei nomi dei campi, nell'ordine di dichiarazione.
+		"""
+		if cls not in self.slotFields:
+			fields = []
+			for base in cls.__mro__:
+				slots = base.__dict__['__slots__'] if '__slots__' in base.__dict__ else ()
+				for key in [slots] if type(slots) == str else slots:
+					if not key.startswith('_') and key not in fields:
+						fields.append(key)
+			self.slotFields[cls] = fields
+		return self.slotFields[cls]
+
+	def dumps(self, data):
+		"""
+		Codifica dei dati in JSON, con orjson se installato.
+		
+		:param data (obj): i dati da codificare.
+		
+		:return: i dati codificati, in UTF-8.
+		"""
+		if orjson is not None:
+			try:
+				return orjson.dumps(data, default=self.obj_dict, option=orjson.OPT_NON_STR_KEYS)
+			except TypeError:
+				# valori non supportati da orjson (ad esempio interi oltre i 64 bit)
+				pass
+		return json.dumps(data, default=self.obj_dict).encode('UTF-8')
+
+	def iter_json(self, data, depth=STREAM_DEPTH):
+		"""
+		Codifica dei dati in JSON a pezzi, così che la risposta possa essere
+		inviata senza averla prima codificata interamente.
+		
+		:param data (obj): i dati da codificare.
+		:param depth (int, opzionale): fino a che profondità dizionari e liste
+				sono divisi nei loro valori (le liste a gruppi di STREAM_BATCH elementi).
+			Default: STREAM_DEPTH (2).
+		
+		:yield: i pezzi dei dati codificati, in UTF-8.
+		"""
+		if depth > 0 and type(data) == dict:
+			yield b'{'
+			separator = b''
+			for key, value in data.items():
+				yield separator + self.dumps(str(key)) + b':'
+				yield from self.iter_json(value, depth - 1)
+				separator = b','
+			yield b'}'
+		elif depth > 0 and type(data) in (list, tuple) and len(data) > 0:
+			# gli elementi sono codificati a gruppi, togliendo le parentesi di ogni gruppo
+			yield b'['
+			separator = b''
+			for i in range(0, len(data), self.STREAM_BATCH):
+				yield separator + self.dumps(list(data[i:i + self.STREAM_BATCH]))[1:-1]
+				separator = b','
+			yield b']'
+		else:
+			yield self.dumps(data)
+
+	def iter_chunks(self, pieces, compress):
+		"""
+		Raggruppa i pezzi di una risposta in blocchi di STREAM_CHUNK byte,
+		comprimendoli se richiesto.
+		
+		:param pieces (iter): i pezzi della risposta.
+		:param compress (bool): se True, i blocchi sono compressi con gzip.
+		
+		:yield: i blocchi della risposta.
+		"""
+		# wbits=31 produce il formato gzip, come gzip.compress
+		compressor = zlib.compressobj(self.GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+		chunk = []
+		size = 0
+		for piece in pieces:
+			chunk.append(piece)
+			size += len(piece)
+			if size >= self.STREAM_CHUNK:
+				data = b''.join(chunk)
+				chunk = []
+				size = 0
+				data = compressor.compress(data) if compress else data
+				if data != b'':
+					yield data
+		data = b''.join(chunk)
+		if compress:
+			data = compressor.compress(data) + compressor.flush()
+		if data != b'':
+			yield data
 
-	def standard_response(self, data={}, code=200):
+	def accepts_gzip(self):
+		"""
+		Verifica se il client della richiesta in corso accetta risposte compresse.
+		
+		:return: True se la risposta può essere compressa con gzip.
+		"""
+		return has_request_context() and 'gzip' in request.headers.get('Accept-Encoding', '')
+
+	def standard_response(self, data={}, code=200, stream=False):
 		"""
 		Ritorna una risposta HTTP in base ai dati passati occupandosi di
 		convertirli in una stringa JSON e allegandoli al codice di stato.
+		Le risposte grandi sono compresse con gzip se il client lo accetta.
 		
 		:param data (dict, opzionale): i dati da passare insieme alla risposta.
 			Default: {}.
 		:param code (int, opzionale): il codice HTTP, risultato dell'operazione.
 			Default: 200
+		:param stream (bool, opzionale): se True, la risposta è codificata
+				ed inviata a blocchi, adatto a dati di grandi dimensioni.
+			Default: False
 		"""
+		compress = self.accepts_gzip()
+		if stream:
+			body = self.iter_chunks(self.iter_json(data), compress)
+		else:
+			body = self.dumps(data)
+			compress = compress and len(body) >= self.GZIP_MIN_SIZE
+			if compress:
+				body = gzip.compress(body, self.GZIP_LEVEL)
 
-		def obj_dict(obj):
-			"""
-			Funzione usata da json.dumps come default per ricavare un valore valido
-			da oggetti complessi che non hanno una rappresentazione testuale.
-			Va definita nello stesso metodo della funzione json.dumps che la sfrutta,
-			altrimenti non viene rilevata.
-			
-			:param obj (obj): l'oggetto da convertire in stringa.
-			
-			:return: i valori della rappresentazione come dizionario dell'oggetto.
-			"""
-			return obj.__dict__ if hasattr(obj, '__dict__') else ''
-
-		return self.flask.response_class(
-			response=json.dumps(
-				data, default=obj_dict).encode('UTF-8'),
-			mimetype='application/json', status=code)
+		response = self.flask.response_class(
+			response=body, mimetype='application/json', status=code)
+		response.vary.add('Accept-Encoding')
+		if compress:
+			response.headers['Content-Encoding'] = 'gzip'
+		return response
 
-	def generate_keys(self):
+	def init_token(self, sub, claims={}):
 		"""
-		Genera la chiave pubblica e quella privata con l'algoritmo ECDSA
-		e la curva ellittica P-256.
+		Genera e ritorna un token firmato con la chiave attuale dell'autenticatore.
+		I token generati in precedenza restano validi fino alla loro scadenza.
+		Il soggetto è passato da ogni richiesta, dato che più autenticazioni
+		possono essere gestite contemporaneamente.
 		
-		:return: entrambe le chiavi generate.
-		"""
-		key = ECC.generate(curve='P-256')
-		publicKey = key.public_key()
-		public = publicKey.export_key(format='PEM')
-		private = key.export_key(format='PEM')
-		return public, private
-
-	def init_token(self):
-		"""
-		Inizializza l'autenticatore specificando i dati da usare per la decodifica
-		e il controllo dei token, che poi genera e ritorna.
+		:param sub (str): il soggetto del token (l'utente che si autentica).
+		:param claims (dict, opzionale): altri dati da includere nel token.
+			Default: {}.
 		
 		:return: il token JWT generato.
 		"""
-		publicKey, privateKey = self.generate_keys()
 		timeLimit = datetime.datetime.utcnow(
 		) + datetime.timedelta(minutes=self.expireTime)
 
-		self.auth.key = publicKey
-
 		# i parametri del payload sono issuer, subject, expiration time
-		payload = {'iss': self.ip, 'sub': self.sub, 'exp': timeLimit}
-		token = jwt.encode({'alg': 'ES256'}, payload, privateKey)
+		payload = {'iss': self.ip, 'sub': sub, 'exp': timeLimit}
+		payload.update(claims)
+		token = self.auth.keyManager.sign(payload)
 		return {
 			'token': token.decode(),
 			'expire': f'{timeLimit}',
-			'message': 'Autenticazione da parte di "{}" riuscita'.format(self.sub)
+			'message': 'Autenticazione da parte di "{}" riuscita'.format(sub),
+			# i formati compatti accettati, usati dal client solo se dichiarati
+			'encodings': WireFormat.ENCODINGS
 		}
 
 
+	def serve(self, **options):
+		"""
+		Avvia il server HTTP scelto nella configurazione, senza mai terminare.
+		Con il backend "cheroot" le richieste sono gestite da un gruppo di thread
+		che mantiene le connessioni aperte tra una richiesta e l'altra.
+		Se cheroot non è installato, viene usato il server di sviluppo di Flask.
+
+		:param options (dict): le opzioni aggiuntive per il server di sviluppo.
+		"""
+		if self.serving['backend'] == 'cheroot':
+			try:
+				from cheroot import wsgi
+				from cheroot.ssl.builtin import BuiltinSSLAdapter
+			except ImportError:
+				log.warning('Modulo cheroot non installato: avvio del server di sviluppo')
+			else:
+				server = wsgi.Server((self.ip, self.port), self.flask,
+					numthreads=self.serving['threads'] if 'threads' in self.serving else self.THREADS,
+					max=self.serving['maxThreads'] if 'maxThreads' in self.serving else self.MAX_THREADS,
+					request_queue_size=self.serving['queueSize'] if 'queueSize' in self.serving else self.QUEUE_SIZE,
+					timeout=self.serving['keepAlive'] if 'keepAlive' in self.serving else self.KEEP_ALIVE)
+				server.ssl_adapter = BuiltinSSLAdapter(*self.sslConf)
+				try:
+					server.start()
+				finally:
+					server.stop()
+				return
+		self.flask.run(host=self.ip, port=self.port, ssl_context=self.sslConf, threaded=True, **options)
+
 	def start_api(self):
 		"""
 		Avvia l'API definendo unicamente l'endpoint d'errore. 
 		"""
 		self.flask = Flask(__name__)
-		self.auth = Authenticate()
+		self.auth = Authenticate(self.expireTime)
 
 		@self.flask.errorhandler(404)
 		def page_not_found(e):
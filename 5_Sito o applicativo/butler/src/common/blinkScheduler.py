@@ -0,0 +1,105 @@
+from math import ceil
+from time import time
+
+class BlinkScheduler():
+	"""
+	Questa classe gestisce i lampeggiamenti di una finestra dalla stessa thread
+	che la esegue, senza threads dedicate.
+	Gli elementi da colorare sono raggruppati una sola volta per finestra:
+	ad ogni passo vengono applicati insieme tutti i lampeggiamenti scaduti,
+	con un solo aggiornamento per elemento, e il loop della finestra
+	attende solo fino al passo successivo.
+	"""
+
+	FOREGROUND = False
+	BACKGROUND = True
+	# la velocità minima (in secondi), per non occupare il loop della finestra
+	MIN_SPEED = 0.05
+
+	def __init__(self, window):
+		"""
+		Istanzia un oggetto BlinkScheduler senza lampeggiamenti.
+
+		:param window (sg.Window): la finestra con gli elementi ai quali cambiare colore.
+		"""
+		self.window = window
+		self.effects = []
+		self.texts = []
+		self.buttons = []
+
+	def add(self, type, firstColor, secondColor, speed):
+		"""
+		Aggiunge un lampeggiamento tra due colori.
+
+		:param type (bool): il tipo degli elementi (True = sfondo, False = testo e pulsanti).
+		:param firstColor (str): il colore di base degli elementi.
+		:param secondColor (str): il secondo colore degli elementi.
+		:param speed (float): la velocità di cambio del colore.
+		"""
+		self.effects.append({'type': type, 'colors': (firstColor, secondColor),
+			'speed': max(float(speed), self.MIN_SPEED), 'index': 0, 'next': 0})
+
+	def start(self):
+		"""
+		Raggruppa gli elementi da colorare e applica i colori di base.
+		Va richiamata dopo aver finalizzato la finestra.
+		"""
+		# gli elementi sono identificati grazie al "prefisso" delle loro chiavi
+		self.texts = [element for key, element in self.window.AllKeysDict.items()
+			if type(key) == str and key.startswith('-TEXT')]
+		self.buttons = [element for key, element in self.window.AllKeysDict.items()
+			if type(key) == str and key.startswith('-BUTTON')]
+		now = time()
+		for effect in self.effects:
+			effect['next'] = now
+		self.tick()
+
+	def timeout(self, default):
+		"""
+		Calcola quanto può attendere il loop della finestra prima del prossimo passo.
+
+		:param default (int): l'attesa massima, in millisecondi.
+
+		:return: l'attesa in millisecondi.
+		"""
+		if self.effects == []:
+			return default
+		wait = min([effect['next'] for effect in self.effects]) - time()
+		# arrotondato per eccesso, così da non risvegliare il loop prima del passo
+		return max(0, min(default, ceil(wait * 1000)))
+
+	def tick(self):
+		"""
+		Applica tutti i lampeggiamenti scaduti con un solo aggiornamento per elemento.
+		"""
+		now = time()
+		colors = {}
+		for effect in self.effects:
+			if effect['next'] > now:
+				continue
+			colors[effect['type']] = effect['colors'][effect['index']]
+			effect['index'] = 1 - effect['index']
+			# un passo in ritardo non ne recupera altri
+			effect['next'] = max(effect['next'] + effect['speed'], now)
+		if colors == {}:
+			return
+		foreground = colors.get(self.FOREGROUND)
+		background = colors.get(self.BACKGROUND)
+
+		for element in self.texts:
+			options = {}
+			if foreground is not None:
+				options['text_color'] = foreground
+			if background is not None:
+				options['background_color'] = background
+			element.update(**options)
+		for element in self.buttons:
+			element.update(button_color=(
+				foreground if foreground is not None else element.ButtonColor[0],
+				background if background is not None else element.ButtonColor[1]))
+		if background is not None:
+			if hasattr(self.window.TKroot, 'configure'):
+				self.window.TKroot.configure(background=background, bg=background)
+			else:
+				self.window.BackgroundColor = background
+				self.window.refresh()
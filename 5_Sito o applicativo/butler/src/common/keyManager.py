@@ -0,0 +1,137 @@
+import threading
+from time import time
+from uuid import uuid4
+from authlib.jose import jwt, JsonWebKey
+from authlib.jose.errors import DecodeError
+from Crypto.PublicKey import ECC
+
+from common.lruCache import LRUCache
+from common import log
+
+class KeyManager():
+	"""
+	Questa classe gestisce le chiavi usate per firmare e verificare i token JWT.
+	La chiave di firma viene generata una sola volta e sostituita solo
+	periodicamente: ogni token indica nell'header ("kid") la chiave con la
+	quale è stato firmato, così che i token già distribuiti restino validi
+	fino alla loro scadenza anche dopo la sostituzione.
+	Le chiavi sono mantenute come oggetti già pronti all'uso, e i token
+	già verificati sono memorizzati per un breve periodo.
+	"""
+
+	ALGORITHM = 'ES256'
+	CURVE = 'P-256'
+	# secondi di validità di un token già verificato
+	TOKEN_CACHE_TTL = 30
+	TOKEN_CACHE_SIZE = 4096
+
+	def __init__(self, expireTime, rotation=None):
+		"""
+		Istanzia un oggetto KeyManager senza chiavi: la prima è generata
+		alla prima firma.
+
+		:param expireTime (int): la durata di validità dei token, in minuti.
+		:param rotation (int, opzionale): i secondi dopo i quali la chiave di firma
+				viene sostituita. Se non è specificato, vale la durata dei token.
+			Default: None.
+		"""
+		self.expireTime = expireTime * 60
+		self.rotation = rotation if rotation is not None else self.expireTime
+		# chiavi per kid: (chiave privata, chiave pubblica, data di creazione)
+		self.keys = {}
+		self.kid = None
+		self.tokens = LRUCache(self.TOKEN_CACHE_SIZE)
+		self.lock = threading.Lock()
+
+	def ready(self):
+		"""
+		Verifica che sia già stata generata una chiave.
+
+		:return: True se esiste almeno una chiave.
+		"""
+		return self.kid is not None
+
+	def generate_key(self):
+		"""
+		Genera una nuova coppia di chiavi con l'algoritmo ECDSA
+		e la curva ellittica P-256.
+
+		:return: la chiave privata e quella pubblica, già importate.
+		"""
+		key = ECC.generate(curve=self.CURVE)
+		private = JsonWebKey.import_key(key.export_key(format='PEM'), {'kty': 'EC'})
+		public = JsonWebKey.import_key(key.public_key().export_key(format='PEM'), {'kty': 'EC'})
+		return private, public
+
+	def get_signing_key(self):
+		"""
+		Ricava la chiave di firma attuale, sostituendola se è troppo vecchia.
+		Le chiavi che non possono più aver firmato token validi sono eliminate.
+
+		:return: l'identificativo e la chiave privata da usare.
+		"""
+		with self.lock:
+			now = time()
+			if self.kid is None or now - self.keys[self.kid][2] >= self.rotation:
+				private, public = self.generate_key()
+				self.kid = uuid4().hex
+				self.keys[self.kid] = (private, public, now)
+				log.info('Nuova chiave di firma dei token: {}'.format(self.kid))
+				# una chiave sostituita da più della durata di un token non serve più
+				for kid in [k for k in self.keys if now - self.keys[k][2] >= self.rotation + self.expireTime]:
+					del self.keys[kid]
+			return self.kid, self.keys[self.kid][0]
+
+	def sign(self, payload):
+		"""
+		Firma un token con la chiave attuale.
+
+		:param payload (dict): i dati del token.
+
+		:return: il token firmato.
+		"""
+		kid, key = self.get_signing_key()
+		return jwt.encode({'alg': self.ALGORITHM, 'kid': kid}, payload, key)
+
+	def load_key(self, header, payload):
+		"""
+		Ricava la chiave pubblica indicata nell'header di un token.
+		È passata a jwt.decode al posto della chiave.
+
+		:param header (dict): l'header del token.
+		:param payload (dict): i dati del token.
+
+		:return: la chiave pubblica.
+		"""
+		kid = header['kid'] if 'kid' in header else None
+		with self.lock:
+			if kid not in self.keys:
+				raise DecodeError('Chiave "{}" sconosciuta o scaduta'.format(kid))
+			return self.keys[kid][1]
+
+	def verify(self, token, options={}):
+		"""
+		Decodifica e verifica un token.
+		I token già verificati con le stesse opzioni sono accettati senza
+		ripetere la verifica della firma, fino alla loro scadenza.
+
+		:param token (str): il token da verificare.
+		:param options (dict, opzionale): le opzioni di verifica dei dati del token.
+			Default: {}.
+
+		:return: i dati del token.
+		"""
+		now = time()
+		key = (token, repr(options))
+		cached = self.tokens.get(key)
+		if cached is not None and now < cached[0]:
+			return cached[1]
+
+		claims = jwt.decode(token, self.load_key, claims_options=options)
+		claims.validate()
+		# la verifica è ripetuta almeno ogni TOKEN_CACHE_TTL secondi e mai dopo la scadenza
+		expire = now + self.TOKEN_CACHE_TTL
+		if 'exp' in claims:
+			expire = min(expire, claims['exp'])
+		self.tokens.set(key, (expire, claims))
+		return claims
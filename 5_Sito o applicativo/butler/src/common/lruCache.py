@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache():
+	"""
+	Questa classe rappresenta una cache di dimensione limitata:
+	quando è piena, viene rimosso l'elemento usato meno di recente.
+	Può essere usata da più thread contemporaneamente.
+	"""
+
+	SIZE = 64
+
+	def __init__(self, size=SIZE):
+		"""
+		Istanzia un oggetto LRUCache vuoto.
+
+		:param size (int, opzionale): il numero massimo di elementi.
+			Default: SIZE (64).
+		"""
+		self.size = size
+		self.data = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key, default=None):
+		"""
+		Ricava un elemento segnandolo come usato di recente.
+
+		:param key (hashable): la chiave dell'elemento.
+		:param default (any, opzionale): il valore da ritornare se la chiave non è presente.
+			Default: None.
+
+		:return: il valore memorizzato, altrimenti il valore di default.
+		"""
+		with self.lock:
+			if key not in self.data:
+				return default
+			self.data.move_to_end(key)
+			return self.data[key]
+
+	def set(self, key, value):
+		"""
+		Memorizza un elemento, rimuovendo il meno recente se la cache è piena.
+
+		:param key (hashable): la chiave dell'elemento.
+		:param value (any): il valore da memorizzare.
+		"""
+		with self.lock:
+			self.data[key] = value
+			self.data.move_to_end(key)
+			while len(self.data) > self.size:
+				self.data.popitem(last=False)
+
+	def remove(self, match):
+		"""
+		Rimuove gli elementi le cui chiavi soddisfano una condizione.
+
+		:param match (func): la funzione che riceve una chiave e ritorna
+			True se l'elemento deve essere rimosso.
+
+		:return: il numero di elementi rimossi.
+		"""
+		with self.lock:
+			keys = [key for key in self.data if match(key)]
+			for key in keys:
+				del self.data[key]
+			return len(keys)
+
+	def clear(self):
+		"""
+		Svuota la cache.
+		"""
+		with self.lock:
+			self.data.clear()
@@ -3,7 +3,8 @@ import PySimpleGUIWeb as web_gui
 from PySimpleGUI.PySimpleGUI import WIN_CLOSED
 from plyer import notification
 import threading
-from time import sleep
+import queue
+from time import sleep, time
 import base64
 import binascii
 from io import BytesIO
@@ -13,6 +14,8 @@ import sys
 from os.path import abspath, join, exists
 
 from common import log
+from common.lruCache import LRUCache
+from common.blinkScheduler import BlinkScheduler
 
 class NotificationBuilder():
 	"""
@@ -25,9 +28,15 @@ class NotificationBuilder():
 	anche questi parzialmente gestiti dalla presente classe.
 	"""
 
-	FOREGROUND = False
-	BACKGROUND = True
 	MIN_SIZE = 20
+	IMAGE_CACHE_SIZE = 8
+	# la lettura della finestra termina subito ad ogni evento o interruzione:
+	# il timeout serve solo alle finestre che non possono essere risvegliate
+	READ_TIMEOUT = 1000
+	INTERRUPT_EVENT = '-INTERRUPT-'
+	UPDATE_EVENT = '-UPDATE-'
+	# il tempo massimo (in secondi) tra la ricezione e la comparsa di una notifica
+	MAX_LATENCY = 0.5
 
 	def __init__(self, port='', scriptManager='', callback='', imagesPath='', logoPath='', testing=False):
 		"""
@@ -61,19 +70,48 @@ class NotificationBuilder():
 		self.imagesPath = imagesPath
 		self.logoPath = logoPath
 		self.windowReady = False
-		self.textBlink = threading.Thread()
-		self.bgBlink = threading.Thread()
 		self.scriptThread = threading.Thread()
 		self.testing = testing
 		self.activeWindow = False
-
-	def get_image(self, image):
+		# immagini già convertite, identificate dall'hash inviato dal server
+		self.imageCache = LRUCache(self.IMAGE_CACHE_SIZE)
+		# la finestra in esecuzione e la data di ricezione della notifica da mostrare
+		self.window = None
+		self.received = None
+		# impostato alla comparsa di ogni finestra, con il tempo impiegato
+		self.displayed = threading.Event()
+		self.latency = None
+		# aggiornamenti degli elementi richiesti dalle altre threads
+		self.updates = queue.Queue()
+
+	def get_image(self, image, imageHash=''):
 		"""
 		Interpreta il parametro image definendo se si tratta di dati base64
 		oppure di un percorso locale/di rete.
+		Se il server ha allegato l'hash dell'immagine, il risultato viene
+		memorizzato e riutilizzato per le notifiche successive.
 		
 		:param image (str): i dati dell'immagine.
+		:param imageHash (str, opzionale): l'hash dei dati dell'immagine.
+			Default: ''.
 		
+		:return: i dati base64 dell'immagine se valida, altrimenti ''.
+		"""
+		if imageHash == '':
+			return self.load_image(image)
+		data = self.imageCache.get(imageHash)
+		if data is None:
+			data = self.load_image(image)
+			if data != '':
+				self.imageCache.set(imageHash, data)
+		return data
+
+	def load_image(self, image):
+		"""
+		Decodifica l'immagine, leggendola dal percorso se necessario.
+
+		:param image (str): i dati o il percorso dell'immagine.
+
 		:return: i dati base64 dell'immagine se valida, altrimenti ''.
 		"""
 		try:
@@ -119,8 +157,8 @@ class NotificationBuilder():
 		:param data (dict, str): i dati della finestra. Possono essere un dizionario
 			oppure una stringa contente JSON valido.
 		
-		:return: l'oggetto generato della finestra, le thread di lampeggiamento
-			del testo e dello sfondo e la thread per eseguire lo script.
+		:return: l'oggetto generato della finestra, i lampeggiamenti di testo
+			e sfondo, la thread di chiusura e la thread per eseguire lo script.
 		"""
 		try:
 			# tenta l'eventuale conversione in dizionario
@@ -200,10 +238,11 @@ class NotificationBuilder():
 									 text=text['message'])])
 
 		if self.valid_val(['image'], style):
-			style['image'] = self.get_image(style['image'])
+			imageHash = style['imageHash'] if 'imageHash' in style else ''
+			style['image'] = self.get_image(style['image'], imageHash)
 			if style['image'] != '':
 				elements.append(
-					[sg.Image(key="-IMAGE-", data=self.get_image(style['image']))])
+					[sg.Image(key="-IMAGE-", data=style['image'])])
 		inputs = []
 		if self.valid_val(['buttonText'], interactivity):
 			inputs.append(sg.Button(
@@ -230,35 +269,32 @@ class NotificationBuilder():
 						   grab_anywhere=self.valid_val(['canMove'], interactivity) and interactivity['canMove'],
 						   element_justification='c')
 
-		textBlink = ''
-		bgBlink = ''
+		blinks = BlinkScheduler(window)
 		closeThread = ''
 
-		
+		# i lampeggiamenti sono eseguiti dal loop della finestra
 		if self.valid_val(['secondTextColor', 'blinkSpeed'], text):
-			textBlink = threading.Thread(target=self.blink, args=[
-				window, self.FOREGROUND, text['textColor'], text['secondTextColor'],
-				text['blinkSpeed']], daemon=True)
+			blinks.add(BlinkScheduler.FOREGROUND, text['textColor'], text['secondTextColor'],
+				text['blinkSpeed'])
 
 		if self.valid_val(['secondBgColor', 'blinkSpeed'], style):
-			bgBlink = threading.Thread(target=self.blink, args=[
-				window, self.BACKGROUND, style['bgColor'], style['secondBgColor'],
-				style['blinkSpeed']], daemon=True)
+			blinks.add(BlinkScheduler.BACKGROUND, style['bgColor'], style['secondBgColor'],
+				style['blinkSpeed'])
 
 		if self.valid_val(['timer'], interactivity) and self.port == '':
 			closeThread = threading.Thread(target=self.plan_close, args=[interactivity['timer']])
 
 		self.windowReady = True
-		return window, textBlink, bgBlink, closeThread, scriptThread
+		return window, blinks, closeThread, scriptThread
 
-	def run_window(self, window, textBlink='', bgBlink='', closeThread='', scriptThread=''):
+	def run_window(self, window, blinks='', closeThread='', scriptThread=''):
 		"""
 		Prepara ed eseguela finestra e le threads allegate,
 		
 		:param window (sg.Window): la finestra da avviare.
-		:param textBlink (Thread, opzionale): la thread per il lampeggiamento del testo.
+		:param blinks (BlinkScheduler, opzionale): i lampeggiamenti di testo e sfondo.
 			Default: ''.
-		:param bgBlink (Thread, opzionale): la thread per il lampeggiamento dello sfondo.
+		:param closeThread (Thread, opzionale): la thread per la chiusura automatica.
 			Default: ''.
 		:param scriptThread (str, opzionale): la thread per l'esecuzione dello script,
 				eseguito in modo asincrono per non bloccare il resto del programma.
@@ -272,6 +308,7 @@ class NotificationBuilder():
 		if self.data['osType']:
 			log.warning('Avvio della notifica di sistema "{}"'.format(self.name))
 			notification.notify(*window)
+			self.shown()
 			return
 		blocking = self.data['interactivity']['blocking'] and not self.testing
 
@@ -292,6 +329,7 @@ class NotificationBuilder():
 			# usando la finestra come modal, è possibile disgnare quella sottostante
 			# e simulare l'attributo "bloccate"
 			window.make_modal()
+		self.shown()
 
 		created = False
 		backgroundWindow = ''
@@ -304,13 +342,13 @@ class NotificationBuilder():
 			return
 			
 		self.activeWindow = True
+		self.window = window
+		# gli aggiornamenti richiesti per una finestra precedente non sono applicati
+		self.apply_updates(None)
 
-		if textBlink != '':
-			self.textBlink = textBlink
-			self.textBlink.start()
-		if bgBlink != '':
-			self.bgBlink = bgBlink
-			self.bgBlink.start()
+		if blinks == '':
+			blinks = BlinkScheduler(window)
+		blinks.start()
 		if closeThread != '':
 			closeThread.start()
 		if scriptThread != '' and self.port == '':
@@ -320,7 +358,10 @@ class NotificationBuilder():
 			# per evitare che multiple finestre web interferiscano,
 			# l'attributo è riassegnato ad ogni ciclo
 			self.activeWindow = True
-			event, values = window.read(500)
+			# la lettura termina al più tardi al prossimo passo dei lampeggiamenti
+			event, values = window.read(blinks.timeout(self.READ_TIMEOUT))
+			blinks.tick()
+			self.apply_updates(window)
 			if self.port == '':
 				# crea la finestra trasparente a tutto schermo per simulare un
 				# blocco del computer
@@ -347,65 +388,13 @@ class NotificationBuilder():
 					log.warning('Chiusura della finestra "{}"'.format(self.name))
 					break
 				
+		self.window = None
 		if self.port == '':
 			window.close()
 		self.activeWindow = False
 		if backgroundEvent is not None and backgroundWindow is not None and hasattr(backgroundWindow, 'close'):
 			backgroundWindow.close()
 
-	def blink(self, window, type, firstColor, secondColor, speed):
-		"""
-		Cambia periodicamente colore a degli elementi della finestra in base
-		ai parametri.
-		
-		:param window (sg.Window): la finestra con gli elementi ai quali cambiare colore.
-		:param type (bool): il tipo degli elementi (True = sfondo, False = testo e pulsanti).
-		:param firstColor (str): il colore di base degli elementi.
-		:param secondColor (str): il secondo colore degli elementi.
-		:param speed (float): la velocità di cambio del colore.
-		"""
-		speed = float(speed)
-		try:
-			color = firstColor
-			while not self.interrupt:
-				self.update_style(window, type, color)
-				color = firstColor if color == secondColor else secondColor
-				sleep(speed)
-				
-		except RuntimeError as e:
-			# PySimpleGUI solleva degli errori non gravi se lo stile degli
-			# elementi viene cambiato al di fuori della thread principale
-			pass
-
-	def update_style(self, window, type, color):
-		"""
-		Itera tra gli elementi e ne cambia il colore in base ai parametri.
-		
-		:param window (sg.Window): la finestra con gli elementi ai quali cambiare colore.
-		:param type (bool): il tipo degli elementi (True = sfondo, False = testo e pulsanti).
-		:param color (str): il colore da impostare.
-		"""
-		if type == self.FOREGROUND:
-			for key, element in window.AllKeysDict.items():
-				# gli elementi sono identificati grazie al "prefisso" delle loro chiavi
-				if key.startswith('-TEXT'):
-					element.update(text_color=color)
-				elif key.startswith('-BUTTON'):
-					element.update(
-						button_color=(color, element.ButtonColor[1]))
-		elif type == self.BACKGROUND:
-			for key, element in window.AllKeysDict.items():
-				if key.startswith('-TEXT'):
-					element.update(background_color=color)
-				elif key.startswith('-BUTTON'):
-					element.update(
-						button_color=(element.ButtonColor[0], color))
-				if hasattr(window.TKroot, 'configure'):
-					window.TKroot.configure(background=color, bg=color)
-				else:
-					window.BackgroundColor = color
-					window.refresh()
-
 	def plan_close(self, timer):
 		"""
 		Attende alcuni secondi prima di inviare automaticamente il comando di
@@ -416,12 +405,12 @@ class NotificationBuilder():
 		try:
 			timer = int(timer)
 			sleep(timer)
-			self.interrupt = True
+			self.wake()
 		except ValueError:
 			log.warning('Valore del timer "{}" non valido')
 			pass
 
-	def show_window(self, data, port=None):
+	def show_window(self, data, port=None, received=None):
 		"""
 		Gestisce la creazione e l'avvio della finestra.
 		
@@ -429,6 +418,9 @@ class NotificationBuilder():
 		:param port (int, opzionale): la porta web della finestra.
 				Se non è impostata, viene tenuta quella precedente (se presente).
 			Default: None.
+		:param received (float, opzionale): la data di ricezione della notifica,
+				usata per misurare il tempo necessario a mostrarla.
+			Default: None.
 		"""
 		self.stop()
 		if self.activeWindow:
@@ -445,9 +437,81 @@ class NotificationBuilder():
 			self.port = port
 		
 		# crea e avvia la finestra
+		self.received = received
 		self.run_window(*self.get_window(data))
 		self.stop()
 
+	def shown(self):
+		"""
+		Registra la comparsa della notifica, segnalando se è avvenuta
+		oltre il tempo massimo dalla sua ricezione.
+		"""
+		self.displayed.set()
+		if self.received is None:
+			return
+		latency = time() - self.received
+		self.latency = latency
+		self.received = None
+		if latency > self.MAX_LATENCY:
+			log.warning('Notifica "{}" mostrata dopo {:.0f} ms (massimo {:.0f} ms)'.format(
+				self.name, latency * 1000, self.MAX_LATENCY * 1000))
+		else:
+			log.info('Notifica "{}" mostrata dopo {:.0f} ms'.format(self.name, latency * 1000))
+
+	def wake(self):
+		"""
+		Imposta l'interruzione della finestra e ne risveglia la lettura,
+		così che venga chiusa subito. Può essere richiamata da qualunque thread.
+		"""
+		self.interrupt = True
+		self.post_event(self.INTERRUPT_EVENT)
+
+	def post_event(self, event):
+		"""
+		Invia un evento alla finestra in esecuzione, risvegliandone la lettura.
+		Le finestre che non possono ricevere eventi da altri thread
+		si accorgono delle modifiche entro READ_TIMEOUT millisecondi.
+
+		:param event (str): l'evento da inviare.
+		"""
+		window = self.window
+		# solo le finestre desktop possono ricevere eventi da altri thread
+		if window is not None and hasattr(window, 'write_event_value'):
+			try:
+				window.write_event_value(event, None)
+			except Exception:
+				pass
+
+	def update_elements(self, updates):
+		"""
+		Richiede l'aggiornamento di alcuni elementi della finestra in esecuzione,
+		applicato dal suo loop. Può essere richiamata da qualunque thread.
+
+		:param updates (dict): le opzioni da aggiornare per chiave dell'elemento.
+
+		:return: l'evento (threading.Event) impostato quando l'aggiornamento è applicato.
+		"""
+		applied = threading.Event()
+		self.updates.put((updates, applied))
+		self.post_event(self.UPDATE_EVENT)
+		return applied
+
+	def apply_updates(self, window):
+		"""
+		Applica gli aggiornamenti richiesti agli elementi della finestra.
+		Va richiamata dalla thread della finestra.
+
+		:param window (sg.Window): la finestra da aggiornare. Se è None,
+			gli aggiornamenti sono scartati.
+		"""
+		while not self.updates.empty():
+			updates, applied = self.updates.get()
+			if window is not None:
+				for key, options in updates.items():
+					if key in window.AllKeysDict:
+						window[key].update(**options)
+			applied.set()
+
 	def stop(self, name=''):
 		"""
 		Gestisce la procedura di chiusua di tutte le threads e della finestra.
@@ -458,17 +522,7 @@ class NotificationBuilder():
 		# interrompe solo se il nome corrisponde, se non è specificato
 		# oppure se non è già in corso un'interruzione
 		if (name == '' or self.name == name) and not (self.interrupt and self.activeWindow):
-			self.interrupt = True
-			# ogni thread potrebbe non essere stata specificata, quindi servono
-			# molteplici controlli per assicurare la fine di tutte
-			try:
-				self.textBlink.join()
-			except Exception as e:
-				pass
-			try:
-				self.bgBlink.join()
-			except Exception as e:
-				pass
+			self.wake()
 
 	def get_themes(self):
 		"""
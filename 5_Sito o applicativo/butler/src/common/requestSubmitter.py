@@ -1,7 +1,11 @@
+import json
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from common.failedRequest import FailedRequest
+from common.wireFormat import WireFormat
 from common import log
 
 class RequestSubmitter():
@@ -18,13 +22,18 @@ class RequestSubmitter():
 	NOT_ALLOWED = 405
 
 	REQUEST_TIMEOUT = 3
+	POOL_SIZE = 4
+	RETRIES = 1
+	RETRY_BACKOFF = 0.2
 
 	baseUrl = ''
 	headers = {"Accept": "application/json"}
 
-	def __init__(self, baseUrl, authCallback, headers=headers):
+	def __init__(self, baseUrl, authCallback, headers=headers, poolSize=POOL_SIZE, retries=RETRIES):
 		"""
 		Inizializza un oggetto RequestSubmitter definendone l'url di base.
+		Le richieste passano da una sessione propria dell'oggetto, così che
+		le connessioni (e l'handshake TLS) verso la destinazione siano riutilizzate.
 
 		:param url (str): la base dell'url (cioè l'indirizzo del server senza parametri).
 		:param authCallback (func): la funzione per la riautenticazione
@@ -32,12 +41,73 @@ class RequestSubmitter():
 		:param headers (dict): i parametri di default dell'header.
 				Permette di collegarsi all'attributo della classe figlio, se necessario.
 			Default: headers
+		:param poolSize (int, opzionale): il numero di connessioni mantenute aperte.
+			Default: POOL_SIZE (4).
+		:param retries (int, opzionale): i tentativi aggiuntivi in caso di errore di connessione.
+			Default: RETRIES (1).
 		"""
 		self.baseUrl = baseUrl
 		self.authCallback = authCallback
 		self.headers = headers
+		# i formati compatti dichiarati dalla destinazione all'autenticazione
+		self.encodings = []
+		self.wireFormat = WireFormat()
 		urllib3.disable_warnings()
 		requests.trust_env = False
+		self.session = self.create_session(poolSize, retries)
+
+	def create_session(self, poolSize=POOL_SIZE, retries=RETRIES):
+		"""
+		Crea la sessione con un pool di connessioni persistenti.
+		Sono ritentati solo gli errori di connessione, che avvengono prima
+		dell'invio dei dati: una richiesta già ricevuta non è mai ripetuta.
+
+		:param poolSize (int, opzionale): il numero di connessioni mantenute aperte.
+			Default: POOL_SIZE (4).
+		:param retries (int, opzionale): i tentativi aggiuntivi in caso di errore di connessione.
+			Default: RETRIES (1).
+
+		:return: la sessione da usare per le richieste.
+		"""
+		session = requests.Session()
+		session.trust_env = False
+		session.verify = False
+		retry = Retry(total=retries, connect=retries, read=False, status=False,
+			redirect=False, backoff_factor=self.RETRY_BACKOFF)
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize, max_retries=retry)
+		session.mount('http://', adapter)
+		session.mount('https://', adapter)
+		return session
+
+	def close(self):
+		"""
+		Chiude le connessioni aperte dalla sessione.
+		"""
+		self.session.close()
+
+	def set_encodings(self, result):
+		"""
+		Salva i formati compatti dichiarati dalla destinazione nella risposta
+		all'autenticazione. Le destinazioni che non li dichiarano ricevono JSON normale.
+
+		:param result (dict): la risposta all'autenticazione.
+		"""
+		encodings = result['encodings'] if 'encodings' in result else []
+		self.encodings = [e for e in encodings if e in WireFormat.ENCODINGS]
+
+	def request_headers(self):
+		"""
+		Crea gli header di una richiesta a partire da quelli di default.
+		I default possono essere condivisi con altri oggetti, quindi non sono mai
+		modificati: i formati compatti di questo oggetto sono aggiunti ad una copia.
+
+		:return: gli header da inviare.
+		"""
+		headers = dict(self.headers)
+		# le risposte per colonne sono richieste con un header
+		if WireFormat.COLUMNAR in self.encodings:
+			headers[WireFormat.HEADER] = WireFormat.COLUMNAR
+		return headers
 
 	def request(self, method=GET, url='', data={}):
 		"""
@@ -69,8 +139,10 @@ class RequestSubmitter():
 		Permette l'invio dei quattro tipi di richieste più comuni in base ad un
 		parametro al posto di usare funzioni diverse come requests,
 		e gestisce diversi possibili errori di comunicazione.
+		Le connessioni della sessione sono mantenute aperte tra una richiesta e l'altra.
 		Tutti i dati sono inviati come JSON, e anche la risposta usa questo formato:
 		gli altri tipi sono considerati non validi e sollevano un errore.
+		Se la destinazione lo accetta, i corpi grandi sono compressi con gzip.
 		
 		:param method (str, opzionale): una stringa identificativa del metodo da usare.
 			Default: GET
@@ -84,18 +156,17 @@ class RequestSubmitter():
 			oggetto FailedRequest con le informazioni sull'errore. 
 		"""
 		try:
-			if method == self.GET:
-				resp = requests.get(
-					url, headers=self.headers, json=data, verify=False, timeout=self.REQUEST_TIMEOUT)
-			elif method == self.POST:
-				resp = requests.post(
-					url, headers=self.headers, json=data, verify=False, timeout=self.REQUEST_TIMEOUT)
-			elif method == self.PUT:
-				resp = requests.put(
-					url, headers=self.headers, json=data, verify=False, timeout=self.REQUEST_TIMEOUT)
-			elif method == self.DELETE:
-				resp = requests.delete(
-					url, headers=self.headers, json=data, verify=False, timeout=self.REQUEST_TIMEOUT)
+			headers = self.request_headers()
+			if method in [self.GET, self.POST, self.PUT, self.DELETE] and WireFormat.GZIP in self.encodings:
+				body, compressed = self.wireFormat.compress(json.dumps(data, separators=(',', ':')).encode('UTF-8'))
+				headers['Content-Type'] = 'application/json'
+				if compressed:
+					headers['Content-Encoding'] = WireFormat.GZIP
+				resp = self.session.request(
+					method, url, headers=headers, data=body, timeout=self.REQUEST_TIMEOUT)
+			elif method in [self.GET, self.POST, self.PUT, self.DELETE]:
+				resp = self.session.request(
+					method, url, headers=headers, json=data, timeout=self.REQUEST_TIMEOUT)
 			else:
 				return FailedRequest(message="Metodo non supportato: {}".format(method), error='Il metodo della richiesta non è tra quelli supportati')
 			return self.valid_json(resp)
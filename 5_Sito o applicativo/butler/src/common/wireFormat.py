@@ -0,0 +1,132 @@
+import gzip
+import zlib
+
+class WireFormat():
+	"""
+	Questa classe converte i dettagli scambiati tra Butlers e server
+	in un formato più compatto.
+	Le liste di connessioni del modello sono inviate per colonne: i nomi dei campi
+	sono scritti una sola volta e i valori ripetuti di ogni campo sono vicini,
+	quindi si comprimono meglio. I corpi delle richieste possono inoltre
+	essere compressi con gzip.
+	Entrambi i formati sono usati solo se l'altro host li ha dichiarati
+	nella risposta all'autenticazione: gli host precedenti ricevono i dati
+	nel formato JSON normale.
+
+	Il formato di un modello per colonne è:
+	{'fields': ['proc', 'status', ...], 'columns': [['proc1', 'proc2', ...], ['LISTEN', ...], ...]}
+	"""
+
+	COLUMNAR = 'columnar'
+	GZIP = 'gzip'
+	# i formati supportati, dichiarati nella risposta all'autenticazione
+	ENCODINGS = [COLUMNAR, GZIP]
+	# l'header con cui un host richiede le risposte per colonne
+	HEADER = 'X-Wire-Format'
+
+	FIELDS = ['proc', 'status', 'source', 'dest', 'proto', 'safe']
+	# le chiavi dei dettagli che contengono liste di connessioni
+	MODEL_KEYS = ['model', 'removed']
+	# i corpi più piccoli (in byte) non sono compressi
+	GZIP_MIN_SIZE = 1024
+	GZIP_LEVEL = 3
+	# la dimensione massima (in byte) di un corpo decompresso
+	MAX_BODY_SIZE = 16 * 1024 * 1024
+
+	def pack(self, details):
+		"""
+		Converte le liste di connessioni dei dettagli nel formato per colonne.
+
+		:param details (dict): i dettagli da inviare.
+
+		:return: una copia dei dettagli con i modelli convertiti.
+		"""
+		packed = dict(details)
+		for key in self.MODEL_KEYS:
+			if key in packed and type(packed[key]) in (list, tuple):
+				packed[key] = self.pack_model(packed[key])
+		return packed
+
+	def unpack(self, details):
+		"""
+		Riporta le liste di connessioni dei dettagli al formato normale.
+		I dettagli già nel formato normale sono ritornati invariati.
+
+		:param details (dict): i dettagli ricevuti.
+
+		:return: i dettagli con i modelli come liste di dizionari.
+		"""
+		if type(details) != dict or not any(key in details and self.is_packed(details[key]) for key in self.MODEL_KEYS):
+			return details
+		unpacked = dict(details)
+		for key in self.MODEL_KEYS:
+			if key in unpacked and self.is_packed(unpacked[key]):
+				unpacked[key] = self.unpack_model(unpacked[key])
+		return unpacked
+
+	def is_packed(self, model):
+		"""
+		Verifica se un modello è nel formato per colonne.
+
+		:param model (list, dict): il modello da verificare.
+
+		:return: True se il modello è per colonne.
+		"""
+		return type(model) == dict and 'fields' in model and 'columns' in model
+
+	def pack_model(self, model):
+		"""
+		Converte una lista di connessioni nel formato per colonne.
+
+		:param model (list): le connessioni, come dizionari o oggetti Connection.
+
+		:return: il dizionario con i nomi dei campi e le colonne dei valori.
+		"""
+		return {'fields': self.FIELDS, 'columns': [[conn[field] for conn in model] for field in self.FIELDS]}
+
+	def unpack_model(self, packed):
+		"""
+		Riporta un modello per colonne ad una lista di connessioni.
+
+		:param packed (dict): il modello per colonne.
+
+		:return: la lista di connessioni come dizionari.
+		"""
+		fields = packed['fields']
+		return [dict(zip(fields, values)) for values in zip(*packed['columns'])]
+
+	def compress(self, body):
+		"""
+		Comprime un corpo di una richiesta, se abbastanza grande.
+
+		:param body (bytes): il corpo da inviare.
+
+		:return: il corpo, compresso o meno, e True se è stato compresso.
+		"""
+		if len(body) < self.GZIP_MIN_SIZE:
+			return body, False
+		return gzip.compress(body, self.GZIP_LEVEL), True
+
+	def decompress(self, body, maxSize=MAX_BODY_SIZE):
+		"""
+		Decomprime un corpo ricevuto compresso con gzip, senza mai produrre
+		più di maxSize byte: un corpo piccolo non può occupare troppa memoria.
+		Solleva ValueError se il corpo non è valido e OverflowError se è troppo grande.
+
+		:param body (bytes): il corpo ricevuto.
+		:param maxSize (int, opzionale): la dimensione massima del corpo decompresso.
+			Default: MAX_BODY_SIZE (16 MiB).
+
+		:return: il corpo decompresso.
+		"""
+		# wbits=31 accetta solo il formato gzip
+		decompressor = zlib.decompressobj(31)
+		try:
+			data = decompressor.decompress(body, maxSize)
+		except zlib.error as e:
+			raise ValueError('Corpo gzip non valido: {}'.format(e.__str__()))
+		if decompressor.unconsumed_tail != b'':
+			raise OverflowError('Corpo decompresso oltre {} byte'.format(maxSize))
+		if not decompressor.eof:
+			raise ValueError('Corpo gzip incompleto')
+		return data
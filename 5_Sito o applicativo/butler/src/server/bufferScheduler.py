@@ -0,0 +1,148 @@
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import time
+
+from common import log
+
+class BufferScheduler():
+	"""
+	Questa classe consegna le notifiche dei buffer all'orario previsto.
+	I buffer in sospeso sono mantenuti in una coda ordinata per data di consegna,
+	letta dal database all'avvio e aggiornata ad ogni nuovo buffer: il controllo
+	avviene solo quando il primo buffer della coda va consegnato.
+	I destinatari non raggiunti vengono ritentati con un'attesa che raddoppia
+	ad ogni tentativo, fino al massimo previsto.
+	"""
+
+	RETRY_DELAY = 5
+	WORKERS = 4
+
+	def __init__(self, dbHelper, deliverCallback, maxDelay, retryDelay=RETRY_DELAY, workers=WORKERS):
+		"""
+		Istanzia un oggetto BufferScheduler.
+
+		:param dbHelper (DbHelper): l'oggetto per accedere ai buffer nel database.
+		:param deliverCallback (func): la funzione che consegna un buffer e ritorna
+			True se tutti i destinatari sono stati raggiunti.
+		:param maxDelay (int): l'attesa massima tra due tentativi (in secondi).
+		:param retryDelay (int, opzionale): l'attesa prima del primo nuovo tentativo (in secondi).
+			Default: RETRY_DELAY (5).
+		:param workers (int, opzionale): il numero massimo di buffer consegnati contemporaneamente.
+			Default: WORKERS (4).
+		"""
+		self.dbHelper = dbHelper
+		self.deliverCallback = deliverCallback
+		self.maxDelay = maxDelay
+		self.retryDelay = min(retryDelay, maxDelay)
+		self.executor = ThreadPoolExecutor(max_workers=workers)
+		# coda di (consegna, id): le voci non più valide sono ignorate all'estrazione
+		self.queue = []
+		# ultima consegna prevista e tentativi già eseguiti, per id del buffer
+		self.pending = {}
+		self.condition = threading.Condition()
+
+	def to_timestamp(self, deliveryStart):
+		"""
+		Converte la data di consegna di un buffer.
+		Le date salvate come testo non riconosciuto sono considerate già passate.
+
+		:param deliveryStart (datetime, str): la data di consegna.
+
+		:return: il timestamp corrispondente.
+		"""
+		if type(deliveryStart) == str:
+			try:
+				deliveryStart = datetime.fromisoformat(deliveryStart)
+			except ValueError:
+				return 0
+		return deliveryStart.timestamp()
+
+	def rebuild(self):
+		"""
+		Ricrea la coda a partire da tutti i buffer presenti nel database.
+		"""
+		buffers = self.dbHelper.get_buffer_dates()
+		with self.condition:
+			self.queue = []
+			self.pending = {}
+			for b in buffers:
+				self.push(b['_id'], self.to_timestamp(b['deliveryStart']))
+			self.condition.notify()
+		log.info('Buffer in sospeso caricati: {}'.format(len(buffers)))
+
+	def add(self, bufferId, deliveryStart):
+		"""
+		Aggiunge un nuovo buffer alla coda.
+
+		:param bufferId (ObjectId): l'id del buffer.
+		:param deliveryStart (datetime, str): la data di consegna.
+		"""
+		with self.condition:
+			self.push(bufferId, self.to_timestamp(deliveryStart))
+			self.condition.notify()
+
+	def push(self, bufferId, due, attempts=0):
+		"""
+		Inserisce un buffer nella coda. Va richiamata con la condizione acquisita.
+
+		:param bufferId (ObjectId): l'id del buffer.
+		:param due (float): il timestamp della consegna.
+		:param attempts (int, opzionale): i tentativi già eseguiti.
+			Default: 0.
+		"""
+		self.pending[bufferId] = (due, attempts)
+		heapq.heappush(self.queue, (due, str(bufferId), bufferId))
+
+	def pop_due(self):
+		"""
+		Attende che almeno un buffer vada consegnato e li estrae dalla coda.
+
+		:return: la lista degli id dei buffer da consegnare, con i tentativi già eseguiti.
+		"""
+		with self.condition:
+			while True:
+				now = time()
+				due = []
+				while self.queue != [] and self.queue[0][0] <= now:
+					timestamp, key, bufferId = heapq.heappop(self.queue)
+					# un buffer ripianificato ha una voce più recente nella coda
+					if bufferId in self.pending and self.pending[bufferId][0] == timestamp:
+						due.append((bufferId, self.pending.pop(bufferId)[1]))
+				if due != []:
+					return due
+				self.condition.wait(self.queue[0][0] - now if self.queue != [] else None)
+
+	def start(self):
+		"""
+		Carica i buffer e li consegna all'orario previsto, senza mai terminare.
+		"""
+		self.rebuild()
+		while True:
+			for bufferId, attempts in self.pop_due():
+				self.executor.submit(self.deliver, bufferId, attempts)
+
+	def deliver(self, bufferId, attempts):
+		"""
+		Consegna un buffer e, se qualche destinatario non è stato raggiunto,
+		lo ripianifica.
+
+		:param bufferId (ObjectId): l'id del buffer.
+		:param attempts (int): i tentativi già eseguiti.
+		"""
+		try:
+			buffers = self.dbHelper.get_buffer({'_id': bufferId})
+			# il buffer è stato consegnato, eliminato o la notifica non esiste più
+			if buffers == []:
+				return
+			if self.deliverCallback(buffers[0]):
+				return
+		except Exception as e:
+			log.warning('Errore nella consegna del buffer {}: {}'.format(bufferId, e.__str__()))
+		delay = min(self.retryDelay * 2 ** attempts, self.maxDelay)
+		log.info('Nuovo tentativo di consegna del buffer {} tra {} secondi'.format(bufferId, delay))
+		with self.condition:
+			if bufferId not in self.pending:
+				self.push(bufferId, time() + delay, attempts + 1)
+				self.condition.notify()
@@ -9,7 +9,7 @@ class Butler():
 	reale, con la comunicazione gestita automaticamete.
 	"""
 
-	def __init__(self, protocol, mac, addr, user, serverAddr, serverId, canDisconnect=False):
+	def __init__(self, protocol, mac, addr, user, serverAddr, serverId, canDisconnect=False, channel=None, requests={}):
 		"""
 		Istanzia un oggetto Butler definendone il protocollo da usare, l'indirizzo,
 		il nome utente, l'indirizzo del server, l'id del server e il permesso di disconnessione.
@@ -23,6 +23,12 @@ class Butler():
 		:param serverId (str): una stringa identificativa del server.
 		:param canDisconnect (bool, opzionale): il permesso di disconnettersi manualmente.
 			Default: False
+		:param channel (PushChannel, opzionale): i canali aperti dai Butlers, usati
+				al posto di HTTPS quando disponibili.
+			Default: None.
+		:param requests (dict, opzionale): la configurazione delle connessioni HTTPS
+				verso il Butler (poolSize, retries).
+			Default: {}.
 		"""
 		self.addr = addr
 		self.ip, self.port = [val for val in addr.split(':')]
@@ -31,7 +37,7 @@ class Butler():
 		self.serverAddr = serverAddr
 		self.serverId = serverId
 		self.canDisconnect = canDisconnect
-		self.butlerController = ButlerController(protocol+'://'+addr, self.authenticate)
+		self.butlerController = ButlerController(protocol+'://'+addr, self.authenticate, addr, channel, **requests)
 		log.info('Nuovo Butler su {}'.format(addr))
 
 	def authenticate(self):
@@ -87,13 +93,16 @@ class Butler():
 	#####################################
 	"""
 
-	def get_details(self):
+	def get_details(self, maxAge=None):
 		"""
 		Richiede i dettagli al Butler.
 
+		:param maxAge (float, opzionale): l'età massima (in secondi) dei dettagli.
+			Default: None.
+
 		:return: i dati ricevuti.
 		"""
-		return self.butlerController.get_details()
+		return self.butlerController.get_details(maxAge)
 
 	def edit(self, data, endpoint):
 		"""
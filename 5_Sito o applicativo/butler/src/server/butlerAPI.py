@@ -12,7 +12,7 @@ class ButlerAPI(BaseAPI):
 	Estende da BaseAPI che definisce parte della logica di base. 
 	"""
 
-	def __init__(self, ip, port, expireTime, sslConf, callbacks):
+	def __init__(self, ip, port, expireTime, sslConf, callbacks, serving=BaseAPI.SERVING):
 		"""
 		Istanzia un oggetto ButlerAPi definendone ip e porta sul quale lavorare,
 		la durata dei token generati e le funzioni di callback disponibili.
@@ -22,8 +22,10 @@ class ButlerAPI(BaseAPI):
 		:param expireTime (float): i minuti di durata dei token.
 		:param sslConf (list): il percorso del certificato e della chiave SSL.
 		:param callbacks (dict): la lista di callback, identificate da chiavi.
+		:param serving (dict, opzionale): il server HTTP da usare e la sua configurazione.
+			Default: BaseAPI.SERVING ({'backend': 'werkzeug'}).
 		"""
-		super().__init__(ip, port, expireTime, sslConf, callbacks)
+		super().__init__(ip, port, expireTime, sslConf, callbacks, serving)
 
 	def start_api(self):
 		"""
@@ -43,8 +45,8 @@ class ButlerAPI(BaseAPI):
 			user = self.get_json(request, 'user', '')
 
 			if addr != '' and user != '':
-				self.sub = user
-				returnData = self.init_token()
+				# l'indirizzo nel token lega il canale persistente al Butler che lo apre
+				returnData = self.init_token(user, {'addr': addr})
 				log.info(returnData['message'])
 				status = self.ACCEPTED if self.callbacks['add_butler'](mac, addr, user) else self.BAD_METHOD
 				return self.standard_response(returnData, status)
@@ -108,11 +110,16 @@ class ButlerAPI(BaseAPI):
 		def details():
 			"""
 			Viene richiamato alla ricezione dei dettagli di un Butler.
+			I dettagli possono contenere solo le differenze dall'invio precedente:
+			se la sequenza non è continua, viene richiesto un invio completo.
 			
-			:return: una risposta vuota di successo.
+			:return: una risposta vuota di successo, oppure il codice 409 (conflict)
+				se il Butler deve inviare nuovamente tutti i dettagli.
 			"""
-			details = self.get_json(request, 'details', {})
-			self.callbacks['update_db_details'](details)
+			details = self.wireFormat.unpack(self.get_json(request, 'details', {}))
+			if not self.callbacks['update_db_details'](details):
+				returnData = {'message': 'Sequenza dei dettagli non valida: è richiesto un invio completo', 'resync': True}
+				return self.standard_response(returnData, self.CONFLICT)
 			return self.standard_response()
 
 		"""
@@ -124,7 +131,7 @@ class ButlerAPI(BaseAPI):
 
 		try:
 			log.info('API per i Butlers avviata su {}:{}'.format(self.ip, self.port))
-			self.flask.run(host=self.ip, port=self.port, ssl_context=self.sslConf)
+			self.serve()
 		except OSError as e:
 			log.critical('Non è stato possibile ascoltare i client su "{}": {}'.format(self.ip, e.__str__()))
 			_exit(1)
@@ -1,6 +1,9 @@
 from common import log
 from common.requestSubmitter import RequestSubmitter
+from common.failedRequest import FailedRequest
 import copy
+import json
+import requests
 
 class ButlerController(RequestSubmitter):
 	"""
@@ -10,15 +13,58 @@ class ButlerController(RequestSubmitter):
 	
 	headers = {"Accept": "application/json"}
 
-	def __init__(self, baseUrl, authCallback):
+	def __init__(self, baseUrl, authCallback, addr='', channel=None,
+		poolSize=RequestSubmitter.POOL_SIZE, retries=RequestSubmitter.RETRIES):
 		"""
 		Istanzia un oggetto ButlerController per inviare richieste ad un Butler.
 
 		:param baseUrl (str): la base dell'url (l'indirizzo del client) al quale connettersi.
 		:param authCallback (func): la funzione di callback per ritentare l'autenticazione.
-		"""
-		# passare "headers" evita che i Butlers condividano i token
-		super().__init__(baseUrl, authCallback, self.headers)
+		:param addr (str, opzionale): l'indirizzo IPv4 e la porta del Butler.
+			Default: ''.
+		:param channel (PushChannel, opzionale): i canali aperti dai Butlers. Se il Butler
+				ha un canale aperto, le richieste sono inviate su questo.
+			Default: None.
+		:param poolSize (int, opzionale): il numero di connessioni mantenute aperte.
+			Default: RequestSubmitter.POOL_SIZE (4).
+		:param retries (int, opzionale): i tentativi aggiuntivi in caso di errore di connessione.
+			Default: RequestSubmitter.RETRIES (1).
+		"""
+		# ogni Butler ha una propria copia degli header, così che non condivida i token
+		super().__init__(baseUrl, authCallback, dict(self.headers), poolSize, retries)
+		self.addr = addr
+		self.channel = channel
+
+	def send(self, method=RequestSubmitter.GET, url='', data={}):
+		"""
+		Invia una richiesta sul canale del Butler, se aperto, altrimenti in HTTPS.
+		La risposta ricevuta sul canale ha lo stesso formato di quella HTTPS.
+		Se il canale si chiude prima dell'invio, la richiesta passa da HTTPS;
+		un comando già scritto sul canale invece non è mai ripetuto.
+
+		:param method (str, opzionale): una stringa identificativa del metodo da usare.
+			Default: GET
+		:param url (str, opzionale): l'endpoint al quale mandare la richiesta.
+			Default: ''.
+		:param data (dict, opzionale): il dizionario con i dati che verranno.
+			Default: {}.
+
+		:return: la risposta alla richiesta, oppure un oggetto FailedRequest.
+		"""
+		if self.channel is not None and self.channel.is_open(self.addr):
+			try:
+				result = self.channel.send(self.addr, method, url[len(self.baseUrl):], self.request_headers(), data)
+			except TimeoutError as e:
+				return FailedRequest(message='Risposta non ricevuta entro il tempo limite', error=e.__str__())
+			except ConnectionError as e:
+				return FailedRequest(message='Canale interrotto durante l\'invio', error=e.__str__())
+			if result is not None:
+				response = requests.Response()
+				response.status_code, body = result
+				response._content = json.dumps(body).encode('UTF-8')
+				response.url = url
+				return response
+		return super().send(method, url, data)
  
 	def authenticate(self, addr, id, endpoint="/authenticate"):
 		"""
@@ -39,6 +85,7 @@ class ButlerController(RequestSubmitter):
 		if response.ok:
 			self.headers['token'] = result['token']
 			self.headers['sub'] = addr
+			self.set_encodings(result)
 			log.info('Connessione stabilita con {}'.format(self.baseUrl))
 		else:
 			result = result['message']
@@ -105,6 +152,7 @@ class ButlerController(RequestSubmitter):
 		"""
 		url = self.baseUrl + endpoint
 		response = self.request(self.DELETE, url)
+		self.close()
 		return response.ok
 
 
@@ -114,18 +162,22 @@ class ButlerController(RequestSubmitter):
 	#####################################
 	"""
 
-	def get_details(self, endpoint="/details"):
+	def get_details(self, maxAge=None, endpoint="/details"):
 		"""
 		Permette di ricavare i dettagli di un Butler.
 
+		:param maxAge (float, opzionale): l'età massima (in secondi) dei dettagli.
+				Se non è specificata, il Butler risponde con gli ultimi raccolti.
+			Default: None.
 		:param endpoint (str, opzionale): l'endpoint del Butler.
 			Default: "/details".
 
 		:return: i dettagli, in base ai moduli attivi sul Butler.
 		"""
 		url = self.baseUrl + endpoint
-		response = self.request(self.GET, url)
-		return response.json() if response.ok and hasattr(response, 'json') else {}
+		response = self.request(self.GET, url, data={'maxAge': maxAge} if maxAge is not None else {})
+		# il modello può essere ricevuto per colonne
+		return self.wireFormat.unpack(response.json()) if response.ok and hasattr(response, 'json') else {}
 
 	def edit(self, payload, endpoint):
 		"""
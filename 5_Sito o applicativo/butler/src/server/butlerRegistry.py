@@ -0,0 +1,247 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common import log
+
+class ButlerRegistry():
+	"""
+	Questa classe contiene la lista dei Butlers connessi e gestisce tutte
+	le richieste inviate loro.
+	La lista è modificata solo dal thread del proprio event loop asyncio,
+	mentre gli altri thread ne leggono una copia che non cambia più:
+	le letture non richiedono lock e vedono sempre uno stato coerente.
+	Le richieste ai Butlers sono coroutine dello stesso event loop:
+	ognuna occupa uno dei pochi thread dedicati solo durante la richiesta HTTP,
+	un solo host non può ricevere più di un certo numero di richieste
+	contemporanee e quelle ancora in corso vengono annullate quando l'host
+	è rimosso.
+
+	Dagli altri thread la lista si usa come un dizionario
+	(addr in registry, registry[addr], registry.items(), ...).
+	"""
+
+	WORKERS = 16
+	PER_HOST = 2
+	TIMEOUT = 15
+
+	def __init__(self, workers=WORKERS, perHost=PER_HOST, timeout=TIMEOUT):
+		"""
+		Istanzia un oggetto ButlerRegistry vuoto e ne avvia l'event loop.
+
+		:param workers (int, opzionale): il numero massimo di richieste HTTP contemporanee.
+			Default: WORKERS (16).
+		:param perHost (int, opzionale): il numero massimo di richieste contemporanee
+				verso lo stesso Butler.
+			Default: PER_HOST (2).
+		:param timeout (int, opzionale): i secondi dopo i quali una richiesta viene annullata.
+			Default: TIMEOUT (15).
+		"""
+		self.workers = workers
+		self.perHost = perHost
+		self.timeout = timeout
+		self.executor = ThreadPoolExecutor(max_workers=workers)
+		self.slots = None
+		# copia della lista in sola lettura: è sostituita ad ogni modifica
+		self.butlers = {}
+		# semafori e richieste in corso per indirizzo, usati solo dall'event loop
+		self.semaphores = {}
+		self.tasks = {}
+		self.loop = asyncio.new_event_loop()
+		self.thread = threading.Thread(target=self.run_loop, daemon=True)
+		self.thread.start()
+
+	def run_loop(self):
+		"""
+		Esegue l'event loop, senza mai terminare.
+		"""
+		asyncio.set_event_loop(self.loop)
+		# un posto per ogni thread: le richieste in attesa di un thread non scadono
+		self.slots = asyncio.Semaphore(self.workers)
+		self.loop.run_forever()
+
+	def run(self, coroutine):
+		"""
+		Esegue una coroutine nell'event loop e ne attende il risultato.
+
+		:param coroutine (coroutine): la coroutine da eseguire.
+
+		:return: il risultato della coroutine.
+		"""
+		return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+	"""
+	Accesso alla lista come dizionario
+	"""
+
+	def __contains__(self, addr):
+		return addr in self.butlers
+
+	def __getitem__(self, addr):
+		return self.butlers[addr]
+
+	def __len__(self):
+		return len(self.butlers)
+
+	def __iter__(self):
+		return iter(self.butlers)
+
+	def __setitem__(self, addr, butler):
+		self.run(self.add(addr, butler))
+
+	def __delitem__(self, addr):
+		if self.run(self.remove(addr)) is None:
+			raise KeyError(addr)
+
+	def items(self):
+		return self.butlers.items()
+
+	def get(self, addr, default=None):
+		return self.butlers[addr] if addr in self.butlers else default
+
+	def pop(self, addr, default=None):
+		butler = self.run(self.remove(addr))
+		return butler if butler is not None else default
+
+	async def add(self, addr, butler):
+		"""
+		Aggiunge o sostituisce un Butler nella lista.
+		Le richieste ancora in corso verso il Butler sostituito sono annullate.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param butler (Butler): il Butler da aggiungere.
+		"""
+		self.cancel(addr)
+		butlers = dict(self.butlers)
+		butlers[addr] = butler
+		self.butlers = butlers
+
+	async def remove(self, addr):
+		"""
+		Rimuove un Butler dalla lista, annullando le richieste in corso.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+
+		:return: il Butler rimosso, oppure None se non era nella lista.
+		"""
+		self.cancel(addr)
+		if addr not in self.butlers:
+			return None
+		butlers = dict(self.butlers)
+		butler = butlers.pop(addr)
+		self.butlers = butlers
+		self.semaphores.pop(addr, None)
+		return butler
+
+	def cancel(self, addr):
+		"""
+		Annulla le richieste in corso verso un Butler.
+		Va richiamata dall'event loop.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		"""
+		for task in self.tasks.pop(addr, set()):
+			task.cancel()
+
+	"""
+	Richieste ai Butlers
+	"""
+
+	async def request(self, addr, method, *args):
+		"""
+		Richiama un metodo di un Butler rispettando il limite di richieste
+		contemporanee verso l'host e il tempo massimo di attesa.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param method (str): il nome del metodo del Butler da richiamare.
+		:param args (list): i parametri del metodo.
+
+		:return: il risultato del metodo, oppure None se il Butler non è nella lista,
+			la richiesta è stata annullata o non è terminata in tempo.
+		"""
+		if addr not in self.butlers:
+			return None
+		butler = self.butlers[addr]
+		task = asyncio.current_task()
+		self.tasks.setdefault(addr, set()).add(task)
+		if addr not in self.semaphores:
+			self.semaphores[addr] = asyncio.Semaphore(self.perHost)
+		try:
+			async with self.semaphores[addr]:
+				await self.slots.acquire()
+				future = self.loop.run_in_executor(self.executor, lambda: getattr(butler, method)(*args))
+				# il posto è liberato solo quando il thread termina la richiesta,
+				# anche se nel frattempo l'attesa è stata annullata
+				future.add_done_callback(self.release)
+				return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+		except asyncio.TimeoutError:
+			log.warning('Richiesta "{}" a {} annullata dopo {} secondi'.format(method, addr, self.timeout))
+		except asyncio.CancelledError:
+			log.info('Richiesta "{}" a {} annullata'.format(method, addr))
+		except Exception as e:
+			log.warning('Errore nella richiesta "{}" a {}: {}'.format(method, addr, e.__str__()))
+		finally:
+			if addr in self.tasks:
+				self.tasks[addr].discard(task)
+		return None
+
+	def release(self, future):
+		"""
+		Libera il posto occupato da una richiesta terminata.
+
+		:param future (asyncio.Future): la richiesta terminata.
+		"""
+		self.slots.release()
+		# evita l'avviso per gli errori delle richieste non più attese
+		if not future.cancelled():
+			future.exception()
+
+	async def request_all(self, addrs, method, *args):
+		"""
+		Richiama lo stesso metodo su più Butlers contemporaneamente.
+
+		:param addrs (list): gli indirizzi dei Butlers.
+		:param method (str): il nome del metodo dei Butlers da richiamare.
+		:param args (list): i parametri del metodo.
+
+		:return: il dizionario dei risultati per indirizzo.
+		"""
+		results = await asyncio.gather(*[self.request(addr, method, *args) for addr in addrs])
+		return dict(zip(addrs, results))
+
+	def call(self, addr, method, *args):
+		"""
+		Richiama un metodo di un Butler e ne attende il risultato.
+		Non va usata dal thread dell'event loop.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param method (str): il nome del metodo del Butler da richiamare.
+		:param args (list): i parametri del metodo.
+
+		:return: il risultato del metodo, oppure None in caso di errore.
+		"""
+		return self.run(self.request(addr, method, *args))
+
+	def submit(self, addr, method, *args):
+		"""
+		Richiama un metodo di un Butler senza attenderne il risultato.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param method (str): il nome del metodo del Butler da richiamare.
+		:param args (list): i parametri del metodo.
+
+		:return: il concurrent.futures.Future della richiesta.
+		"""
+		return asyncio.run_coroutine_threadsafe(self.request(addr, method, *args), self.loop)
+
+	def broadcast(self, addrs, method, *args):
+		"""
+		Richiama lo stesso metodo su più Butlers e attende tutti i risultati.
+
+		:param addrs (list): gli indirizzi dei Butlers.
+		:param method (str): il nome del metodo dei Butlers da richiamare.
+		:param args (list): i parametri del metodo.
+
+		:return: il dizionario dei risultati per indirizzo.
+		"""
+		return self.run(self.request_all(list(addrs), method, *args))
@@ -1,11 +1,11 @@
 from flask import request
-import threading
 from os import _exit
 
 from common import log
 from common.notificationBuilder import NotificationBuilder
 from common.baseAPI import BaseAPI
 from server.ipParser import IPParser
+from server.previewRenderer import PreviewRenderer
 
 class ControlCenterAPI(BaseAPI):
 	"""
@@ -13,7 +13,7 @@ class ControlCenterAPI(BaseAPI):
 	Estende da BaseAPI che definisce parte della logica di base.
 	"""
 
-	def __init__(self, ip, port, expireTime, sslConf, callbacks, dbHelper, imagesPath, previewPort, guiAddr, guiSections):
+	def __init__(self, ip, port, expireTime, sslConf, callbacks, dbHelper, imagesPath, previewPort, guiAddr, guiSections, serving=BaseAPI.SERVING):
 		"""
 		Istanzia un oggetto ControlCenterAPI definendone ip e porta sul quale lavorare,
 		la durata dei token generati, le funzioni di callback disponibili, l'oggetto
@@ -34,8 +34,10 @@ class ControlCenterAPI(BaseAPI):
 		:param guiAddr (str): l'indirizzo e la porta dell'interfaccia grafica
 			dalla quale accettare richieste anche se riconosciute come cross-domain.
 		:param guiSections (list): la lista con i nomi delle sezioni del centro di controllo.
+		:param serving (dict, opzionale): il server HTTP da usare e la sua configurazione.
+			Default: BaseAPI.SERVING ({'backend': 'werkzeug'}).
 		"""
-		super().__init__(ip, port, expireTime, sslConf, callbacks)
+		super().__init__(ip, port, expireTime, sslConf, callbacks, serving)
 		self.sections = guiSections
 		self.db = dbHelper
 		self.guiAddr = guiAddr
@@ -43,6 +45,7 @@ class ControlCenterAPI(BaseAPI):
 		self.previewAddr = 'http://'+ip+':'+str(previewPort)
 		self.previewPort = previewPort
 		self.preview = NotificationBuilder(port=previewPort, imagesPath=imagesPath)
+		self.renderer = PreviewRenderer(self.preview)
 		self.timer = 0
 
 	def start_api(self):
@@ -61,8 +64,7 @@ class ControlCenterAPI(BaseAPI):
 			user = self.get_json(request, 'username', '')
 			password = self.get_json(request, 'password', '')
 			if self.callbacks['validate_credentials'](user, password):
-				self.sub = user
-				returnData = self.init_token()
+				returnData = self.init_token(user)
 				log.info(returnData['message'])
 				return self.standard_response(returnData)
 			returnData = {'message': 'Credenziali non valide'}
@@ -194,6 +196,7 @@ class ControlCenterAPI(BaseAPI):
 			notifData = self.get_json(request, 'notif', [])
 			if 'name' in notifData and notifData['name'] != '':
 				self.db.upsert_notif(notifData)
+				self.callbacks['invalidate_notif'](notifData['name'])
 				returnData = {
 					'message': 'Notifica "{}" salvata'.format(notifData['name'])
 				}
@@ -225,8 +228,10 @@ class ControlCenterAPI(BaseAPI):
 					deliveryData['recipients'] = [
 						addr for addr in self.callbacks['check_butlers']()]
 				if deliveryData['start'] != '':
-					self.db.add_buffered_notif(
+					result = self.db.add_buffered_notif(
 						name, deliveryData['recipients'], deliveryData['start'])
+					if result:
+						self.callbacks['add_buffer'](result.inserted_id, deliveryData['start'])
 					returnData['message'] = 'Buffer della notifica "{}" salvato con inizio della consegna {}'.format(
 						name, deliveryData['start'])
 				else:
@@ -247,6 +252,7 @@ class ControlCenterAPI(BaseAPI):
 			name = self.get_json(request, 'name', '')
 			if name != '':
 				self.db.delete_notif(name)
+				self.callbacks['invalidate_notif'](name)
 				returnData = {'message': 'Notifica "{}" eliminata'.format(name)}
 				log.info(returnData['message'])
 				return self.standard_response(returnData)
@@ -292,17 +298,15 @@ class ControlCenterAPI(BaseAPI):
 			:return: i secondi da attendere prima della prossima richiesta.
 				È in questo modo che la sezione della preview informa ufficialmente
 				l'editor che deve mandare i dati aggiornati al server.
+				Contiene anche i dati dell'ultimo aggiornamento completato.
 			"""
 			notifData = self.get_json(request, 'notif', {'name':''})
+			render = self.renderer.metrics
 			if 'name' in notifData and notifData['name'] != '':
-				try:
-					threading.Thread(
-						target=self.preview.show_window, args=[notifData]).start()
-				except Exception as e:
-					self.preview.stop()
-					log('Errore nell\'anteprima live: {}'.format(e.__str__()))
+				# l'anteprima è aggiornata in background con l'ultima versione ricevuta
+				render = self.renderer.submit(notifData)
 				
-			returnData = {'timer': self.timer}
+			returnData = {'timer': self.timer, 'render': render}
 			return self.standard_response(returnData)
 			
 		@self.flask.route('/setTimer', methods=['POST'])
@@ -337,6 +341,17 @@ class ControlCenterAPI(BaseAPI):
 			returnData = {'addr': self.previewAddr}
 			return self.standard_response(returnData)
 
+		@self.flask.route('/previewRender', methods=['GET'])
+		@self.auth.token_required
+		def get_render():
+			"""
+			Permette di ricavare i dati dell'ultimo aggiornamento dell'anteprima.
+			
+			:return: il tipo di aggiornamento, la sua durata in millisecondi,
+				le richieste raggruppate e la data dell'aggiornamento.
+			"""
+			return self.standard_response(self.renderer.metrics)
+
 		@self.flask.route('/sections', methods=['GET', 'POST'])
 		@self.auth.token_required
 		def get_sections():
@@ -393,7 +408,7 @@ class ControlCenterAPI(BaseAPI):
 				details = {'message': 'Errore nella lettura del database: potrebbe essere offline'}
 
 
-			return self.standard_response(details, code=status)
+			return self.standard_response(details, code=status, stream=True)
 
 		@self.flask.route('/module', methods=['PUT'])
 		@self.auth.token_required
@@ -447,7 +462,7 @@ class ControlCenterAPI(BaseAPI):
 
 		try:
 			log.info('API di controllo avviata su {}:{}'.format(self.ip, self.port))
-			self.flask.run(host=self.ip, port=self.port, ssl_context=self.sslConf)
+			self.serve()
 		except OSError as e:
 			log.critical('Non è stato possibile avviare il centro di controllo su "{}": {}'.format(self.ip, e.__str__()))
 			_exit(1)
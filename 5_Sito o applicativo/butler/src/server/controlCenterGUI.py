@@ -13,7 +13,7 @@ class ControlCenterGUI(BaseAPI):
 	Estende da BaseAPI che definisce parte della logica di base. 
 	"""
 
-	def __init__(self, ip, port, controlApiAddr, sslConf, templatesPath, resPath):
+	def __init__(self, ip, port, controlApiAddr, sslConf, templatesPath, resPath, serving=BaseAPI.SERVING):
 		"""
 		Istanzia un oggetto ControlCenterGUI definendone l'ip, la porta
 		e l'indirizzo dell'API del centro di controllo.
@@ -26,8 +26,10 @@ class ControlCenterGUI(BaseAPI):
 		:param sslConf (list): il percorso del certificato e della chiave SSL.
 		:param templatesPath (str): il percorso dei file HTML dell'interfaccia.
 		:param resPath (str): il percorso delle risorse statiche (CSS, JS,...) dell'interfaccia.
+		:param serving (dict, opzionale): il server HTTP da usare e la sua configurazione.
+			Default: BaseAPI.SERVING ({'backend': 'werkzeug'}).
 		"""
-		super().__init__(ip, port, 1, sslConf)
+		super().__init__(ip, port, 1, sslConf, serving=serving)
 		self.ip = ip
 		self.port = port
 		self.controlApiAddr = controlApiAddr
@@ -102,7 +104,7 @@ class ControlCenterGUI(BaseAPI):
 
 		try:
 			log.info('Interfaccia web del server avviata su {}:{}'.format(self.ip, self.port))
-			self.flask.run(host=self.ip, port=self.port, ssl_context=self.sslConf)
+			self.serve()
 		except OSError as e:
 			log.critical('Non è stato possibile avviare l\'interfaccia web su "{}": {}'.format(self.ip, e.__str__()))
 			_exit(1)
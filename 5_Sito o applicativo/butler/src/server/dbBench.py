@@ -0,0 +1,185 @@
+import sys
+import random
+from os.path import abspath, join
+from time import time
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+from common.argsParser import ArgsParser
+from server.dbHelper import DbHelper
+from server.wireTest import WireTest
+
+class DbBench():
+	"""
+	Questa classe misura i viaggi di andata e ritorno verso MongoDB e la durata
+	del salvataggio dei dettagli di un host, con upsert_details (una sola
+	bulk_write ordinata) e con le operazioni singole per connessione
+	(update_conn, remove_conn e update_value).
+	Il database può essere un MongoDB locale oppure mongomock, se installato.
+	Ogni chiamata ad un metodo della collezione è contata come un viaggio.
+	"""
+
+	DATABASE = 'mongomock'
+	CONNECTIONS = 500
+	CHANGED = 100
+	REMOVED = 10
+	UPLOADS = 3
+	SEED = 1
+	MAC = 'db:be:nc:h0:00:01'
+	# i metodi della collezione che comunicano con il database
+	COUNTED = ['bulk_write', 'find_one', 'find_one_and_update', 'update_one', 'insert_one']
+
+	def __init__(self, database=DATABASE, connections=CONNECTIONS, changed=CHANGED,
+		removed=REMOVED, uploads=UPLOADS, seed=SEED):
+		"""
+		Istanzia un oggetto DbBench e si collega al database.
+
+		:param database (str, opzionale): "mongomock" oppure l'indirizzo (ip:porta) di MongoDB.
+				Con MongoDB viene usato il database "butler_bench", che è svuotato.
+			Default: DATABASE ('mongomock').
+		:param connections (int, opzionale): il numero di connessioni del modello completo.
+			Default: CONNECTIONS (500).
+		:param changed (int, opzionale): le connessioni nuove o modificate di ogni differenza.
+			Default: CHANGED (100).
+		:param removed (int, opzionale): le connessioni rimosse di ogni differenza.
+			Default: REMOVED (10).
+		:param uploads (int, opzionale): gli invii misurati per ogni caso.
+			Default: UPLOADS (3).
+		:param seed (int, opzionale): il seme per la generazione dei dati.
+			Default: SEED (1).
+		"""
+		self.database = database
+		self.changed = changed
+		self.removed = removed
+		self.uploads = uploads
+		self.rand = random.Random(seed)
+		self.model = WireTest(connections, seed).model
+		self.inventory = {'cpu': {'model': 'Bench CPU', 'freq': 2100.0, 'cores': 8},
+			'ram': {'total': 16, 'used': 8}, 'os': {'name': 'Windows', 'version': '10'}}
+		self.trips = 0
+		self.dbHelper = DbHelper()
+		if database == 'mongomock':
+			import mongomock
+			client = mongomock.MongoClient()
+		else:
+			from pymongo import MongoClient
+			client = MongoClient('mongodb://{}'.format(database), serverSelectionTimeoutMS=2000)
+			client.drop_database('butler_bench')
+		self.dbHelper.computerColl = client['butler_bench']['computer']
+		self.dbHelper.computerColl.create_index('mac', unique=True)
+		# le chiamate sono contate sostituendo i metodi della collezione
+		for name in self.COUNTED:
+			setattr(self.dbHelper.computerColl, name, self.counted(getattr(self.dbHelper.computerColl, name)))
+
+	def counted(self, method):
+		"""
+		Avvolge un metodo della collezione contandone le chiamate.
+
+		:param method (func): il metodo della collezione.
+
+		:return: il metodo che conta i viaggi.
+		"""
+		def wrap(*args, **kwargs):
+			self.trips += 1
+			return method(*args, **kwargs)
+		return wrap
+
+	def start(self):
+		"""
+		Esegue ogni caso con entrambi i metodi di salvataggio e ne mostra i risultati.
+		"""
+		print('Database: {}, connessioni: {}, differenze: {} modificate + {} rimosse, invii: {}'.format(
+			self.database, len(self.model), self.changed, self.removed, self.uploads))
+		print('{:<10} {:<16} {:>12} {:>12} {:>12}'.format('caso', 'metodo', 'viaggi/invio', 'ms/invio', 'connessioni'))
+		for name, details in [('completo', self.get_full), ('differenza', self.get_delta)]:
+			for method, upload in [('upsert_details', self.dbHelper.upsert_details), ('per connessione', self.upload_single)]:
+				trips, elapsed, size = self.run(details, upload)
+				print('{:<10} {:<16} {:>12.0f} {:>12.1f} {:>12}'.format(
+					name, method, trips / self.uploads, elapsed / self.uploads * 1000, size))
+
+	def run(self, details, upload):
+		"""
+		Misura gli invii di un caso partendo ogni volta dal modello completo salvato.
+
+		:param details (func): la funzione che genera i dettagli da inviare.
+		:param upload (func): la funzione che salva i dettagli.
+
+		:return: i viaggi e i secondi totali, e le connessioni salvate dopo l'ultimo invio.
+		"""
+		trips = 0
+		elapsed = 0
+		for i in range(self.uploads):
+			self.dbHelper.computerColl.delete_many({'mac': self.MAC})
+			if details != self.get_full:
+				self.dbHelper.upsert_details(self.get_full())
+			data = details()
+			self.trips = 0
+			start = time()
+			upload(data)
+			elapsed += time() - start
+			trips += self.trips
+		computer = self.dbHelper.computerColl.find_one({'mac': self.MAC})
+		return trips, elapsed, len(computer['model']) if computer is not None and 'model' in computer else 0
+
+	def upload_single(self, data):
+		"""
+		Salva i dettagli con un'operazione per ogni valore e connessione.
+
+		:param data (dict): i dettagli da salvare.
+		"""
+		mac = data['mac']
+		for attr, value in data.items():
+			if attr in DbHelper.DELTA_KEYS:
+				continue
+			elif attr == 'model':
+				for conn in value:
+					self.dbHelper.update_conn(mac, conn)
+			elif attr == 'removed':
+				for conn in value:
+					self.dbHelper.remove_conn(mac, conn)
+			elif type(value) == dict:
+				for key in value:
+					self.dbHelper.update_value(mac, value[key], attr + '.' + key)
+			else:
+				self.dbHelper.update_value(mac, value, attr)
+
+	def get_full(self):
+		"""
+		Genera i dettagli completi di un host.
+
+		:return: i dettagli da inviare.
+		"""
+		return {'mac': self.MAC, 'seq': 1, 'full': True, 'inventory': self.inventory,
+			'modules': {'inventory': True, 'behaviour': True}, 'phase': 'learning',
+			'model': [dict(conn) for conn in self.model]}
+
+	def get_delta(self):
+		"""
+		Genera una differenza rispetto ai dettagli completi: alcune connessioni
+		cambiano sicurezza, altre sono nuove e altre sono rimosse.
+
+		:return: i dettagli da inviare.
+		"""
+		conns = self.rand.sample(self.model, min(len(self.model), self.changed + self.removed))
+		changed = [dict(conn, safe=not conn['safe']) for conn in conns[:self.changed // 2]]
+		changed += [dict(conn, proc='new' + conn['proc']) for conn in conns[self.changed // 2:self.changed]]
+		return {'mac': self.MAC, 'seq': 2, 'full': False, 'inventory': {'cpu.freq': self.rand.uniform(800, 4000)},
+			'model': changed, 'removed': [dict(conn) for conn in conns[self.changed:]]}
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'd', 'full': 'database', 'args': True, 'default': DbBench.DATABASE,
+			'help': 'Il database da usare: "mongomock" oppure l\'indirizzo (ip:porta) di MongoDB.'},
+		{'short': 'n', 'full': 'connections', 'args': True, 'default': DbBench.CONNECTIONS,
+			'help': 'Il numero di connessioni del modello completo.'},
+		{'short': 'm', 'full': 'changed', 'args': True, 'default': DbBench.CHANGED,
+			'help': 'Le connessioni nuove o modificate di ogni differenza.'},
+		{'short': 'r', 'full': 'removed', 'args': True, 'default': DbBench.REMOVED,
+			'help': 'Le connessioni rimosse di ogni differenza.'},
+		{'short': 'u', 'full': 'uploads', 'args': True, 'default': DbBench.UPLOADS,
+			'help': 'Gli invii misurati per ogni caso.'},
+		{'short': 's', 'full': 'seed', 'args': True, 'default': DbBench.SEED,
+			'help': 'Il seme per la generazione dei dati.'}]
+	args = ArgsParser(params, 'Misura i viaggi verso MongoDB e la durata del salvataggio dei dettagli.').parse()
+	DbBench(args['database'], int(args['connections']), int(args['changed']), int(args['removed']),
+		int(args['uploads']), int(args['seed'])).start()
@@ -1,4 +1,5 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from bson import ObjectId
 from datetime import datetime
 
 from common import log
@@ -15,6 +16,19 @@ class DbHelper():
 
 	IP = 0
 	PORT = 1
+	# chiavi del protocollo dei dettagli che non vanno salvate
+	DELTA_KEYS = ['mac', 'seq', 'full']
+	# campi nei quali i Butlers possono rimuovere dei percorsi
+	REMOVABLE_KEYS = ['inventory']
+	# indici creati all'avvio: (collezione, campo, opzioni)
+	INDEXES = [
+		('computerColl', 'mac', {'unique': True}),
+		# le notifiche senza nome non sono considerate dall'indice univoco
+		('notifColl', 'name', {'unique': True, 'partialFilterExpression': {'name': {'$type': 'string'}}}),
+		('bufferColl', 'deliveryStart', {}),
+		('bufferColl', 'notification', {})]
+	# fasi di un piano di esecuzione che non usano indici
+	SCAN_STAGES = ['COLLSCAN']
 	
 	def login(self, ip, port, serverTimeout=500, queryTimeout=1500):
 		"""
@@ -32,6 +46,81 @@ class DbHelper():
 		self.bufferColl = db['buffer']
 		self.notifColl = db['notification']
 		self.computerColl = db['computer']
+		self.ensure_indexes()
+
+	def ensure_indexes(self):
+		"""
+		Crea gli indici delle collezioni, se non esistono già.
+		Un indice che non può essere creato (ad esempio per dei valori
+		duplicati già presenti) non impedisce l'avvio, ma viene segnalato.
+		"""
+		for collName, field, options in self.INDEXES:
+			coll = getattr(self, collName)
+			try:
+				coll.create_index([(field, ASCENDING)], **options)
+			except Exception as e:
+				log.error('Impossibile creare l\'indice "{}" di "{}": {}'.format(field, coll.name, e))
+
+	def get_audit_queries(self):
+		"""
+		Elenca delle query rappresentative di quelle eseguite da questa classe.
+		I valori sono fittizi: conta solo la forma della query.
+
+		:return: la lista delle query, come (descrizione, collezione, filtro).
+		"""
+		conn = {'proc': '', 'source': ['', ''], 'dest': ['', '']}
+		return [
+			('notifica per nome', self.notifColl, {'name': ''}),
+			('notifica per id', self.notifColl, {'_id': ObjectId()}),
+			('buffer per notifica', self.bufferColl, {'notification': ObjectId()}),
+			('buffer da consegnare', self.bufferColl, self.get_due_match(datetime.today())),
+			('buffer per id', self.bufferColl, {'_id': ObjectId()}),
+			('computer per MAC', self.computerColl, {'mac': ''}),
+			('connessione del modello', self.computerColl,
+				{'mac': '', 'model': {'$elemMatch': self.get_conn_filter(conn)}}),
+			('connessione mancante nel modello', self.computerColl,
+				{'mac': '', 'model': {'$not': {'$elemMatch': self.get_conn_filter(conn)}}})]
+
+	def get_stages(self, plan):
+		"""
+		Raccoglie i nomi delle fasi di un piano di esecuzione, a qualunque livello.
+
+		:param plan (dict, list): il piano (o una sua parte).
+
+		:return: la lista dei nomi delle fasi.
+		"""
+		stages = []
+		if type(plan) == dict:
+			if 'stage' in plan:
+				stages.append(plan['stage'])
+			for value in plan.values():
+				stages += self.get_stages(value)
+		elif type(plan) == list:
+			for value in plan:
+				stages += self.get_stages(value)
+		return stages
+
+	def audit_indexes(self):
+		"""
+		Verifica con "explain" che le query di questa classe usino un indice.
+
+		:return: la lista delle query che richiedono una scansione completa,
+			come (descrizione, collezione, fasi del piano).
+		"""
+		scans = []
+		for description, coll, query in self.get_audit_queries():
+			try:
+				plan = coll.find(query).explain()['queryPlanner']['winningPlan']
+			except Exception as e:
+				self.log_db_error(e)
+				continue
+			stages = self.get_stages(plan)
+			if any(stage in self.SCAN_STAGES for stage in stages):
+				log.warning('La query "{}" su "{}" non usa indici: {}'.format(description, coll.name, stages))
+				scans.append((description, coll.name, stages))
+			else:
+				log.info('La query "{}" su "{}" usa un indice: {}'.format(description, coll.name, stages))
+		return scans
 
 
 	def get_notif(self, query={}, filter={}):
@@ -114,29 +203,81 @@ class DbHelper():
 			self.log_db_error(e)
 		return False
 
-	def get_buffer(self):
+	def get_buffer(self, match=None):
 		"""
 		Legge i buffer e unisce i dati in un array senza riferimenti ad ID.
+		Un'unica aggregazione seleziona i buffer da consegnare e ricava il nome
+		della notifica: quelli che fanno riferimento a notifiche che non
+		esistono più vengono eliminati.
+
+		:param match (dict, opzionale): la condizione per selezionare i buffer.
+				Se non è specificata, sono selezionati quelli da consegnare.
+			Default: None.
 
 		:return: i buffer con notifiche che vanno già consegnate.
 		"""
 		buffers = []
 		try:
-			self.clean_buffer()
-			for b in self.bufferColl.find():
-				if str(b['deliveryStart']) < (str(datetime.today())):
-					buffers.append({
-						'_id': b['_id'],
-						'notification': self.get_notif(
-							{'_id': b['notification']},
-							{'_id': 0, 'name': 1})[0]['name'],
-						'recipients': [r for r in b['recipients']],
-						'excluded': [e for e in b['excluded']]
-					})
+			orphans = []
+			if match is None:
+				match = self.get_due_match(datetime.today())
+			for b in self.bufferColl.aggregate(self.get_buffer_pipeline(match)):
+				if 'name' not in b or b['name'] in [None, '']:
+					orphans.append(b['_id'])
+					continue
+				buffers.append({
+					'_id': b['_id'],
+					'notification': b['name'],
+					'recipients': b['recipients'],
+					'excluded': b['excluded']
+				})
+			if orphans != []:
+				log.warning('Eliminati {} buffer di notifiche che non esistono più'.format(
+					self.delete_buffer({'_id': {'$in': orphans}})))
 		except Exception as e:
 			self.log_db_error(e)
 		return buffers
 
+	def get_due_match(self, now):
+		"""
+		Crea la condizione che seleziona i buffer da consegnare.
+		I buffer salvati con la data in formato testuale sono confrontati come stringhe.
+
+		:param now (datetime): la data attuale.
+
+		:return: la condizione per "$match".
+		"""
+		return {'$or': [
+			{'deliveryStart': {'$lte': now}},
+			{'deliveryStart': {'$type': 'string', '$lt': str(now)}}]}
+
+	def get_buffer_pipeline(self, match):
+		"""
+		Crea l'aggregazione che seleziona dei buffer con il nome della notifica.
+
+		:param match (dict): la condizione per selezionare i buffer.
+
+		:return: la lista delle fasi dell'aggregazione.
+		"""
+		return [
+			{'$match': match},
+			{'$lookup': {'from': self.notifColl.name, 'localField': 'notification',
+				'foreignField': '_id', 'as': 'notif'}},
+			{'$project': {'recipients': 1, 'excluded': 1,
+				'name': {'$arrayElemAt': ['$notif.name', 0]}}}]
+
+	def get_buffer_dates(self):
+		"""
+		Legge la data di consegna di tutti i buffer.
+
+		:return: la lista dei buffer con id e data di consegna.
+		"""
+		try:
+			return list(self.bufferColl.find({}, {'deliveryStart': 1}))
+		except Exception as e:
+			self.log_db_error(e)
+		return []
+
 	def add_buffered_notif(self, notifName, recipients, deliveryStart=datetime.today()):
 		"""
 		Aggiunge un nuovo buffer per la notifica passata come parametro.
@@ -144,10 +285,17 @@ class DbHelper():
 		:param notif_name (str): il nome della notifica per la quale creare il buffer.
 		:param recipients (list): i destinatari ai quali andrà inviata la notifica
 		:param deliveryStart (date, optional): . Defaults to datetime.today().
+				Se è una stringa in formato ISO, viene convertita in data.
 
 		:return: il risultato dell'operazione di inserimento se valido, altrimenti False.
 		"""
 		try:
+			if type(deliveryStart) == str:
+				try:
+					# le date native permettono il confronto direttamente nel database
+					deliveryStart = datetime.fromisoformat(deliveryStart)
+				except ValueError:
+					log.warning('Data di inizio "{}" non riconosciuta: salvata come testo'.format(deliveryStart))
 			notifId = self.get_notif_id(notifName)
 			if notifId is None or len(recipients) == 0:
 				log.error('Aggiunta della notifica "{}" in un buffer fallita: il nome non è stato trovato nel database'.format(notifName))
@@ -245,35 +393,133 @@ class DbHelper():
 	def upsert_details(self, data):
 		"""
 		Analizza i dati passati e li inserisce o li aggiorna nel database.
+		Tutte le modifiche sono inviate insieme con un'unica operazione
+		ordinata, che mantiene l'ordine degli aggiornamenti singoli.
 
 		:param data (dict): il dizionario con i vari elementi da inserire.
+
+		:return: False se il database ha restituito un errore, altrimenti True.
 		"""
 		try:
 			if data is None or 'mac' not in data:
-				return
+				return True
+			values = {}
+			removedPaths = {}
+			connOps = []
 			# verifica i dati per ogni attributo, dato che
 			# necessitano di essere trattati in modo differente tra loro
 			for attr in data:
-				# il mac è sempre uguale; non va modificato
-				if attr == 'mac':
+				# il mac è sempre uguale e la sequenza non va salvata
+				if attr in self.DELTA_KEYS:
 					continue
+				elif attr == 'removed':
+					connOps += self.get_remove_ops(data['mac'], data[attr])
+				elif attr == 'removedPaths':
+					removedPaths = {path: '' for path in data[attr] if type(path) == str
+						and any(path.startswith(key + '.') for key in self.REMOVABLE_KEYS)}
 				elif attr == 'model':
 					# se è una lista, va verificato singolarmente ogni elemento
 					if type(data[attr]) == list:
 						for e in data[attr]:
-							self.update_conn(data['mac'], e)
+							connOps += self.get_conn_ops(data['mac'], e)
 					else:
-						self.update_conn(data['mac'], data[attr])
+						connOps += self.get_conn_ops(data['mac'], data[attr])
 				else:
 					# i dizionari necessitano di una chiave ulteriore
 					if type(data[attr]) == dict and data[attr] != {}:
 						for key in list(data[attr].keys()):
-							self.update_value(data['mac'], data[attr][key], attr+'.'+key)
+							values[attr+'.'+key] = data[attr][key]
 					else:
-						self.update_value(data['mac'], data[attr], attr)
+						values[attr] = data[attr]
+
+			# i percorsi rimossi sono eliminati prima di inserire i valori,
+			# che possono sostituirli con dei sotto-percorsi o con un loro genitore;
+			# i valori sono inseriti prima delle connessioni, così che il documento esista
+			ops = [UpdateOne({'mac': data['mac']}, {'$unset': removedPaths})] if removedPaths != {} else []
+			ops += [UpdateOne({'mac': data['mac']}, {'$set': group}, upsert=True)
+				for group in self.group_paths(values)]
+			if ops + connOps != []:
+				self.computerColl.bulk_write(ops + connOps, ordered=True)
+			return True
 		except Exception as e:
 			self.log_db_error(e)
-		
+			return False
+
+	def group_paths(self, values):
+		"""
+		Divide i valori da aggiornare in gruppi senza percorsi in conflitto
+		(ad esempio "inventory.cpu" e "inventory.cpu.freq"), che MongoDB
+		non accetta nella stessa operazione. L'ordine dei valori è mantenuto.
+
+		:param values (dict): i valori da aggiornare, identificati dal percorso.
+
+		:return: la lista dei gruppi di valori.
+		"""
+		groups = []
+		for path, value in values.items():
+			if groups == [] or any(path == other or path.startswith(other + '.') or other.startswith(path + '.')
+				for other in groups[-1]):
+				groups.append({})
+			groups[-1][path] = value
+		return groups
+
+	def get_conn_filter(self, conn):
+		"""
+		Crea la condizione che identifica una connessione nel modello.
+
+		:param conn (dict): i dati della connessione.
+
+		:return: la condizione per "$elemMatch".
+		"""
+		return {
+			'proc': conn['proc'],
+			'$or': [
+				{'$and': [
+					{'dest.{}'.format(self.IP): ''},
+					{'dest.{}'.format(self.PORT): ''},
+					{'dest.{}'.format(self.IP): conn['dest'][self.IP]},
+					{'dest.{}'.format(self.PORT): conn['dest'][self.PORT]},
+					{'source.{}'.format(self.IP): conn['source'][self.IP]},
+					{'source.{}'.format(self.PORT): conn['source'][self.PORT]},
+				]},
+				{'$and': [
+					{'dest.{}'.format(self.IP): {'$ne': ''}},
+					{'dest.{}'.format(self.PORT): {'$ne': ''}},
+					{'dest.{}'.format(self.IP): conn['dest'][self.IP]},
+					{'dest.{}'.format(self.PORT): conn['dest'][self.PORT]},
+					{'source.{}'.format(self.IP): conn['source'][self.IP]}
+				]}
+			]
+		}
+
+	def get_conn_ops(self, mac, conn):
+		"""
+		Prepara le operazioni per inserire o aggiornare una connessione del modello.
+
+		:param mac (str): l'indirizzo MAC del computer.
+		:param conn (dict): i dati da inserire.
+
+		:return: la lista delle operazioni.
+		"""
+		match = self.get_conn_filter(conn)
+		# "$elemMatch" trova l'elemento al quale "model.$" farà riferimento;
+		# se la connessione non è presente, la seconda operazione la aggiunge:
+		# "upsert" non funziona con la condizione di $elemMatch
+		return [UpdateOne({'mac': mac, 'model': {'$elemMatch': match}}, {'$set': {'model.$': conn}}),
+			UpdateOne({'mac': mac, 'model': {'$not': {'$elemMatch': match}}}, {'$addToSet': {'model': conn}})]
+
+	def get_remove_ops(self, mac, conns):
+		"""
+		Prepara le operazioni per rimuovere alcune connessioni dal modello.
+
+		:param mac (str): l'indirizzo MAC del computer.
+		:param conns (list): i dati delle connessioni da rimuovere.
+
+		:return: la lista delle operazioni.
+		"""
+		return [UpdateOne({'mac': mac}, {'$pull': {'model': {
+			'proc': conn['proc'], 'source': conn['source'], 'dest': conn['dest']}}}) for conn in conns]
+
 	def update_conn(self, mac, conn):
 		"""
 		Inserisce o aggiorna una connessione del modello.
@@ -281,36 +527,16 @@ class DbHelper():
 		:param mac (str): l'indirizzo MAC del computer.
 		:param conn (dict): i dati da inserire.
 		"""
-		# "$elemMatch" trova l'elemento al quale "model.$" farà riferimento 
-		result = self.computerColl.find_one_and_update(
-			{'mac': mac, 'model': {'$elemMatch': {
-				'proc': conn['proc'],
-				'$or': [ 
-					{'$and': [
-						{'dest.{}'.format(self.IP): ''},
-						{'dest.{}'.format(self.PORT): ''},
-						{'dest.{}'.format(self.IP): conn['dest'][self.IP]},
-						{'dest.{}'.format(self.PORT): conn['dest'][self.PORT]},
-						{'source.{}'.format(self.IP): conn['source'][self.IP]},
-						{'source.{}'.format(self.PORT): conn['source'][self.PORT]},
-					]},
-					{'$and': [
-						{'dest.{}'.format(self.IP): {'$ne': ''}},
-						{'dest.{}'.format(self.PORT): {'$ne': ''}},
-						{'dest.{}'.format(self.IP): conn['dest'][self.IP]},
-						{'dest.{}'.format(self.PORT): conn['dest'][self.PORT]},
-						{'source.{}'.format(self.IP): conn['source'][self.IP]}
-					]}
-				]
-			}}},
-			{'$set': {'model.$': conn} }
-		)
-
-		# se la connessione non è presente, la aggiunge:
-		# "upsert" non funziona con la condizione di $elemMatch
-		if result is None:
-			self.computerColl.find_one_and_update(
-				{'mac': mac}, {'$addToSet': {'model': conn}})
+		self.computerColl.bulk_write(self.get_conn_ops(mac, conn), ordered=True)
+
+	def remove_conn(self, mac, conn):
+		"""
+		Rimuove una connessione dal modello.
+
+		:param mac (str): l'indirizzo MAC del computer.
+		:param conn (dict): i dati della connessione da rimuovere.
+		"""
+		self.computerColl.bulk_write(self.get_remove_ops(mac, [conn]))
 
 	def update_value(self, mac, value, selector):
 		"""
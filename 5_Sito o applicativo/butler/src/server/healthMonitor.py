@@ -0,0 +1,194 @@
+import threading
+from time import sleep, time
+
+from common import log
+
+class HealthMonitor():
+	"""
+	Questa classe controlla periodicamente lo stato dei Butlers in background.
+	I controlli passano dalla lista dei Butlers (ButlerRegistry), quindi
+	rispettano gli stessi limiti di richieste contemporanee delle altre
+	richieste, e il loro risultato è salvato in una tabella che può essere
+	letta immediatamente senza contattare gli host.
+	Gli host che non rispondono sono controllati sempre più di rado, e vengono
+	rimossi quando non rispondono da troppo tempo.
+
+	Il formato della tabella è:
+	{'192.168.1.2:20219': {'online': True,        # risultato dell'ultimo controllo
+		'lastSeen': 1620000000.0,                # ultima risposta ricevuta
+		'latency': 0.012,                        # durata dell'ultima risposta (in secondi)
+		'failures': 0,                           # controlli falliti consecutivi
+		'nextProbe': 1620000010.0}}              # prossimo controllo
+	"""
+
+	TIMER = 1
+	INTERVAL = 10
+	MAX_BACKOFF = 120
+	EVICT_AFTER = 300
+	MAX_FAILURES = 3
+
+	def __init__(self, butlers, evictCallback, interval=INTERVAL, maxBackoff=MAX_BACKOFF,
+		evictAfter=EVICT_AFTER, maxFailures=MAX_FAILURES):
+		"""
+		Istanzia un oggetto HealthMonitor definendo i Butlers da controllare
+		e la politica di controllo e di rimozione.
+
+		:param butlers (ButlerRegistry): la lista dei Butlers da controllare.
+				La lista è condivisa: gli host aggiunti o rimossi vengono
+				considerati al controllo successivo.
+		:param evictCallback (func): la funzione che rimuove un Butler, dato l'indirizzo.
+		:param interval (int, opzionale): i secondi tra un controllo e l'altro di un host attivo.
+			Default: INTERVAL (10).
+		:param maxBackoff (int, opzionale): i secondi massimi tra un controllo e l'altro
+				di un host che non risponde.
+			Default: MAX_BACKOFF (120).
+		:param evictAfter (int, opzionale): i secondi senza risposta dopo i quali un host è rimosso.
+			Default: EVICT_AFTER (300).
+		:param maxFailures (int, opzionale): i controlli falliti consecutivi necessari
+				per rimuovere un host.
+			Default: MAX_FAILURES (3).
+		"""
+		self.butlers = butlers
+		self.evictCallback = evictCallback
+		self.interval = interval
+		self.maxBackoff = maxBackoff
+		self.evictAfter = evictAfter
+		self.maxFailures = maxFailures
+		self.table = {}
+		self.probing = set()
+		# controlli terminati e non ancora salvati nella tabella
+		self.results = []
+		self.lock = threading.Lock()
+
+	def start(self):
+		"""
+		Avvia il controllo periodico, senza mai terminare.
+		"""
+		log.info('Avvio del controllo dello stato dei Butlers ogni {} secondi'.format(self.interval))
+		while True:
+			try:
+				self.schedule()
+			except Exception as e:
+				log.warning('Errore nel controllo dello stato dei Butlers: {}'.format(e.__str__()))
+			sleep(self.TIMER)
+
+	def schedule(self):
+		"""
+		Salva i controlli terminati, allinea la tabella alla lista dei Butlers
+		e avvia i controlli previsti.
+		"""
+		with self.lock:
+			results, self.results = self.results, []
+		for addr, online, latency in results:
+			try:
+				self.record(addr, online, latency)
+			finally:
+				with self.lock:
+					self.probing.discard(addr)
+
+		now = time()
+		butlers = list(self.butlers.items())
+		with self.lock:
+			for addr in list(self.table):
+				if addr not in self.butlers:
+					del self.table[addr]
+			due = []
+			for addr, butler in butlers:
+				if addr not in self.table:
+					# un Butler appena aggiunto si è autenticato, quindi è attivo
+					self.table[addr] = {'online': True, 'lastSeen': now, 'latency': None,
+						'failures': 0, 'nextProbe': now + self.interval}
+				elif addr not in self.probing and self.table[addr]['nextProbe'] <= now:
+					self.probing.add(addr)
+					due.append(addr)
+		for addr in due:
+			start = time()
+			future = self.butlers.submit(addr, 'get_status')
+			future.add_done_callback(lambda future, addr=addr, start=start: self.collect(addr, start, future))
+
+	def collect(self, addr, start, future):
+		"""
+		Raccoglie il risultato di un controllo in background.
+		È richiamata dall'event loop della lista dei Butlers, quindi il risultato
+		è salvato nella tabella solo al passo successivo di schedule: un Butler
+		da rimuovere non può essere rimosso dall'event loop stesso.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param start (float): l'avvio del controllo.
+		:param future (concurrent.futures.Future): la richiesta terminata.
+		"""
+		online = not future.cancelled() and future.exception() is None and future.result() == True
+		with self.lock:
+			self.results.append((addr, online, time() - start))
+
+	def probe(self, addr):
+		"""
+		Controlla subito lo stato di un Butler, attendendo la risposta, e aggiorna la tabella.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+
+		:return: True se il Butler ha risposto, altrimenti False.
+		"""
+		start = time()
+		# la lista ritorna None per gli errori, i timeout e gli host rimossi
+		online = self.butlers.call(addr, 'get_status') == True
+		self.record(addr, online, time() - start)
+		return online
+
+	def record(self, addr, online, latency=None):
+		"""
+		Salva il risultato di un controllo, calcolando il prossimo.
+		Gli host che non rispondono sono controllati con un intervallo
+		che raddoppia ad ogni fallimento, fino al massimo previsto.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param online (bool): True se il Butler ha risposto.
+		:param latency (float, opzionale): la durata del controllo (in secondi).
+			Default: None.
+		"""
+		now = time()
+		evict = False
+		with self.lock:
+			if addr not in self.butlers:
+				return
+			entry = self.table.setdefault(addr, {'online': online, 'lastSeen': None,
+				'latency': None, 'failures': 0, 'nextProbe': now})
+			entry['online'] = online
+			if online:
+				entry['lastSeen'] = now
+				entry['latency'] = latency
+				entry['failures'] = 0
+				entry['nextProbe'] = now + self.interval
+			else:
+				entry['failures'] += 1
+				entry['nextProbe'] = now + min(self.interval * 2 ** entry['failures'], self.maxBackoff)
+				lastSeen = entry['lastSeen'] if entry['lastSeen'] is not None else 0
+				evict = entry['failures'] >= self.maxFailures and now - lastSeen >= self.evictAfter
+				if evict:
+					del self.table[addr]
+		if evict:
+			log.warning('{} non risponde da più di {} secondi: rimosso dalla lista'.format(addr, self.evictAfter))
+			self.evictCallback(addr)
+
+	def get_status(self, addr):
+		"""
+		Ricava l'ultimo stato conosciuto di un Butler.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+
+		:return: una copia dei dati della tabella, oppure None se l'host non è conosciuto.
+		"""
+		with self.lock:
+			return dict(self.table[addr]) if addr in self.table else None
+
+	def is_online(self, addr):
+		"""
+		Verifica se un Butler ha risposto all'ultimo controllo.
+		Un Butler non ancora controllato è considerato attivo.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+
+		:return: True se il Butler è considerato attivo, altrimenti False.
+		"""
+		status = self.get_status(addr)
+		return status is None or status['online']
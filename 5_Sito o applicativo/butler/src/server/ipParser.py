@@ -2,12 +2,15 @@ import ipaddress
 import re
 
 from common import log
+from server.recipientMatcher import RecipientMatcher
 
 class IPParser():
 	"""
 	Questa classe analizza liste di indirizzi IPv4 ed esegue alcune operazioni
 	di verifica della loro validità.
 	"""
+
+	PATTERN = re.compile(r"((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)((\.)(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)){3}((\/)(([1-2][0-9])|([3][0-2])|([0-9])))?)")
 	
 	def sanitize_ips(self, s):
 		"""
@@ -22,11 +25,10 @@ class IPParser():
 			raw = s.replace('\n', ',').strip(' \n,').replace(' ', ',').replace('-', ',').replace(',,', ',').split(',')
 			cleaned = [ip for ip in raw if ip != '']
 		ips = []
-		pattern = r"((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)((\.)(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)){3}((\/)(([1-2][0-9])|([3][0-2])|([0-9])))?)"
 		for addr in cleaned:
 			ip = ''
 			try:
-				ip = (re.findall(pattern, addr))[0][0]
+				ip = (self.PATTERN.findall(addr))[0][0]
 				ipaddress.IPv4Network(ip, strict=False)
 			except IndexError:
 				continue
@@ -38,6 +40,8 @@ class IPParser():
 	def include(self, range, userIp):
 		"""
 		Controlla se un range di IP contiene un indirizzo.
+		Per verificare più indirizzi con lo stesso range è preferibile
+		usare compile, che analizza il range una sola volta.
 		
 		:param range (str, list): la lista o la stringa con gli IP nei quali cercare.
 		:param userIp (str): l'indirizzo da verificare.
@@ -45,9 +49,18 @@ class IPParser():
 		:return: True se userIp fa parte del range, altrimenti False.
 		"""
 		userIp = self.sanitize_ips(userIp)[0]
-		range = self.sanitize_ips(range)
-		for r in range:
-			if ipaddress.IPv4Address(userIp) in ipaddress.IPv4Network(r, strict=False):
-				log.info('{} appartiene al range {}'.format(userIp, r))
-				return True
-		return False
\ No newline at end of file
+		if self.compile(range).includes(userIp):
+			log.info('{} appartiene al range'.format(userIp))
+			return True
+		return False
+
+	def compile(self, range):
+		"""
+		Analizza un range di IP e prepara un oggetto per verificare
+		velocemente se degli indirizzi ne fanno parte.
+
+		:param range (str, list): la lista o la stringa con gli IP.
+
+		:return: l'oggetto RecipientMatcher corrispondente.
+		"""
+		return RecipientMatcher(self.sanitize_ips(range))
\ No newline at end of file
@@ -0,0 +1,138 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, join
+from time import sleep, time
+import requests
+import urllib3
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+from common.argsParser import ArgsParser
+from common.configParser import ConfigParser
+from server.butlerAPI import ButlerAPI
+
+class LoadTest():
+	"""
+	Questa classe misura le richieste al secondo gestite dall'API per i Butlers
+	con il server HTTP scelto nella configurazione.
+	L'API è avviata in locale con callbacks che rispondono sempre con successo,
+	così che venga misurato solo il costo del server e dell'autenticazione.
+	Ogni client simulato usa una propria sessione, come i Butlers.
+	"""
+
+	IP = '127.0.0.1'
+	PORT = 20290
+	CLIENTS = 32
+	REQUESTS = 50
+	ENDPOINTS = ['/authenticate', '/status', '/details']
+
+	def __init__(self, sslConf, serving, port=PORT, clients=CLIENTS, requests=REQUESTS):
+		"""
+		Istanzia un oggetto LoadTest.
+
+		:param sslConf (dict): il percorso del certificato e della chiave SSL.
+		:param serving (dict): il server HTTP da usare e la sua configurazione.
+		:param port (int, opzionale): la porta sulla quale avviare l'API.
+			Default: PORT (20290).
+		:param clients (int, opzionale): il numero di client contemporanei.
+			Default: CLIENTS (32).
+		:param requests (int, opzionale): le richieste inviate da ogni client per endpoint.
+			Default: REQUESTS (50).
+		"""
+		self.addr = 'https://{}:{}'.format(self.IP, port)
+		self.clients = clients
+		self.requests = requests
+		callbacks = {'add_butler': lambda mac, addr, user: True, 'butler_exists': lambda addr: True,
+			'update_db_details': lambda details: True}
+		self.api = ButlerAPI(self.IP, port, 20, sslConf, callbacks, serving)
+
+	def start(self):
+		"""
+		Avvia l'API, esegue il test su ogni endpoint e ne mostra i risultati.
+		"""
+		urllib3.disable_warnings()
+		threading.Thread(target=self.api.start_api, daemon=True).start()
+		sleep(1)
+		print('Backend: {}, client: {}, richieste per client: {}'.format(
+			self.api.serving['backend'], self.clients, self.requests))
+		for endpoint in self.ENDPOINTS:
+			with ThreadPoolExecutor(max_workers=self.clients) as executor:
+				sessions = list(executor.map(self.create_client, range(self.clients)))
+				start = time()
+				results = list(executor.map(lambda s: self.run(s, endpoint), sessions))
+				elapsed = time() - start
+			latencies = sorted(l for r in results for l in r[0])
+			errors = sum(r[1] for r in results)
+			print('{:<14} {:>8.0f} richieste/s   p50 {:>6.1f} ms   p99 {:>6.1f} ms   errori {}'.format(
+				endpoint, len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+				latencies[int(len(latencies) * 0.99)] * 1000, errors))
+
+	def create_client(self, i):
+		"""
+		Crea la sessione di un client e la autentica.
+
+		:param i (int): il numero del client.
+
+		:return: la sessione, con gli header di autenticazione.
+		"""
+		session = requests.Session()
+		session.trust_env = False
+		session.verify = False
+		session.user = 'loadtest{}'.format(i)
+		resp = session.post(self.addr + '/authenticate', json=self.get_body(session, '/authenticate'))
+		session.headers.update({'token': resp.json()['token'], 'sub': session.user})
+		return session
+
+	def get_body(self, session, endpoint):
+		"""
+		Ricava il corpo di una richiesta.
+
+		:param session (requests.Session): la sessione del client.
+		:param endpoint (str): l'endpoint richiesto.
+
+		:return: il dizionario da inviare.
+		"""
+		if endpoint == '/details':
+			return {'details': {'mac': session.user, 'seq': 1}}
+		return {'mac': session.user, 'addr': session.user, 'user': session.user}
+
+	def run(self, session, endpoint):
+		"""
+		Invia le richieste di un client ad un endpoint.
+
+		:param session (requests.Session): la sessione del client.
+		:param endpoint (str): l'endpoint da richiedere.
+
+		:return: la lista delle durate delle richieste e il numero di errori.
+		"""
+		method = {'/authenticate': 'POST', '/status': 'GET', '/details': 'PUT'}[endpoint]
+		body = self.get_body(session, endpoint)
+		latencies = []
+		errors = 0
+		for i in range(self.requests):
+			start = time()
+			try:
+				resp = session.request(method, self.addr + endpoint, json=body)
+				errors += resp.status_code >= 300
+			except requests.exceptions.RequestException:
+				errors += 1
+			latencies.append(time() - start)
+		return latencies, errors
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'k', 'full': 'config', 'args': True, 'default': '.',
+			'help': 'Usa il file di configurazione dal percorso specificato.'},
+		{'short': 'b', 'full': 'backend', 'args': True, 'default': '',
+			'help': 'Il server HTTP da usare (werkzeug o cheroot).\nSe non specificato, viene usato quello della configurazione.'},
+		{'short': 'c', 'full': 'clients', 'args': True, 'default': LoadTest.CLIENTS,
+			'help': 'Il numero di client contemporanei.'},
+		{'short': 'n', 'full': 'requests', 'args': True, 'default': LoadTest.REQUESTS,
+			'help': 'Il numero di richieste di ogni client per endpoint.'}]
+	args = ArgsParser(params, 'Misura le richieste al secondo gestite dall\'API per i Butlers.').parse()
+	configs = ConfigParser().load_configs(args['config'])
+	serving = dict(configs['serving'])
+	if args['backend'] != '':
+		serving['backend'] = args['backend']
+	LoadTest(configs['ssl'], serving, clients=int(args['clients']), requests=int(args['requests'])).start()
@@ -6,8 +6,9 @@ from os.path import abspath, isfile, join, basename, exists
 from time import sleep, time
 from json.decoder import JSONDecodeError
 import sys
-import copy
 import webbrowser
+import json
+from concurrent.futures import as_completed
 
 sys.path.append(abspath(join(sys.path[0], '..')))
 
@@ -16,12 +17,17 @@ from common import log
 from common.notificationBuilder import NotificationBuilder
 from common.configParser import ConfigParser
 from common.argsParser import ArgsParser
+from common.lruCache import LRUCache
 from server.controlCenterGUI import ControlCenterGUI
 from server.controlCenterAPI import ControlCenterAPI
 from server.butlerAPI import ButlerAPI
 from server.ipParser import IPParser
 from server.butler import Butler
+from server.butlerRegistry import ButlerRegistry
+from server.pushChannel import PushChannel
 from server.dbHelper import DbHelper
+from server.healthMonitor import HealthMonitor
+from server.bufferScheduler import BufferScheduler
 
 class Manager:
 	"""
@@ -31,7 +37,12 @@ class Manager:
 
 	TIMER = 1
 	STANDARD_MODEL_MAC = ''
-	butlers = {}
+	# età massima (in secondi) dei dettagli mostrati nel centro di controllo
+	DETAILS_MAX_AGE = 15
+	# notifiche e file già preparati per l'invio
+	NOTIF_CACHE_SIZE = 32
+	FILES_CACHE_SIZE = 16
+	butlers = None
 	interactions = {}
 
 	collMap = {'connection': 'model', 'phase': 'phase', 'module': 'modules'}
@@ -57,7 +68,9 @@ I parametri possibili sono:
 			 '''Non avvia l'interfaccia web.
 Il server rimane raggiungibile attraverso richieste REST.'''},
 			{'short': 'p', 'full': 'passive', 'args': False, 'default': '',
-			 'help': 'Ignora il buffer delle notifiche.'}
+			 'help': 'Ignora il buffer delle notifiche.'},
+			{'short': 'a', 'full': 'audit', 'args': False, 'default': '',
+			 'help': 'Verifica che le query del database usino gli indici, poi termina.'}
 		]
 		argsParser = ArgsParser(params)
 		args = argsParser.parse()
@@ -73,19 +86,36 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 			return
 
 		Logger().start(**self.configs['logging'])
+		if args['audit']:
+			# verifica gli indici del database senza avviare il server
+			dbHelper = DbHelper()
+			dbHelper.login(**self.configs["database"])
+			scans = dbHelper.audit_indexes()
+			log.warning('Verifica degli indici terminata: {} query senza indici'.format(len(scans)))
+			return
 		self.ipParser = IPParser()
+		self.notifCache = LRUCache(self.NOTIF_CACHE_SIZE)
+		self.filesCache = LRUCache(self.FILES_CACHE_SIZE)
 		self.expireTime = self.configs['expireTime']
 		self.protocol = self.configs['protocol']
 		self.serverConf = self.configs['server']
 		self.controlConf = self.configs['controlCenter']
 		self.guiConf = self.configs['gui']
 		self.testNotifData = ''
+		self.bufferScheduler = None
+		self.pushChannel = None
+		# ultimo numero di sequenza dei dettagli ricevuto da ogni MAC
+		self.detailsSeq = {}
+		self.detailsLock = threading.Lock()
 
 		self.addr = '{}://{}:{}'.format(self.protocol,
 										self.serverConf['ip'], self.serverConf['port'])
 		self.id = self.serverConf['id']
 		log.info('Avvio del server su {}'.format(self.addr))
 
+		# la lista dei Butlers gestisce anche tutte le richieste inviate loro
+		self.butlers = ButlerRegistry(**self.configs['registry'])
+
 		# avvio dell'ascoltatore dei Butlers
 		butlerCallbacks = {'add_butler': self.add_butler,
 					 'disconnect': self.disconnect_client,
@@ -94,9 +124,20 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 
 		self.butlerApi = ButlerAPI(self.serverConf['ip'], self.serverConf['port'],
 							 self.expireTime, self.configs['ssl'], butlerCallbacks,
-							 )
+							 self.configs['serving'])
 		threading.Thread(target=self.butlerApi.start_api, daemon=True).start()
 
+		# i Butlers possono aprire un canale sul quale ricevere i comandi
+		channelConf = self.configs['channel']
+		if channelConf['enabled']:
+			self.pushChannel = PushChannel(self.butlers.loop, self.serverConf['ip'], channelConf['port'],
+				self.butlerApi.sslConf, self.verify_channel, channelConf['keepAlive'], channelConf['timeout'])
+			try:
+				self.pushChannel.start()
+			except OSError as e:
+				log.warning('Non è stato possibile avviare il canale per i Butlers: {}'.format(e.__str__()))
+				self.pushChannel = None
+
 		# imposta e avvia l'API del centro di controllo
 		controlCenterAddr = '{}://{}:{}'.format(
 			self.protocol, self.controlConf['ip'], self.controlConf['port'])
@@ -107,7 +148,8 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 					  'can_disconnect': self.can_disconnect, 'force_disconnect': self.force_disconnect,
 					  'get_files': self.get_files_list, 'revoke': self.revoke,
 					  'validate_credentials': self.validate_credentials,
-					  'test_notif': self.test_notif,
+					  'test_notif': self.test_notif, 'invalidate_notif': self.invalidate_notif,
+					  'add_buffer': self.add_buffer,
 					  'get_butler_details': self.get_butler_details,
 					  'set_butler_details': self.set_butler_details,
 					  'edit_butler': self.edit_butler, 'apply_standard_model': self.apply_standard_model}
@@ -118,20 +160,27 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		self.controlCenterApi = ControlCenterAPI(self.controlConf['ip'], self.controlConf['port'],
 										   self.configs['expireTime'], self.configs['ssl'], controlCallbacks,
 										   self.dbHelper, self.configs['imagesPath'], self.controlConf['previewPort'],
-										   '{}://{}:{}'.format(self.protocol, self.guiConf['ip'], self.guiConf['port']), sections)
+										   '{}://{}:{}'.format(self.protocol, self.guiConf['ip'], self.guiConf['port']), sections,
+										   self.configs['serving'])
 		threading.Thread(target=self.controlCenterApi.start_api, daemon=True).start()
 
+		# avvio del controllo dello stato dei Butlers
+		self.healthMonitor = HealthMonitor(self.butlers, self.evict_butler, **self.configs['healthMonitor'])
+		threading.Thread(target=self.healthMonitor.start, daemon=True).start()
+
 		# avvio del controllo del buffer
 		if self.configs['bufferTimer'] >= 1 and not args['passive']:
-			threading.Thread(target=self.check_buffer, args=[
-				self.configs['bufferTimer']], daemon=True).start()
+			# bufferTimer è l'attesa massima tra due tentativi di consegna
+			self.bufferScheduler = BufferScheduler(self.dbHelper, self.deliver_buffer, self.configs['bufferTimer'])
+			threading.Thread(target=self.bufferScheduler.start, daemon=True).start()
 
 		# prepara l'interfaccia grafica del server
 		guiAddr = '{}://{}:{}'.format(
 			self.protocol, self.guiConf['ip'], self.guiConf['port'])
 
 		self.controlCenterGui = ControlCenterGUI(self.guiConf['ip'], self.guiConf['port'],
-										   controlCenterAddr, self.configs['ssl'], self.configs['gui']['templatesPath'], self.configs['gui']['resPath'])
+										   controlCenterAddr, self.configs['ssl'], self.configs['gui']['templatesPath'], self.configs['gui']['resPath'],
+										   self.configs['serving'])
 		threading.Thread(target=self.controlCenterGui.start_api, daemon=True).start()
 
 		# se necessario, apre una finestra del browser per la GUI
@@ -154,28 +203,35 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		except KeyboardInterrupt:
 			sys.exit()
 
-	def check_buffer(self, timer):
+	def deliver_buffer(self, b):
 		"""
-		Controlla periodicamente il buffer delle notifiche in sospeso,
-		se il parametro è maggiore o uguale a 1 secondo.
-		
-		:param timer (int): il tempo di attesa tra i controlli (in secondi).
+		Invia la notifica di un buffer ai destinatari non ancora raggiunti
+		e aggiorna il buffer nel database.
+
+		:param b (dict): i dati del buffer.
+
+		:return: True se tutti i destinatari sono stati raggiunti.
 		"""
-		log.info('Inizio del controllo del buffer')
-		try:
-			while True:
-				for b in self.dbHelper.get_buffer():
-					log.info('Tentativo di invio della notifica "{}" dal buffer'.format(
-						b['notification']))
-					for addr in self.send_notif(b['notification'], b['recipients'], b['excluded']):
-						if self.butlers[addr].ip not in b['excluded']:
-							b['excluded'].append(self.butlers[addr].ip)
-						log.info('Notifica "{}" inviata a {}'.format(b['notification'], addr))
-					self.dbHelper.update_buffer(b)
-					sleep(1)
-				sleep(timer)
-		except KeyboardInterrupt:
-			sys.exit()
+		log.info('Tentativo di invio della notifica "{}" dal buffer'.format(
+			b['notification']))
+		for addr in self.send_notif(b['notification'], b['recipients'], b['excluded']):
+			# l'indirizzo è composto da ip e porta
+			ip = addr.split(':')[0]
+			if ip not in b['excluded']:
+				b['excluded'].append(ip)
+			log.info('Notifica "{}" inviata a {}'.format(b['notification'], addr))
+		self.dbHelper.update_buffer(b)
+		return b['recipients'] == []
+
+	def add_buffer(self, bufferId, deliveryStart):
+		"""
+		Pianifica la consegna di un nuovo buffer, se il buffer è attivo.
+
+		:param bufferId (ObjectId): l'id del buffer.
+		:param deliveryStart (datetime, str): la data di consegna.
+		"""
+		if self.bufferScheduler is not None:
+			self.bufferScheduler.add(bufferId, deliveryStart)
 
 	def send_notif(self, name, recipients, excluded=[]):
 		"""
@@ -187,22 +243,40 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		:param excluded (list): la lista degli indirizzi da non considerare.
 			Default: [].
 		
-		:yield: gli indirizzi di chi ha risposto all'invio della notifica.
+		:yield: gli indirizzi di chi ha risposto all'invio della notifica,
+			nell'ordine in cui arrivano le conferme.
 		"""
+		# la lista è copiata perchè i Butlers possono cambiare durante l'invio
+		butlers = list(self.butlers.items())
 		# la wildcard * viene sostituita da tutti i destinatari
 		if recipients == ['*']:
-			recipients = [self.butlers[addr].ip for addr in self.butlers]
+			recipients = [butler.ip for addr, butler in butlers]
 		# i destinatari vengono rimossi se presenti tra quelli esclusi
 		recipients = [addr for addr in recipients if addr not in excluded]
 
 		log.warning('Invio di "{}" a {} Butler'.format(name, len(recipients)))
-		for addr in self.butlers:
-			if self.butlers[addr].ip not in excluded and self.ipParser.include(recipients, self.butlers[addr].ip):
-				data = self.parse_notif_data(self.dbHelper.get_notif_data(name))
-				received = self.butlers[addr].send({'notifData': data})
-				if received:
-					log.info('{} ha ricevuto "{}"'.format(addr, name))
-					yield addr
+		# la lista dei destinatari è analizzata una sola volta per tutti i Butlers
+		matcher = self.ipParser.compile(recipients)
+		excluded = set(excluded)
+		targets = [(addr, butler) for addr, butler in butlers
+			if butler.ip not in excluded and matcher.includes(butler.ip)]
+		if targets == []:
+			return
+
+		# i dati (e i file allegati) sono preparati una sola volta per tutti
+		payload = {'notifData': self.get_notif_payload(name)}
+		start = time()
+		delivered = 0
+		# gli invii sono eseguiti in parallelo dalla lista dei Butlers
+		sending = {self.butlers.submit(addr, 'send', payload): addr for addr, butler in targets}
+		for future in as_completed(sending):
+			addr = sending[future]
+			if future.result():
+				delivered += 1
+				log.info('{} ha ricevuto "{}"'.format(addr, name))
+				yield addr
+		log.warning('Notifica "{}" consegnata a {} Butler su {} in {:.2f} secondi'.format(
+			name, delivered, len(targets), time() - start))
 
 	def validate_credentials(self, user, password):
 		"""
@@ -227,13 +301,13 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		:param user (str): il nome dell'utente.
 		"""
 		if self.addr_exists(addr):
-			return self.butlers[addr].get_status()
+			return self.butlers.call(addr, 'get_status') == True
 
-		b = Butler(self.protocol, mac, addr, user, self.addr, self.id)
+		b = Butler(self.protocol, mac, addr, user, self.addr, self.id, channel=self.pushChannel,
+			requests=self.configs['requests'])
 		if b.authenticate():
 			log.info('Autenticazione con {} riuscita, aggiunto alla lista.'.format(addr))
-			# la deepcopy permette di passare una versione dell'oggetto, non un riferimento
-			self.butlers[addr] = copy.deepcopy(b)
+			self.butlers[addr] = b
 			threading.Thread(target=self.set_butler_details, args=[addr]).start()
 			return True
 		else:
@@ -241,6 +315,27 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 			del b
 			return False
 
+	def verify_channel(self, token, sub, addr, ip):
+		"""
+		Verifica che un Butler possa aprire un canale: deve essere nella lista,
+		aprire il canale dal proprio ip e presentare un token valido rilasciato
+		dall'API per i Butlers proprio per il suo indirizzo.
+
+		:param token (str): il token del Butler.
+		:param sub (str): il soggetto del token (il nome dell'utente).
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param ip (str): l'ip dal quale è stato aperto il canale.
+
+		:return: True se il canale può essere aperto.
+		"""
+		butler = self.butlers.get(addr)
+		if butler is None:
+			return False
+		if butler.ip != ip:
+			log.warning('Canale per {} aperto da un ip diverso ({})'.format(addr, ip))
+			return False
+		return self.butlerApi.auth.is_valid(token, sub, {'addr': addr})
+
 	def disconnect_client(self, addr):
 		"""
 		Disconnette un client se ne ha il permesso.
@@ -253,7 +348,7 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		if self.addr_exists(addr):
 			if self.butlers[addr].canDisconnect:
 				log.warning('Disconnessione di {} avvenuta'.format(addr))
-				self.butlers[addr].disconnect()
+				self.butlers.call(addr, 'disconnect')
 				# se non c'è la chiave, ritorna ''
 				self.butlers.pop(addr, '')
 			else:
@@ -273,6 +368,8 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 	def check_butlers(self, addr=''):
 		"""
 		Verifica lo stato dei Butlers.
+		Un singolo Butler viene contattato subito, mentre la lista completa
+		è letta dalla tabella del controllo in background, senza attese.
 		
 		:param addr (str): l'indirizzo IPv4 e la porta del Butler da controllare.
 			Default: ''.
@@ -283,34 +380,52 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 			è possibile verificare chi è andato offline rispetto all'ultimo controllo.
 		"""
 		if self.addr_exists(addr):
-			if self.butlers[addr].get_status():
-				return [{'addr': addr, 'user': self.butlers[addr].user,
-							'mac': self.butlers[addr].mac,
-							'canDisconnect': self.butlers[addr].canDisconnect}]
+			if self.healthMonitor.probe(addr):
+				return [self.get_butler_info(addr)]
 			else:
-				del self.butlers[addr]
+				# il controllo può aver già rimosso il Butler (evict_butler)
+				self.butlers.pop(addr, None)
 		elif addr == '':
-			# se l'indirizzo è vuoto, vengono verificati tutti i Butlers
+			# se l'indirizzo è vuoto, viene ritornato l'ultimo stato di tutti i Butlers
 			butlersInfo = []
-			try:
-				for addr in self.butlers:
-					if self.butlers[addr].get_status():
-						butlersInfo.append({'addr': addr,
-											'user': self.butlers[addr].user,
-											'mac': self.butlers[addr].mac,
-											'canDisconnect': self.butlers[addr].canDisconnect})
-					else:
-						butlersInfo.append({'addr': addr})
-			except Exception as e:
-				log.warning(
-					'Errore nella verifica dello stato dei Butlers: {}'.format(e.__str__()))
-			for b in butlersInfo:
-				if 'user' not in b and b['addr'] in self.butlers:
-					del self.butlers[b['addr']]
+			for addr in list(self.butlers):
+				if self.healthMonitor.is_online(addr):
+					butlersInfo.append(self.get_butler_info(addr))
+				else:
+					butlersInfo.append({'addr': addr})
 			return butlersInfo
 
 		return {'addr': addr}
 
+	def get_butler_info(self, addr):
+		"""
+		Raccoglie le informazioni di un Butler da mostrare nella lista,
+		insieme all'ultima risposta ricevuta e alla sua durata.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+
+		:return: il dizionario con le informazioni, oppure il solo indirizzo
+			se nel frattempo il Butler è stato rimosso.
+		"""
+		butler = self.butlers.get(addr)
+		if butler is None:
+			return {'addr': addr}
+		info = {'addr': addr, 'user': butler.user, 'mac': butler.mac,
+			'canDisconnect': butler.canDisconnect}
+		status = self.healthMonitor.get_status(addr)
+		if status is not None:
+			info['lastSeen'] = status['lastSeen']
+			info['latency'] = status['latency']
+		return info
+
+	def evict_butler(self, addr):
+		"""
+		Rimuove un Butler che non risponde più.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		"""
+		self.butlers.pop(addr, '')
+
 	def can_disconnect(self, addr, permission):
 		"""
 		Imposta il permesso di disconnessione di un client.
@@ -338,8 +453,7 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		
 		:param name (str): il nome della notifica da chiudere.
 		"""
-		for addr in self.butlers:
-			self.butlers[addr].revoke(name)
+		self.butlers.broadcast(list(self.butlers), 'revoke', name)
 
 	def test_notif(self, data):
 		"""
@@ -401,6 +515,7 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 	def get_file_data(self, basePath, path):
 		"""
 		Tenta di leggere i dati del file nel percorso specificato.
+		I dati codificati sono memorizzati finchè il file non viene modificato.
 		
 		:param basePath (str): la base del percorso nel quale cercare.
 		:param path (str): il percorso che specifica almeno il nome del file.
@@ -408,15 +523,17 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		:return: i dati base64 del file se esiste, altrimenti il suo percorso.
 		"""
 		try:
-			fullPath = abspath(join(sys.path[0], basePath, path))
-			if exists(path):
-				pass
-			elif exists(fullPath):
-				path = fullPath
+			path = self.find_file(basePath, path)
+			key = (path, os.path.getmtime(path))
+			data = self.filesCache.get(key)
+			if data is not None:
+				return data
 			with open(path, "r+b") as file:
 				log.warning(
 					'È stato inviato il file in "{}" insieme ad una notifica'.format(path))
-				return base64.b64encode(file.read()).decode()
+				data = base64.b64encode(file.read()).decode()
+				self.filesCache.set(key, data)
+				return data
 		except Exception as e:
 			log.warning(
 				'Il file verrà inviato come percorso a causa del seguente errore: {}'.format(e.__str__()))
@@ -424,6 +541,75 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 			'È stato inviato il percorso "{}" insieme ad una notifica (non è stato trovato localmente)'.format(path))
 		return path
 
+	def find_file(self, basePath, path):
+		"""
+		Cerca un file prima nel percorso specificato, poi in quello di base.
+
+		:param basePath (str): la base del percorso nel quale cercare.
+		:param path (str): il percorso che specifica almeno il nome del file.
+
+		:return: il percorso del file trovato, altrimenti quello specificato.
+		"""
+		fullPath = abspath(join(sys.path[0], basePath, path))
+		if not exists(path) and exists(fullPath):
+			return fullPath
+		return path
+
+	def get_mtime(self, basePath, path):
+		"""
+		Ricava la data di modifica di un file allegato ad una notifica.
+
+		:param basePath (str): la base del percorso nel quale cercare.
+		:param path (str): il percorso che specifica almeno il nome del file.
+
+		:return: la data di modifica, oppure None se il file non esiste.
+		"""
+		if path == '':
+			return None
+		try:
+			return os.path.getmtime(self.find_file(basePath, path))
+		except OSError:
+			return None
+
+	def get_notif_payload(self, name):
+		"""
+		Prepara i dati di una notifica per l'invio.
+		Le notifiche già preparate sono identificate dal nome, dalla versione
+		del documento e dalla data di modifica dei file allegati: se nessuno
+		di questi cambia, i file non vengono riletti nè codificati.
+
+		:param name (str): il nome della notifica.
+
+		:return: i dati della notifica pronti all'uso.
+		"""
+		data = self.dbHelper.get_notif_data(name)
+		if data == []:
+			return self.parse_notif_data(data)
+		version = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+		image = data['style']['image'] if 'style' in data else ''
+		key = (name, version, self.get_mtime(self.configs['imagesPath'], image),
+			self.get_mtime(self.configs['scriptsPath'], data['script']['command']))
+
+		payload = self.notifCache.get(key)
+		if payload is None:
+			payload = self.parse_notif_data(data)
+			if image != '' and payload['style']['image'] != image:
+				# il client usa l'hash per non decodificare più volte la stessa immagine
+				payload['style']['imageHash'] = hashlib.sha1(
+					payload['style']['image'].encode()).hexdigest()
+			self.notifCache.set(key, payload)
+		return payload
+
+	def invalidate_notif(self, name):
+		"""
+		Rimuove una notifica dalla cache, in seguito ad una modifica o all'eliminazione.
+
+		:param name (str): il nome della notifica.
+		"""
+		removed = self.notifCache.remove(lambda key: key[0] == name)
+		if removed > 0:
+			log.info('Rimossi dalla cache {} dati preparati della notifica "{}"'.format(removed, name))
+
 	"""
 	#####################################
 	Funzioni aggiuntive butler-extensions
@@ -441,7 +627,7 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		if self.addr_exists(addr) and endpoint != '' and data != '':
 			data['mac'] = self.butlers[addr].mac
 			self.dbHelper.upsert_details(data)
-			self.butlers[addr].edit(data, endpoint)
+			self.butlers.call(addr, 'edit', data, endpoint)
 
 	def apply_standard_model(self, addr):
 		"""
@@ -459,7 +645,7 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 			if 'model' in standardModel:
 				standardModel['mac'] = self.butlers[addr].mac
 				self.dbHelper.upsert_details(standardModel)
-				self.butlers[addr].update_model(standardModel['model'])
+				self.butlers.call(addr, 'update_model', standardModel['model'])
 				return len(standardModel['model'])
 		return 0
 
@@ -474,10 +660,10 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 		"""
 		if self.addr_exists(addr):
 
-			details = self.butlers[addr].get_details()
+			details = self.butlers.call(addr, 'get_details', self.DETAILS_MAX_AGE)
 			# se non ci sono dettagli, verifica che l'host sia ancora connesso
-			if details == {}:
-				self.check_butlers()
+			if details is None or details == {}:
+				self.check_butlers(addr)
 				return {}
 
 			self.set_butler_details(addr, details)
@@ -534,9 +720,9 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 					self.dbHelper.upsert_details(
 						{'mac': self.butlers[addr].mac, 'model': butlerDetails['model']})
 
-				self.butlers[addr].update_model(dbDetails['model'])
+				self.butlers.call(addr, 'update_model', dbDetails['model'])
 				if 'phase' in dbDetails:
-					self.butlers[addr].edit({'phase': dbDetails['phase']}, '/phase')
+					self.butlers.call(addr, 'edit', {'phase': dbDetails['phase']}, '/phase')
 					
 			# solo se il database non ha informazioni a riguardo vengono prese
 			# direttamente quelle del Butler
@@ -551,7 +737,7 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 
 			# anche i moduli hanno la precedenza se presenti nel database
 			if 'modules' in dbDetails:
-				self.butlers[addr].edit({'modules': dbDetails['modules']}, '/module')
+				self.butlers.call(addr, 'edit', {'modules': dbDetails['modules']}, '/module')
 			elif 'modules' in butlerDetails:
 				self.dbHelper.upsert_details(
 					{'mac': self.butlers[addr].mac, 'modules': butlerDetails['modules']})
@@ -559,10 +745,38 @@ Il server rimane raggiungibile attraverso richieste REST.'''},
 	def update_db_details(self, details):
 		"""
 		Aggiorna le informazioni ricevute dal Butler nel database.
+		Se i dati contengono solo le differenze dall'invio precedente,
+		sono applicati unicamente se il numero di sequenza è quello atteso.
 
 		:param details (dict): i dati da aggiornare.
-		"""
-		self.dbHelper.upsert_details(details)
+
+		:return: True se i dati sono stati applicati, False se il Butler
+			deve inviare nuovamente tutti i dettagli (anche se il salvataggio è fallito).
+		"""
+		# i Butler precedenti non inviano la sequenza
+		if 'seq' in details and 'mac' in details:
+			mac = details['mac']
+			full = 'full' in details and details['full']
+			# controllo e aggiornamento della sequenza avvengono insieme,
+			# così che due invii contemporanei non possano accettare lo stesso numero
+			with self.detailsLock:
+				continuous = full or (mac in self.detailsSeq and details['seq'] == self.detailsSeq[mac] + 1)
+				if continuous:
+					self.detailsSeq[mac] = details['seq']
+			if not continuous:
+				log.warning('Sequenza dei dettagli di {} non continua ({}): richiesto un invio completo'.format(
+					mac, details['seq']))
+				return False
+		if not self.dbHelper.upsert_details(details):
+			# le differenze successive non possono essere applicate:
+			# senza sequenza, il prossimo invio accettato è quello completo
+			if 'seq' in details and 'mac' in details:
+				with self.detailsLock:
+					self.detailsSeq.pop(details['mac'], None)
+			log.warning('Dettagli di {} non salvati: richiesto un invio completo'.format(
+				details['mac'] if 'mac' in details else ''))
+			return False
+		return True
 
 	def butler_exists(self, addr):
 		"""
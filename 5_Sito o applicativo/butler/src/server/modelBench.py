@@ -0,0 +1,134 @@
+import sys
+import gc
+import random
+import tracemalloc
+from os.path import abspath, join
+from time import time
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+from common.argsParser import ArgsParser
+from client import behaviour
+from client.detailsTracker import DetailsTracker
+from server.scanBench import ScanBench
+
+class ModelBench():
+	"""
+	Questa classe misura la memoria e la durata dell'aggiornamento del modello
+	delle connessioni di un Butler. Ogni ciclo esegue Behaviour.get_model,
+	DetailsTracker.get_delta e DetailsTracker.commit, come il ciclo di invio
+	dei dettagli del client.
+	Il sistema è quello simulato di ScanBench, senza ritardi: ad ogni ciclo
+	una parte delle connessioni cambia porta sorgente, così che il modello
+	cresca e le differenze non siano vuote.
+	La memoria è misurata con tracemalloc: quella trattenuta dal modello
+	dopo il primo invio e il picco di ogni ciclo. La durata è misurata
+	in cicli separati, senza tracemalloc.
+	"""
+
+	CONNECTIONS = 3000
+	SOCKETS = ScanBench.SOCKETS
+	CHURN = 0.01
+	TICKS = 5
+	SEED = 1
+
+	def __init__(self, connections=CONNECTIONS, churn=CHURN, ticks=TICKS, seed=SEED):
+		"""
+		Istanzia un oggetto ModelBench e genera il sistema simulato.
+
+		:param connections (int, opzionale): il numero di connessioni del sistema.
+			Default: CONNECTIONS (3000).
+		:param churn (float, opzionale): la frazione di connessioni che cambiano ad ogni ciclo.
+			Default: CHURN (0.01).
+		:param ticks (int, opzionale): i cicli misurati.
+			Default: TICKS (5).
+		:param seed (int, opzionale): il seme per la generazione dei dati.
+			Default: SEED (1).
+		"""
+		self.churn = churn
+		self.ticks = ticks
+		self.rand = random.Random(seed)
+		withSockets = max(1, connections // self.SOCKETS)
+		self.scan = ScanBench(withSockets, withSockets, self.SOCKETS, syscall=0, seed=seed)
+		behaviour.psutil = self.scan.fake_psutil()
+
+	def change_connections(self):
+		"""
+		Cambia la porta sorgente di una parte delle connessioni simulate.
+		"""
+		conns = [(pid, i) for pid in self.scan.sockets for i in range(len(self.scan.sockets[pid]))]
+		for pid, i in self.rand.sample(conns, int(len(conns) * self.churn)):
+			conn = self.scan.sockets[pid][i]
+			self.scan.sockets[pid][i] = conn._replace(laddr=conn.laddr._replace(port=self.rand.randint(1024, 65535)))
+
+	def tick(self, b, tracker):
+		"""
+		Esegue un ciclo di aggiornamento e invio del modello.
+
+		:param b (Behaviour): il modulo del comportamento.
+		:param tracker (DetailsTracker): il tracker dei dettagli inviati.
+
+		:return: il numero di connessioni inviate come differenza.
+		"""
+		delta = tracker.get_delta({'model': b.get_model()})
+		tracker.commit()
+		return len(delta['model']) if delta is not None and 'model' in delta else 0
+
+	def start(self):
+		"""
+		Esegue i cicli misurando la memoria e la durata, e ne mostra i risultati.
+		"""
+		print('Sistema simulato: {} connessioni, {:.0%} cambiate per ciclo, cicli: {}'.format(
+			sum(len(s) for s in self.scan.sockets.values()), self.churn, self.ticks))
+		state = self.rand.getstate()
+		sockets = {pid: list(conns) for pid, conns in self.scan.sockets.items()}
+
+		b = behaviour.Behaviour()
+		tracker = DetailsTracker()
+		gc.collect()
+		tracemalloc.start()
+		self.tick(b, tracker)
+		gc.collect()
+		retained, peak = tracemalloc.get_traced_memory()
+		blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+		print('modello trattenuto  {:>8.0f} KiB  {:>7} blocchi  (picco del primo invio {:.0f} KiB)'.format(
+			retained / 1024, blocks, peak / 1024))
+		peaks = []
+		for i in range(self.ticks):
+			self.change_connections()
+			current = tracemalloc.get_traced_memory()[0]
+			tracemalloc.reset_peak()
+			self.tick(b, tracker)
+			peaks.append(tracemalloc.get_traced_memory()[1] - current)
+		tracemalloc.stop()
+		print('picco per ciclo     {:>8.0f} KiB  (massimo {:.0f} KiB)'.format(
+			sum(peaks) / len(peaks) / 1024, max(peaks) / 1024))
+
+		# gli stessi cicli sono ripetuti senza tracemalloc per misurarne la durata
+		self.rand.setstate(state)
+		self.scan.sockets = sockets
+		b = behaviour.Behaviour()
+		tracker = DetailsTracker()
+		self.tick(b, tracker)
+		elapsed = 0
+		sent = 0
+		for i in range(self.ticks):
+			self.change_connections()
+			start = time()
+			sent += self.tick(b, tracker)
+			elapsed += time() - start
+		print('durata per ciclo    {:>8.1f} ms  {:>7} connessioni nel modello  {:.0f} inviate per ciclo'.format(
+			elapsed / self.ticks * 1000, len(b.model), sent / self.ticks))
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'n', 'full': 'connections', 'args': True, 'default': ModelBench.CONNECTIONS,
+			'help': 'Il numero di connessioni del sistema simulato.'},
+		{'short': 'c', 'full': 'churn', 'args': True, 'default': ModelBench.CHURN,
+			'help': 'La frazione di connessioni che cambiano ad ogni ciclo.'},
+		{'short': 't', 'full': 'ticks', 'args': True, 'default': ModelBench.TICKS,
+			'help': 'I cicli misurati.'},
+		{'short': 's', 'full': 'seed', 'args': True, 'default': ModelBench.SEED,
+			'help': 'Il seme per la generazione dei dati.'}]
+	args = ArgsParser(params, 'Misura la memoria e la durata dell\'aggiornamento del modello.').parse()
+	ModelBench(int(args['connections']), float(args['churn']), int(args['ticks']), int(args['seed'])).start()
@@ -0,0 +1,115 @@
+import sys
+import threading
+from os.path import abspath, join
+from time import sleep, time
+import requests
+import urllib3
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+from common.argsParser import ArgsParser
+from common.configParser import ConfigParser
+from common.requestSubmitter import RequestSubmitter
+from server.butlerAPI import ButlerAPI
+
+class PoolBench():
+	"""
+	Questa classe misura la durata delle richieste GET /status inviate una dopo
+	l'altra con le funzioni di modulo di requests (una nuova connessione, e un nuovo
+	handshake TLS, per ogni richiesta) e con la sessione di RequestSubmitter,
+	che mantiene le connessioni aperte.
+	L'API per i Butlers è avviata in locale con il server HTTP scelto nella
+	configurazione e con callbacks che rispondono sempre con successo.
+	"""
+
+	IP = '127.0.0.1'
+	PORT = 20291
+	REQUESTS = 1000
+	USER = 'poolbench'
+
+	def __init__(self, sslConf, serving, port=PORT, requests=REQUESTS, poolSize=RequestSubmitter.POOL_SIZE):
+		"""
+		Istanzia un oggetto PoolBench.
+
+		:param sslConf (dict): il percorso del certificato e della chiave SSL.
+		:param serving (dict): il server HTTP da usare e la sua configurazione.
+		:param port (int, opzionale): la porta sulla quale avviare l'API.
+			Default: PORT (20291).
+		:param requests (int, opzionale): le richieste inviate con ogni metodo.
+			Default: REQUESTS (1000).
+		:param poolSize (int, opzionale): le connessioni mantenute aperte da RequestSubmitter.
+			Default: RequestSubmitter.POOL_SIZE (4).
+		"""
+		self.addr = 'https://{}:{}'.format(self.IP, port)
+		self.requests = requests
+		self.poolSize = poolSize
+		callbacks = {'add_butler': lambda mac, addr, user: True, 'butler_exists': lambda addr: True,
+			'update_db_details': lambda details: True}
+		self.api = ButlerAPI(self.IP, port, 20, sslConf, callbacks, serving)
+
+	def start(self):
+		"""
+		Avvia l'API, esegue le richieste con entrambi i metodi e ne mostra i risultati.
+		"""
+		urllib3.disable_warnings()
+		threading.Thread(target=self.api.start_api, daemon=True).start()
+		sleep(1)
+		headers = dict(RequestSubmitter.headers, **self.authenticate())
+		submitter = RequestSubmitter(self.addr, lambda: False, headers, self.poolSize)
+		print('Backend: {}, richieste: {}, connessioni nel pool: {}'.format(
+			self.api.serving['backend'], self.requests, self.poolSize))
+		methods = [
+			('requests.get', lambda: requests.get(self.addr + '/status', headers=headers, json={}, verify=False,
+				timeout=RequestSubmitter.REQUEST_TIMEOUT)),
+			('RequestSubmitter', lambda: submitter.request(RequestSubmitter.GET, self.addr + '/status'))]
+		for name, method in methods:
+			latencies, errors = self.run(method)
+			print('{:<18} p50 {:>6.1f} ms   p99 {:>6.1f} ms   totale {:>7.2f} s   errori {}'.format(
+				name, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000,
+				sum(latencies), errors))
+		submitter.close()
+
+	def authenticate(self):
+		"""
+		Si autentica presso l'API.
+
+		:return: gli header di autenticazione.
+		"""
+		resp = requests.post(self.addr + '/authenticate', verify=False,
+			json={'mac': self.USER, 'addr': self.USER, 'user': self.USER})
+		return {'token': resp.json()['token'], 'sub': self.USER}
+
+	def run(self, method):
+		"""
+		Invia le richieste una dopo l'altra con un metodo.
+
+		:param method (func): la funzione che invia una richiesta.
+
+		:return: la lista ordinata delle durate delle richieste e il numero di errori.
+		"""
+		latencies = []
+		errors = 0
+		for i in range(self.requests):
+			start = time()
+			try:
+				errors += method().status_code >= 300
+			except requests.exceptions.RequestException:
+				errors += 1
+			latencies.append(time() - start)
+		return sorted(latencies), errors
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'k', 'full': 'config', 'args': True, 'default': '.',
+			'help': 'Usa il file di configurazione dal percorso specificato.'},
+		{'short': 'b', 'full': 'backend', 'args': True, 'default': '',
+			'help': 'Il server HTTP da usare (werkzeug o cheroot).\nSe non specificato, viene usato quello della configurazione.'},
+		{'short': 'n', 'full': 'requests', 'args': True, 'default': PoolBench.REQUESTS,
+			'help': 'Il numero di richieste inviate con ogni metodo.'}]
+	args = ArgsParser(params, 'Misura le richieste con e senza il pool di connessioni persistenti.').parse()
+	configs = ConfigParser().load_configs(args['config'])
+	serving = dict(configs['serving'])
+	if args['backend'] != '':
+		serving['backend'] = args['backend']
+	PoolBench(configs['ssl'], serving, requests=int(args['requests']),
+		poolSize=configs['requests']['poolSize']).start()
@@ -0,0 +1,161 @@
+import threading
+from copy import deepcopy
+from time import time
+
+from common import log
+
+class PreviewRenderer():
+	"""
+	Questa classe aggiorna l'anteprima live delle notifiche da una sola thread.
+	Le richieste di aggiornamento ravvicinate vengono raggruppate e solo
+	l'ultima versione della notifica è mostrata.
+	La nuova versione è confrontata con quella in esecuzione: se cambiano solo
+	dei testi, vengono aggiornati i relativi elementi senza ricreare la finestra.
+	Ogni aggiornamento ne registra la durata, ritornata alla GUI.
+	"""
+
+	# attesa (in secondi) di altre modifiche prima di aggiornare l'anteprima
+	DEBOUNCE = 0.3
+	# attesa massima (in secondi) di un aggiornamento, anche con modifiche continue
+	MAX_DELAY = 1
+	# attesa massima (in secondi) della chiusura o comparsa della finestra
+	TIMEOUT = 5
+
+	# i campi che corrispondono ad un singolo elemento della finestra,
+	# con la chiave dell'elemento e l'opzione da aggiornare
+	ELEMENTS = {
+		('text', 'title'): ('-TEXT_TITLE-', 'value'),
+		('text', 'message'): ('-TEXT_MESSAGE-', 'value'),
+		('interactivity', 'buttonText'): ('-BUTTON_INPUT-', 'text'),
+	}
+	# i campi che non sono usati dall'anteprima
+	IGNORED = [('interactivity', 'timer'), ('interactivity', 'blocking')]
+	IGNORED_SECTIONS = ['script']
+
+	def __init__(self, builder, debounce=DEBOUNCE):
+		"""
+		Istanzia un oggetto PreviewRenderer e ne avvia la thread.
+
+		:param builder (NotificationBuilder): il generatore dell'anteprima, con la porta web.
+		:param debounce (float, opzionale): i secondi di attesa di altre modifiche.
+			Default: DEBOUNCE (0.3).
+		"""
+		self.builder = builder
+		self.debounce = debounce
+		self.condition = threading.Condition()
+		# ultima richiesta non ancora mostrata e richieste sostituite da essa
+		self.pending = None
+		self.submitted = 0
+		self.coalesced = 0
+		# notifica mostrata e thread della sua finestra
+		self.current = None
+		self.window = None
+		self.metrics = {'mode': '', 'renderTime': None, 'coalesced': 0, 'rendered': 0}
+		threading.Thread(target=self.run, daemon=True).start()
+
+	def submit(self, notifData):
+		"""
+		Richiede l'aggiornamento dell'anteprima senza attenderlo.
+
+		:param notifData (dict): i dati della notifica.
+
+		:return: i dati dell'ultimo aggiornamento completato.
+		"""
+		with self.condition:
+			if self.pending is not None:
+				self.coalesced += 1
+			self.pending = notifData
+			self.submitted = time()
+			self.condition.notify()
+		return dict(self.metrics)
+
+	def run(self):
+		"""
+		Attende le richieste e aggiorna l'anteprima, senza mai terminare.
+		"""
+		while True:
+			with self.condition:
+				while self.pending is None:
+					self.condition.wait()
+				# attende che le modifiche si fermino, ma non oltre MAX_DELAY
+				deadline = time() + self.MAX_DELAY
+				while time() < min(self.submitted + self.debounce, deadline):
+					self.condition.wait(min(self.submitted + self.debounce, deadline) - time())
+				notifData, coalesced = self.pending, self.coalesced
+				self.pending = None
+				self.coalesced = 0
+			try:
+				self.render(notifData, coalesced)
+			except Exception as e:
+				log.warning('Errore nell\'anteprima live: {}'.format(e.__str__()))
+				self.current = None
+				self.builder.stop()
+
+	def render(self, notifData, coalesced):
+		"""
+		Mostra una versione della notifica, aggiornando la finestra in esecuzione
+		se possibile e ricreandola altrimenti.
+
+		:param notifData (dict): i dati della notifica.
+		:param coalesced (int): il numero di richieste sostituite da questa.
+		"""
+		start = time()
+		updates = None
+		if self.current is not None and self.window is not None and self.window.is_alive() \
+				and self.builder.activeWindow:
+			updates = self.diff(self.current, notifData)
+
+		if updates == {}:
+			mode = 'skip'
+		elif updates is not None:
+			mode = 'update'
+			if not self.builder.update_elements(updates).wait(self.TIMEOUT):
+				log.warning('Aggiornamento dell\'anteprima non applicato entro {} secondi'.format(self.TIMEOUT))
+		else:
+			mode = 'rebuild'
+			self.builder.stop()
+			if self.window is not None:
+				self.window.join(self.TIMEOUT)
+			self.builder.displayed.clear()
+			# la finestra modifica i dati ricevuti, quindi ne riceve una copia
+			self.window = threading.Thread(target=self.builder.show_window,
+				args=[deepcopy(notifData)], kwargs={'received': start}, daemon=True)
+			self.window.start()
+			if not self.builder.displayed.wait(self.TIMEOUT):
+				log.warning('Anteprima non mostrata entro {} secondi'.format(self.TIMEOUT))
+		self.current = deepcopy(notifData)
+
+		renderTime = round((time() - start) * 1000)
+		self.metrics = {'mode': mode, 'renderTime': renderTime, 'coalesced': coalesced, 'rendered': time()}
+		log.info('Anteprima di "{}" aggiornata ({}) in {} ms, {} richieste raggruppate'.format(
+			notifData['name'], mode, renderTime, coalesced))
+
+	def diff(self, current, notifData):
+		"""
+		Confronta due versioni della notifica.
+
+		:param current (dict): la versione mostrata.
+		:param notifData (dict): la nuova versione.
+
+		:return: le opzioni da aggiornare per chiave dell'elemento (vuoto se non
+			cambia nulla), oppure None se la finestra va ricreata.
+		"""
+		updates = {}
+		for section in set(current) | set(notifData):
+			old = current[section] if section in current else None
+			new = notifData[section] if section in notifData else None
+			if old == new or section in self.IGNORED_SECTIONS:
+				continue
+			if type(old) != dict or type(new) != dict:
+				return None
+			for field in set(old) | set(new):
+				oldValue = old[field] if field in old else None
+				newValue = new[field] if field in new else None
+				if oldValue == newValue or (section, field) in self.IGNORED:
+					continue
+				# un elemento aggiunto o rimosso cambia la struttura della finestra
+				if (section, field) not in self.ELEMENTS or not oldValue or not newValue:
+					return None
+				key, option = self.ELEMENTS[(section, field)]
+				updates[key] = {option: newValue}
+		return updates
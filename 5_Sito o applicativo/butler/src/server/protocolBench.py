@@ -0,0 +1,97 @@
+import sys
+import random
+import socket
+from os.path import abspath, join
+from time import time
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+from common.argsParser import ArgsParser
+from client.behaviour import Behaviour
+from client.protocolResolver import ProtocolResolver
+
+class ProtocolBench():
+	"""
+	Questa classe misura la traduzione delle porte nei nomi dei protocolli:
+	con una chiamata a socket.getservbyport per ogni porta, come faceva
+	Behaviour.get_protocol, e con ProtocolResolver.
+	Le porte sono un misto di porte conosciute (dalla tabella dei servizi)
+	e di porte alte senza servizio, come quelle sorgenti di un host reale.
+	"""
+
+	LOOKUPS = 20000
+	KNOWN = 0.5
+	UNKNOWN_PORTS = 500
+	SEED = 1
+
+	def __init__(self, lookups=LOOKUPS, known=KNOWN, unknownPorts=UNKNOWN_PORTS, seed=SEED):
+		"""
+		Istanzia un oggetto ProtocolBench e genera le porte da tradurre.
+
+		:param lookups (int, opzionale): il numero di traduzioni per metodo.
+			Default: LOOKUPS (20000).
+		:param known (float, opzionale): la frazione di porte conosciute.
+			Default: KNOWN (0.5).
+		:param unknownPorts (int, opzionale): il numero di porte alte diverse senza servizio.
+				Oltre ProtocolResolver.CACHE_SIZE il resolver chiede ogni volta al sistema.
+			Default: UNKNOWN_PORTS (500).
+		:param seed (int, opzionale): il seme per la generazione delle porte.
+			Default: SEED (1).
+		"""
+		self.customProto = Behaviour.customProto
+		self.resolver = ProtocolResolver(self.customProto)
+		knownPorts = sorted(set(port for port, type in self.resolver.protocols))
+		rand = random.Random(seed)
+		unknown = rand.sample(range(49152, 65536), unknownPorts)
+		self.ports = [rand.choice(knownPorts) if rand.random() < known else rand.choice(unknown)
+			for i in range(lookups)]
+
+	def system_lookup(self, port, type=None):
+		"""
+		Traduce una porta chiedendola al sistema ad ogni chiamata,
+		come faceva Behaviour.get_protocol.
+
+		:param port (int): la porta da tradurre.
+		:param type (str, opzionale): il tipo specifico (tcp/udp), None per non passarlo.
+				Behaviour.get_protocol passava '' come tipo.
+			Default: None.
+
+		:return: il nome del protocollo.
+		"""
+		try:
+			return socket.getservbyport(port) if type is None else socket.getservbyport(port, type)
+		except Exception:
+			return self.customProto[port] if port in self.customProto else ProtocolResolver.UNKNOWN_PROTO
+
+	def start(self):
+		"""
+		Esegue le traduzioni con ogni metodo e ne mostra i risultati.
+		"""
+		methods = [
+			('getservbyport(port, \'\')', lambda port: self.system_lookup(port, '')),
+			('getservbyport(port)', self.system_lookup),
+			('ProtocolResolver', self.resolver.resolve)]
+		print('Traduzioni: {}, protocolli nella tabella: {}'.format(len(self.ports), len(self.resolver.protocols)))
+		for name, method in methods:
+			# il secondo passaggio trova le porte sconosciute già nella cache del resolver
+			for run in range(2):
+				start = time()
+				names = [method(port) for port in self.ports]
+				elapsed = time() - start
+				found = len([n for n in names if n != ProtocolResolver.UNKNOWN_PROTO])
+				print('{:<26} passaggio {}  {:>8.2f} us/traduzione   {:>6} porte tradotte'.format(
+					name, run + 1, elapsed / len(self.ports) * 1000000, found))
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'n', 'full': 'lookups', 'args': True, 'default': ProtocolBench.LOOKUPS,
+			'help': 'Il numero di traduzioni per metodo.'},
+		{'short': 'k', 'full': 'known', 'args': True, 'default': ProtocolBench.KNOWN,
+			'help': 'La frazione di porte conosciute (da 0 a 1).'},
+		{'short': 'u', 'full': 'unknown_ports', 'args': True, 'default': ProtocolBench.UNKNOWN_PORTS,
+			'help': 'Il numero di porte alte diverse senza servizio.'},
+		{'short': 's', 'full': 'seed', 'args': True, 'default': ProtocolBench.SEED,
+			'help': 'Il seme per la generazione delle porte.'}]
+	args = ArgsParser(params, 'Misura la traduzione delle porte nei nomi dei protocolli.').parse()
+	ProtocolBench(int(args['lookups']), float(args['known']), int(args['unknown_ports']),
+		int(args['seed'])).start()
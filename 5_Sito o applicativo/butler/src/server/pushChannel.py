@@ -0,0 +1,200 @@
+import asyncio
+import json
+import ssl
+from itertools import count
+
+from common import log
+
+class PushChannel():
+	"""
+	Questa classe mantiene un canale persistente verso ogni Butler che lo apre,
+	sul quale il server invia i comandi senza dover contattare il client.
+	I canali sono connessioni TLS aperte dai Butlers dopo l'autenticazione
+	e gestite tutte dallo stesso event loop asyncio.
+	I messaggi sono righe JSON: il server invia i comandi con un identificativo
+	e il Butler risponde con lo stesso identificativo, quindi più comandi
+	possono essere in corso contemporaneamente sullo stesso canale.
+
+	Il formato dei messaggi è:
+	{'token': '...', 'sub': '...', 'addr': '...'}       # apertura (Butler)
+	{'ok': True}                                       # apertura accettata (server)
+	{'id': 1, 'method': 'PUT', 'endpoint': '/notify',  # comando (server)
+		'headers': {...}, 'data': {...}}
+	{'id': 1, 'status': 200, 'body': {...}}            # risposta (Butler)
+	Le righe vuote sono inviate periodicamente per verificare la connessione.
+	"""
+
+	KEEP_ALIVE = 15
+	TIMEOUT = 10
+	HELLO_TIMEOUT = 5
+
+	def __init__(self, loop, ip, port, sslConf, verifyCallback, keepAlive=KEEP_ALIVE, timeout=TIMEOUT):
+		"""
+		Istanzia un oggetto PushChannel.
+
+		:param loop (asyncio.AbstractEventLoop): l'event loop, già avviato, che gestisce i canali.
+		:param ip (str): l'ip sul quale accettare i canali.
+		:param port (int): la porta sulla quale accettare i canali.
+		:param sslConf (tuple): il percorso del certificato e della chiave SSL.
+		:param verifyCallback (func): la funzione che verifica l'apertura di un canale,
+			dati token, sub, indirizzo del Butler e ip dal quale è stato aperto il canale.
+		:param keepAlive (int, opzionale): i secondi tra due verifiche della connessione.
+			Default: KEEP_ALIVE (15).
+		:param timeout (int, opzionale): i secondi di attesa della risposta ad un comando.
+			Default: TIMEOUT (10).
+		"""
+		self.loop = loop
+		self.ip = ip
+		self.port = port
+		self.sslConf = sslConf
+		self.verifyCallback = verifyCallback
+		self.keepAlive = keepAlive
+		self.timeout = timeout
+		# canali aperti, con l'ip che li ha aperti, e comandi in attesa di risposta,
+		# usati solo dall'event loop
+		self.channels = {}
+		self.peers = {}
+		self.pending = {}
+		self.ids = count(1)
+
+	def start(self):
+		"""
+		Avvia l'ascolto dei canali nell'event loop.
+		"""
+		context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+		context.load_cert_chain(*self.sslConf)
+		asyncio.run_coroutine_threadsafe(
+			asyncio.start_server(self.handle, self.ip, self.port, ssl=context), self.loop).result()
+		log.info('Canale per i Butlers avviato su {}:{}'.format(self.ip, self.port))
+
+	def is_open(self, addr):
+		"""
+		Verifica se un Butler ha un canale aperto.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+
+		:return: True se il canale è aperto.
+		"""
+		return addr in self.channels
+
+	async def handle(self, reader, writer):
+		"""
+		Gestisce un canale dall'apertura alla chiusura, leggendo le risposte del Butler.
+
+		:param reader (asyncio.StreamReader): il flusso in lettura.
+		:param writer (asyncio.StreamWriter): il flusso in scrittura.
+		"""
+		addr = None
+		keepAlive = None
+		try:
+			hello = json.loads(await asyncio.wait_for(reader.readline(), self.HELLO_TIMEOUT))
+			peer = writer.get_extra_info('peername')
+			ip = peer[0] if peer else ''
+			if not self.verifyCallback(hello['token'], hello['sub'], hello['addr'], ip):
+				log.warning('Apertura del canale rifiutata per {} da {}'.format(hello['addr'], ip))
+				return
+			# un canale già aperto può essere sostituito solo dallo stesso host che si riconnette
+			if hello['addr'] in self.channels and self.peers[hello['addr']] != ip:
+				log.warning('Canale di {} già aperto da un altro host ({})'.format(hello['addr'], ip))
+				return
+			addr = hello['addr']
+			if addr in self.channels:
+				self.channels[addr].close()
+			self.channels[addr] = writer
+			self.peers[addr] = ip
+			writer.write(b'{"ok": true}\n')
+			await writer.drain()
+			log.info('Canale aperto da {}'.format(addr))
+			keepAlive = asyncio.ensure_future(self.keep_alive(writer))
+
+			while True:
+				line = await reader.readline()
+				if line == b'':
+					break
+				if line.strip() == b'':
+					continue
+				reply = json.loads(line)
+				if reply['id'] in self.pending and not self.pending[reply['id']].done():
+					self.pending[reply['id']].set_result((reply['status'], reply['body']))
+		except (asyncio.TimeoutError, ValueError, KeyError) as e:
+			log.warning('Messaggio non valido sul canale di {}: {}'.format(addr, e.__str__()))
+		except (ConnectionError, ssl.SSLError) as e:
+			log.info('Canale di {} interrotto: {}'.format(addr, e.__str__()))
+		finally:
+			if keepAlive is not None:
+				keepAlive.cancel()
+			if addr is not None and addr in self.channels and self.channels[addr] is writer:
+				del self.channels[addr]
+				del self.peers[addr]
+				log.info('Canale di {} chiuso'.format(addr))
+			writer.close()
+
+	async def keep_alive(self, writer):
+		"""
+		Invia periodicamente una riga vuota, così che una connessione interrotta
+		venga rilevata anche se non ci sono comandi da inviare.
+
+		:param writer (asyncio.StreamWriter): il flusso in scrittura.
+		"""
+		try:
+			while not writer.is_closing():
+				await asyncio.sleep(self.keepAlive)
+				writer.write(b'\n')
+				await writer.drain()
+		except (ConnectionError, ssl.SSLError):
+			writer.close()
+
+	async def push(self, addr, method, endpoint, headers, data):
+		"""
+		Invia un comando sul canale di un Butler e ne attende la risposta.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param method (str): il metodo HTTP corrispondente.
+		:param endpoint (str): l'endpoint del Butler.
+		:param headers (dict): gli header con il token del server.
+		:param data (dict): i dati del comando.
+
+		:return: lo stato e il contenuto della risposta, oppure None se il comando
+			non è stato inviato perchè il canale non è aperto.
+		"""
+		if addr not in self.channels or self.channels[addr].is_closing():
+			return None
+		writer = self.channels[addr]
+		id = next(self.ids)
+		self.pending[id] = self.loop.create_future()
+		try:
+			try:
+				writer.write(json.dumps({'id': id, 'method': method, 'endpoint': endpoint,
+					'headers': headers, 'data': data}).encode('UTF-8') + b'\n')
+			except (ConnectionError, ssl.SSLError):
+				return None
+			try:
+				await writer.drain()
+			except (ConnectionError, ssl.SSLError) as e:
+				# il comando potrebbe essere già stato ricevuto: non va inviato di nuovo
+				raise ConnectionError('Canale di {} interrotto dopo l\'invio: {}'.format(addr, e.__str__()))
+			return await asyncio.wait_for(self.pending[id], self.timeout)
+		finally:
+			del self.pending[id]
+
+	def send(self, addr, method, endpoint, headers, data):
+		"""
+		Invia un comando sul canale di un Butler da un altro thread.
+		Solleva TimeoutError se il comando è stato inviato
+		ma la risposta non è arrivata in tempo, e ConnectionError se il canale
+		si è interrotto dopo l'invio.
+
+		:param addr (str): l'indirizzo IPv4 e la porta del Butler.
+		:param method (str): il metodo HTTP corrispondente.
+		:param endpoint (str): l'endpoint del Butler.
+		:param headers (dict): gli header con il token del server.
+		:param data (dict): i dati del comando.
+
+		:return: lo stato e il contenuto della risposta, oppure None se il comando
+			non è stato inviato.
+		"""
+		try:
+			return asyncio.run_coroutine_threadsafe(
+				self.push(addr, method, endpoint, dict(headers), data), self.loop).result()
+		except asyncio.TimeoutError:
+			raise TimeoutError('Nessuna risposta da {} entro {} secondi'.format(addr, self.timeout))
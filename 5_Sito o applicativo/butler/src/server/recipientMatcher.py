@@ -0,0 +1,43 @@
+import ipaddress
+from bisect import bisect_right
+
+class RecipientMatcher():
+	"""
+	Questa classe verifica rapidamente se degli indirizzi fanno parte
+	di una lista di destinatari.
+	Le reti della lista sono unite e compattate una sola volta in intervalli
+	di indirizzi (come numeri interi) ordinati e separati tra loro:
+	ogni verifica è quindi una ricerca binaria.
+	"""
+
+	def __init__(self, networks=[]):
+		"""
+		Istanzia un oggetto RecipientMatcher a partire da una lista di reti valide.
+
+		:param networks (list, opzionale): la lista degli IP e delle subnet,
+				già verificati con IPParser.sanitize_ips.
+			Default: [].
+		"""
+		collapsed = ipaddress.collapse_addresses(
+			[ipaddress.IPv4Network(n, strict=False) for n in networks])
+		self.starts = []
+		self.ends = []
+		for network in collapsed:
+			self.starts.append(int(network.network_address))
+			self.ends.append(int(network.broadcast_address))
+
+	def includes(self, ip):
+		"""
+		Controlla se un indirizzo fa parte dei destinatari.
+
+		:param ip (str): l'indirizzo IPv4 da verificare.
+
+		:return: True se l'indirizzo fa parte di una delle reti, altrimenti False.
+		"""
+		try:
+			value = int(ipaddress.IPv4Address(ip))
+		except ValueError:
+			return False
+		# l'unico intervallo candidato è l'ultimo che inizia prima dell'indirizzo
+		i = bisect_right(self.starts, value) - 1
+		return i >= 0 and value <= self.ends[i]
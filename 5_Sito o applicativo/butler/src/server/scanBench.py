@@ -0,0 +1,170 @@
+import sys
+import random
+from collections import namedtuple
+from os.path import abspath, join
+from time import sleep, time
+from types import SimpleNamespace
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+import psutil
+
+from common.argsParser import ArgsParser
+from client import behaviour
+
+class ScanBench():
+	"""
+	Questa classe misura la lettura delle connessioni attive di Behaviour:
+	scan_connections (una sola chiamata a net_connections) e scan_processes
+	(una chiamata a connections per ogni processo).
+	Il sistema è simulato sostituendo psutil nel modulo di Behaviour:
+	ogni chiamata al sistema è contata e dura SYSCALL secondi, così che
+	i risultati non dipendano dalla macchina. Con "real" viene usato psutil
+	reale e sono misurati solo i tempi.
+	"""
+
+	PROCESSES = 3000
+	WITH_SOCKETS = 200
+	SOCKETS = 8
+	SYSCALL = 0.00002
+	TICKS = 3
+	SEED = 1
+
+	def __init__(self, processes=PROCESSES, withSockets=WITH_SOCKETS, sockets=SOCKETS,
+		syscall=SYSCALL, ticks=TICKS, seed=SEED, real=False):
+		"""
+		Istanzia un oggetto ScanBench e genera il sistema simulato.
+
+		:param processes (int, opzionale): il numero di processi.
+			Default: PROCESSES (3000).
+		:param withSockets (int, opzionale): i processi con connessioni aperte.
+			Default: WITH_SOCKETS (200).
+		:param sockets (int, opzionale): le connessioni di ogni processo che ne ha.
+			Default: SOCKETS (8).
+		:param syscall (float, opzionale): la durata simulata di una chiamata al sistema.
+			Default: SYSCALL (0.00002).
+		:param ticks (int, opzionale): le letture consecutive misurate.
+			Default: TICKS (3).
+		:param seed (int, opzionale): il seme per la generazione dei dati.
+			Default: SEED (1).
+		:param real (bool, opzionale): True per usare psutil reale.
+			Default: False.
+		"""
+		self.syscall = syscall
+		self.ticks = ticks
+		self.real = real
+		self.calls = {}
+		rand = random.Random(seed)
+		addr = namedtuple('addr', ['ip', 'port'])
+		conn = namedtuple('conn', ['fd', 'family', 'type', 'laddr', 'raddr', 'status', 'pid'])
+		statuses = [psutil.CONN_ESTABLISHED] * 6 + [psutil.CONN_LISTEN, psutil.CONN_TIME_WAIT]
+		self.sockets = {}
+		for pid in rand.sample(range(1, processes + 1), withSockets):
+			self.sockets[pid] = []
+			for i in range(sockets):
+				status = rand.choice(statuses)
+				raddr = () if status == psutil.CONN_LISTEN else addr(
+					'10.0.{}.{}'.format(rand.randint(0, 255), rand.randint(1, 254)), rand.choice([443, 80, 53]))
+				self.sockets[pid].append(conn(-1, 2, 1, addr('192.168.1.23', rand.randint(1024, 65535)),
+					raddr, status, pid))
+		self.processes = processes
+
+	def syscall_done(self, name):
+		"""
+		Conta una chiamata al sistema simulato e ne attende la durata.
+
+		:param name (str): il nome della chiamata.
+		"""
+		self.calls[name] = self.calls[name] + 1 if name in self.calls else 1
+		sleep(self.syscall)
+
+	def fake_psutil(self):
+		"""
+		Crea il sostituto di psutil con le sole funzioni usate da Behaviour.
+
+		:return: il modulo simulato.
+		"""
+		def process(pid):
+			self.syscall_done('Process')
+			return SimpleNamespace(pid=pid, name=lambda: self.name(pid),
+				connections=lambda: self.connections(pid), info={'name': None})
+
+		def process_iter(attrs=[]):
+			for pid in range(1, self.processes + 1):
+				p = process(pid)
+				p.info['name'] = p.name()
+				yield p
+
+		def net_connections():
+			self.syscall_done('net_connections')
+			return [c for pid in self.sockets for c in self.sockets[pid]]
+
+		return SimpleNamespace(net_connections=net_connections, process_iter=process_iter, Process=process,
+			Error=psutil.Error, AccessDenied=psutil.AccessDenied)
+
+	def name(self, pid):
+		"""
+		Simula la lettura del nome di un processo.
+
+		:param pid (int): l'identificativo del processo.
+
+		:return: il nome del processo.
+		"""
+		self.syscall_done('name')
+		return 'process{}.exe'.format(pid)
+
+	def connections(self, pid):
+		"""
+		Simula la lettura delle connessioni di un processo.
+
+		:param pid (int): l'identificativo del processo.
+
+		:return: la lista delle connessioni.
+		"""
+		self.syscall_done('connections')
+		return self.sockets[pid] if pid in self.sockets else []
+
+	def start(self):
+		"""
+		Esegue le letture con entrambi i metodi e ne mostra i risultati.
+		"""
+		if not self.real:
+			behaviour.psutil = self.fake_psutil()
+			print('Sistema simulato: {} processi, {} con {} connessioni, {} us per chiamata'.format(
+				self.processes, len(self.sockets), len(next(iter(self.sockets.values()))), self.syscall * 1000000))
+		else:
+			print('psutil reale')
+		models = {}
+		for method in ['scan_processes', 'scan_connections']:
+			b = behaviour.Behaviour()
+			for tick in range(self.ticks):
+				self.calls = {}
+				start = time()
+				try:
+					data = getattr(b, method)()
+				except psutil.AccessDenied:
+					print('{:<17} privilegi insufficienti'.format(method))
+					break
+				elapsed = time() - start
+				calls = ', '.join('{} {}'.format(name, count) for name, count in sorted(self.calls.items()))
+				print('{:<17} lettura {}  {:>8.1f} ms  {:>6} connessioni  {}'.format(
+					method, tick + 1, elapsed * 1000, len(data), calls))
+				models[method] = sorted(str(dict(conn)) for conn in data)
+		if len(models) == 2 and not self.real:
+			print('Modelli uguali: {}'.format(models['scan_processes'] == models['scan_connections']))
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'p', 'full': 'processes', 'args': True, 'default': ScanBench.PROCESSES,
+			'help': 'Il numero di processi simulati.'},
+		{'short': 'w', 'full': 'with_sockets', 'args': True, 'default': ScanBench.WITH_SOCKETS,
+			'help': 'I processi simulati con connessioni aperte.'},
+		{'short': 'k', 'full': 'sockets', 'args': True, 'default': ScanBench.SOCKETS,
+			'help': 'Le connessioni di ogni processo che ne ha.'},
+		{'short': 't', 'full': 'ticks', 'args': True, 'default': ScanBench.TICKS,
+			'help': 'Le letture consecutive misurate.'},
+		{'short': 'r', 'full': 'real', 'args': False, 'default': False,
+			'help': 'Usa psutil reale al posto del sistema simulato.'}]
+	args = ArgsParser(params, 'Misura la lettura delle connessioni attive del Butler.').parse()
+	ScanBench(int(args['processes']), int(args['with_sockets']), int(args['sockets']),
+		ticks=int(args['ticks']), real=args['real']).start()
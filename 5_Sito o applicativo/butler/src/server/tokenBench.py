@@ -0,0 +1,116 @@
+import sys
+import datetime
+from os.path import abspath, join
+from time import time
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+from authlib.jose import jwt
+from Crypto.PublicKey import ECC
+
+from common.argsParser import ArgsParser
+from common.keyManager import KeyManager
+
+class TokenBench():
+	"""
+	Questa classe misura la firma e la verifica dei token JWT:
+	con una nuova coppia di chiavi P-256 per ogni token e la chiave pubblica
+	in formato PEM, come faceva BaseAPI.init_token, e con KeyManager.
+	La verifica con KeyManager è misurata sia la prima volta (firma
+	verificata) sia per i token già verificati.
+	"""
+
+	TOKENS = 500
+	EXPIRE_TIME = 20
+	ISSUER = '127.0.0.1'
+
+	def __init__(self, tokens=TOKENS):
+		"""
+		Istanzia un oggetto TokenBench.
+
+		:param tokens (int, opzionale): il numero di token firmati e verificati con ogni metodo.
+			Default: TOKENS (500).
+		"""
+		self.tokens = tokens
+		self.keyManager = KeyManager(self.EXPIRE_TIME)
+
+	def get_payload(self, i):
+		"""
+		Crea i dati di un token.
+
+		:param i (int): il numero del token.
+
+		:return: i dati del token.
+		"""
+		timeLimit = datetime.datetime.utcnow() + datetime.timedelta(minutes=self.EXPIRE_TIME)
+		return {'iss': self.ISSUER, 'sub': 'bench{}'.format(i), 'exp': timeLimit}
+
+	def get_options(self, i):
+		"""
+		Crea le opzioni di verifica di un token, come Authenticate.token_required.
+
+		:param i (int): il numero del token.
+
+		:return: le opzioni di verifica.
+		"""
+		return {'sub': {'essential': True, 'value': 'bench{}'.format(i)}}
+
+	def sign_new_key(self, i):
+		"""
+		Firma un token generando una nuova coppia di chiavi.
+
+		:param i (int): il numero del token.
+
+		:return: il token e la chiave pubblica in formato PEM.
+		"""
+		key = ECC.generate(curve=KeyManager.CURVE)
+		public = key.public_key().export_key(format='PEM')
+		token = jwt.encode({'alg': KeyManager.ALGORITHM}, self.get_payload(i), key.export_key(format='PEM'))
+		return token, public
+
+	def verify_pem(self, i, token, public):
+		"""
+		Verifica un token con la chiave pubblica in formato PEM.
+
+		:param i (int): il numero del token.
+		:param token (bytes): il token da verificare.
+		:param public (str): la chiave pubblica.
+		"""
+		claims = jwt.decode(token, public, claims_options=self.get_options(i))
+		claims.validate()
+
+	def measure(self, name, operation, items):
+		"""
+		Esegue un'operazione su ogni elemento e ne mostra la velocità.
+
+		:param name (str): il nome dell'operazione.
+		:param operation (func): l'operazione da eseguire.
+		:param items (list): gli elementi da passare all'operazione.
+
+		:return: i risultati dell'operazione.
+		"""
+		start = time()
+		results = [operation(*item) for item in items]
+		elapsed = time() - start
+		print('{:<40} {:>10.0f} token/s'.format(name, len(items) / elapsed))
+		return results
+
+	def start(self):
+		"""
+		Esegue la firma e la verifica con entrambi i metodi e ne mostra i risultati.
+		"""
+		print('Token: {}'.format(self.tokens))
+		numbers = [(i,) for i in range(self.tokens)]
+		pem = self.measure('firma, nuova chiave per token', self.sign_new_key, numbers)
+		signed = self.measure('firma, KeyManager', lambda i: self.keyManager.sign(self.get_payload(i)), numbers)
+		self.measure('verifica, chiave PEM', self.verify_pem, [(i,) + pem[i] for i in range(self.tokens)])
+		items = [(signed[i], self.get_options(i)) for i in range(self.tokens)]
+		self.measure('verifica, KeyManager (prima volta)', self.keyManager.verify, items)
+		self.measure('verifica, KeyManager (già verificati)', self.keyManager.verify, items)
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'n', 'full': 'tokens', 'args': True, 'default': TokenBench.TOKENS,
+			'help': 'Il numero di token firmati e verificati con ogni metodo.'}]
+	args = ArgsParser(params, 'Misura la firma e la verifica dei token JWT.').parse()
+	TokenBench(int(args['tokens'])).start()
@@ -0,0 +1,92 @@
+import sys
+import json
+import random
+from os.path import abspath, join
+sys.path.append(abspath(join(sys.path[0], '..')))
+
+from common.argsParser import ArgsParser
+from common.wireFormat import WireFormat
+
+class WireTest():
+	"""
+	Questa classe misura i byte inviati tra Butler e server per i dettagli
+	di un host, con e senza i formati compatti di WireFormat.
+	Il modello è generato con una distribuzione simile a quella di un host reale:
+	pochi processi, stati e protocolli, un solo indirizzo locale e
+	alcune centinaia di destinazioni.
+	"""
+
+	CONNECTIONS = 2000
+	SEED = 1
+	PROCESSES = 60
+	DESTINATIONS = 300
+	STATUSES = ['ESTABLISHED'] * 6 + ['LISTEN', 'TIME_WAIT', 'CLOSE_WAIT', 'NONE']
+	PORTS = [443, 443, 443, 80, 8080, 53, 5228]
+
+	def __init__(self, connections=CONNECTIONS, seed=SEED):
+		"""
+		Istanzia un oggetto WireTest e genera il modello.
+
+		:param connections (int, opzionale): il numero di connessioni del modello.
+			Default: CONNECTIONS (2000).
+		:param seed (int, opzionale): il seme per la generazione del modello.
+			Default: SEED (1).
+		"""
+		self.wireFormat = WireFormat()
+		rand = random.Random(seed)
+		processes = ['process{}.exe'.format(i) for i in range(self.PROCESSES)]
+		destinations = ['{}.{}.{}.{}'.format(rand.randint(1, 223), rand.randint(0, 255),
+			rand.randint(0, 255), rand.randint(1, 254)) for i in range(self.DESTINATIONS)]
+		self.model = []
+		for i in range(connections):
+			status = rand.choice(self.STATUSES)
+			self.model.append({'proc': rand.choice(processes), 'status': status,
+				'source': ['192.168.1.23', rand.randint(1024, 65535)],
+				'dest': ['', ''] if status in ['LISTEN', 'NONE'] else [rand.choice(destinations), rand.choice(self.PORTS)],
+				'proto': rand.choice(['tcp'] * 4 + ['udp']), 'safe': rand.random() < 0.9})
+
+	def start(self):
+		"""
+		Misura i byte di ogni formato e ne mostra i risultati.
+		"""
+		details = {'full': True, 'mac': '00:11:22:33:44:55', 'modules': {'inventory': False, 'behaviour': True},
+			'model': self.model, 'phase': 'learning', 'seq': 1}
+		packed = self.wireFormat.pack(details)
+		if self.wireFormat.unpack(packed) != details:
+			print('Errore: il modello per colonne non corrisponde a quello originale')
+			return
+
+		# i corpi come sono inviati: json di requests prima, JSON compatto dopo
+		formats = [
+			('JSON', json.dumps({'details': details}).encode('UTF-8'), False),
+			('JSON compatto', self.dumps({'details': details}), False),
+			('JSON gzip', self.dumps({'details': details}), True),
+			('colonne', self.dumps({'details': packed}), False),
+			('colonne gzip', self.dumps({'details': packed}), True),
+		]
+		print('Dettagli con {} connessioni'.format(len(self.model)))
+		base = len(formats[0][1])
+		for name, body, compress in formats:
+			if compress:
+				body = self.wireFormat.compress(body)[0]
+			print('{:<14} {:>9} byte   {:>6.1f}%'.format(name, len(body), len(body) / base * 100))
+
+	def dumps(self, data):
+		"""
+		Codifica i dati come RequestSubmitter con i formati compatti.
+
+		:param data (dict): i dati da codificare.
+
+		:return: i dati codificati.
+		"""
+		return json.dumps(data, separators=(',', ':')).encode('UTF-8')
+
+
+if __name__ == "__main__":
+	params = [
+		{'short': 'n', 'full': 'connections', 'args': True, 'default': WireTest.CONNECTIONS,
+			'help': 'Il numero di connessioni del modello.'},
+		{'short': 's', 'full': 'seed', 'args': True, 'default': WireTest.SEED,
+			'help': 'Il seme per la generazione del modello.'}]
+	args = ArgsParser(params, 'Misura i byte dei dettagli inviati tra Butler e server.').parse()
+	WireTest(int(args['connections']), int(args['seed'])).start()
@@ -0,0 +1,38 @@
+import sys
+import json
+import unittest
+from os.path import abspath, dirname, join
+sys.path.append(abspath(join(dirname(__file__), '..')))
+
+import requests
+
+from server.butlerController import ButlerController
+
+class ButlerControllerTest(unittest.TestCase):
+	"""
+	Verifica che ogni ButlerController mantenga i propri header di autenticazione.
+	"""
+
+	def authenticate(self, controller, token, addr):
+		"""
+		Autentica un controller simulando la risposta del Butler.
+		"""
+		response = requests.Response()
+		response.status_code = 200
+		response._content = json.dumps({'token': token, 'encodings': []}).encode('UTF-8')
+		controller.request = lambda method, url, data={}: response
+		self.assertTrue(controller.authenticate(addr, 'serverID'))
+
+	def test_headers_per_instance(self):
+		a = ButlerController('https://10.0.0.1:20219', lambda: True, '10.0.0.1:20219')
+		b = ButlerController('https://10.0.0.2:20219', lambda: True, '10.0.0.2:20219')
+		self.assertIsNot(a.headers, b.headers)
+		self.authenticate(a, 'tokenA', 'server:20210')
+		self.authenticate(b, 'tokenB', 'server:20210')
+		self.assertEqual(a.headers['token'], 'tokenA')
+		self.assertEqual(b.headers['token'], 'tokenB')
+		self.assertNotIn('token', ButlerController.headers)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,70 @@
+import sys
+import unittest
+from os.path import abspath, dirname, join
+sys.path.append(abspath(join(dirname(__file__), '..')))
+
+from hypothesis import given, settings, strategies as st
+
+from client.behaviour import Behaviour
+from client.connection import Connection
+
+# pochi valori per campo, così che le connessioni simili siano frequenti
+PROCS = st.sampled_from(['proc1.exe', 'proc2.exe'])
+IPS = st.sampled_from(['192.168.1.23', '8.8.8.8'])
+PORTS = st.sampled_from([443, 50000])
+SOURCES = st.tuples(IPS, PORTS).map(list)
+DESTS = st.one_of(st.just(['', '']), st.tuples(IPS, PORTS).map(list))
+CONNECTIONS = st.builds(lambda proc, source, dest, safe: {'proc': proc, 'status': 'ESTABLISHED',
+	'source': source, 'dest': dest, 'proto': 'tcp', 'safe': safe}, PROCS, SOURCES, DESTS, st.booleans())
+MODELS = st.lists(CONNECTIONS, max_size=40)
+
+class ConnectionIndexTest(unittest.TestCase):
+	"""
+	Verifica che l'unione e la deduplicazione del modello con ConnectionIndex
+	diano lo stesso risultato del confronto di ogni coppia con Behaviour.conn_match.
+	"""
+
+	def setUp(self):
+		self.behaviour = Behaviour()
+
+	def brute_remove_duplicates(self, model):
+		"""
+		Rimuove le connessioni simili confrontandole una ad una.
+		"""
+		cleanModel = []
+		for c in model:
+			if not any(self.behaviour.conn_match(clean, c) for clean in cleanModel):
+				cleanModel.append(Connection.from_dict(c))
+		return cleanModel
+
+	def brute_update_model(self, model, newData):
+		"""
+		Unisce due modelli confrontando ogni nuova connessione con quelle del modello.
+		"""
+		model = self.brute_remove_duplicates(model)
+		newModel = list(model)
+		for newConn in self.brute_remove_duplicates(newData):
+			matches = [i for i, conn in enumerate(model) if self.behaviour.conn_match(conn, newConn)]
+			if matches != []:
+				newModel[matches[0]] = newModel[matches[0]].with_safe(newConn.safe)
+			else:
+				newModel.append(newConn)
+		return newModel
+
+	@settings(max_examples=500, deadline=None)
+	@given(MODELS)
+	def test_remove_duplicates(self, model):
+		self.assertEqual([dict(c) for c in self.behaviour.remove_duplicates(model)],
+			[dict(c) for c in self.brute_remove_duplicates(model)])
+
+	@settings(max_examples=500, deadline=None)
+	@given(MODELS, MODELS)
+	def test_update_model(self, model, newData):
+		self.behaviour.model = tuple(Connection.from_dict(c) for c in model)
+		self.behaviour.update_model(newData)
+		self.assertEqual([dict(c) for c in self.behaviour.model],
+			[dict(c) for c in self.brute_update_model(model, newData)])
+
+
+if __name__ == '__main__':
+	unittest.main()